@@ -8,6 +8,7 @@ import cmdln
 from collections import namedtuple
 from collections import OrderedDict
 from osclib.cache import Cache
+from osclib.cache_stats import CacheStats
 from osclib.comments import CommentAPI
 from osclib.conf import Config
 from osclib.core import action_is_patchinfo
@@ -43,7 +44,11 @@ class PackageLookup(object):
 
     def get(self, project, package):
         if project not in self.lookup:
+            elapsed = CacheStats.timer()
             self.load(project)
+            CacheStats.record('package-lookup', project, misses=1, miss_seconds=elapsed())
+        else:
+            CacheStats.record('package-lookup', project, hits=1)
 
         return self.lookup[project].get(package, None)
 
@@ -982,6 +987,10 @@ class CommandLineInterface(cmdln.Cmdln):
             # tool run and not extended usage.
             memoize_session_reset()
 
+            # Catch up on project updates so the cache expires changed projects
+            # rather than relying on the snapshot taken at startup.
+            Cache.last_updated_refresh()
+
             # Reload checker to flush instance variables and thus any config
             # or caches they may contain.
             self.postoptparse()
@@ -1,8 +1,9 @@
 #!/usr/bin/python3
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from pprint import pformat
 from stat import S_ISREG, S_ISLNK
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 import cmdln
 import logging
 import os
@@ -10,6 +11,7 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 import abichecker_dbmodel as DB
 import sqlalchemy.orm.exc
@@ -19,6 +21,7 @@ from lxml import etree as ET
 import osc.conf
 import osc.core
 from osc.util.cpio import CpioRead
+from osclib.cpio import Cpio
 
 from urllib.error import HTTPError
 
@@ -27,6 +30,7 @@ from collections import namedtuple
 from osclib.comments import CommentAPI
 
 from abichecker_common import CACHEDIR
+from abichecker_cache import ABICache, RpmHeader
 
 import ReviewBot
 
@@ -59,8 +63,6 @@ ARCH_WHITELIST = {
         'SUSE:SLE-12:Update' :   ('i586', 'ppc64le', 's390', 's390x', 'x86_64'),
         }
 
-# Directory where download binary packages.
-DOWNLOADS = os.path.join(CACHEDIR, 'downloads')
 UNPACKDIR = os.path.join(CACHEDIR, 'unpacked')
 
 so_re = re.compile(r'^(?:/usr)?/lib(?:64)?/lib([^/]+)\.so(?:\.[^/]+)?')
@@ -147,12 +149,15 @@ class LogToDB(logging.Filter):
     def __init__(self, session):
         self.session = session
         self.request_id = None
+        # records may come from worker threads
+        self.lock = threading.Lock()
 
     def filter(self, record):
         if self.request_id is not None and record.levelno >= logging.INFO:
-            logentry = DB.Log(request_id = self.request_id, line = record.getMessage())
-            self.session.add(logentry)
-            self.session.commit()
+            with self.lock:
+                logentry = DB.Log(request_id = self.request_id, line = record.getMessage())
+                self.session.add(logentry)
+                self.session.commit()
         return True
 
 
@@ -166,8 +171,14 @@ class ABIChecker(ReviewBot.ReviewBot):
         self.no_review = False
         self.force = False
 
-        self.ts = rpm.TransactionSet()
-        self.ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
+        # number of extractions and abi tool runs done in parallel
+        self.jobs = 1
+
+        # rpm.TransactionSet is not thread safe so each thread gets its own
+        self.local = threading.local()
+
+        # rpm headers and downloaded rpms by header md5
+        self.cache = ABICache()
 
         # reports of source submission
         self.reports = []
@@ -298,115 +309,156 @@ class ABIChecker(ReviewBot.ReviewBot):
 
         missing_debuginfo  = []
 
-        for mr in myrepos:
-            try:
-                dst_libs, dst_libdebug = self.extract(dst_project, dst_package, dst_srcinfo, mr.dstrepo, mr.arch)
-                # nothing to fetch, so no libs
-                if dst_libs is None:
+        # repos are processed in sorted order so the reports stored by
+        # save_reports_to_db are the same no matter how work was scheduled
+        myrepos = sorted(myrepos)
+
+        # each tool run gets its own directory for the dumps and logs it writes
+        with TemporaryDirectory(prefix='abi-', dir=CACHEDIR) as workdir, \
+                ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            # extract all destination repos in parallel, then the source
+            # repos for which the destination has libraries.
+            start = time.time()
+            dst_extracted = self._extract_all(executor, dst_project, dst_package, dst_srcinfo,
+                    [(mr.dstrepo, mr.arch) for mr in myrepos])
+            repos = []
+            for mr in myrepos:
+                try:
+                    dst_libs, dst_libdebug = dst_extracted[(mr.dstrepo, mr.arch)].result()
+                    # nothing to fetch, so no libs
+                    if dst_libs is None:
+                        continue
+                except DistUrlMismatch as e:
+                    self.logger.error("%s/%s %s/%s: %s"%(dst_project, dst_package, mr.dstrepo, mr.arch, e))
+                    if ret == True: # need to check again
+                        ret = None
                     continue
-            except DistUrlMismatch as e:
-                self.logger.error("%s/%s %s/%s: %s"%(dst_project, dst_package, mr.dstrepo, mr.arch, e))
-                if ret == True: # need to check again
-                    ret = None
-                continue
-            except MissingDebugInfo as e:
-                missing_debuginfo.append(str(e))
-                ret = False
-                continue
-            except FetchError as e:
-                self.logger.error(e)
-                if ret == True: # need to check again
-                    ret = None
-                continue
-
-            try:
-                src_libs, src_libdebug = self.extract(src_project, src_package, src_srcinfo, mr.srcrepo, mr.arch)
-                if src_libs is None:
-                    if dst_libs:
-                        self.text_summary += "*Warning*: the submission does not contain any libs anymore\n\n"
+                except MissingDebugInfo as e:
+                    missing_debuginfo.append(str(e))
+                    ret = False
+                    continue
+                except FetchError as e:
+                    self.logger.error(e)
+                    if ret == True: # need to check again
+                        ret = None
+                    continue
+                repos.append((mr, dst_libs, dst_libdebug))
+
+            src_extracted = self._extract_all(executor, src_project, src_package, src_srcinfo,
+                    [(mr.srcrepo, mr.arch) for mr, _, _ in repos])
+            compare = []
+            for mr, dst_libs, dst_libdebug in repos:
+                try:
+                    src_libs, src_libdebug = src_extracted[(mr.srcrepo, mr.arch)].result()
+                    if src_libs is None:
+                        if dst_libs:
+                            self.text_summary += "*Warning*: the submission does not contain any libs anymore\n\n"
+                        continue
+                except DistUrlMismatch as e:
+                    self.logger.error("%s/%s %s/%s: %s"%(src_project, src_package, mr.srcrepo, mr.arch, e))
+                    if ret == True: # need to check again
+                        ret = None
+                    continue
+                except MissingDebugInfo as e:
+                    missing_debuginfo.append(str(e))
+                    ret = False
+                    continue
+                except FetchError as e:
+                    self.logger.error(e)
+                    if ret == True: # need to check again
+                        ret = None
                     continue
-            except DistUrlMismatch as e:
-                self.logger.error("%s/%s %s/%s: %s"%(src_project, src_package, mr.srcrepo, mr.arch, e))
-                if ret == True: # need to check again
-                    ret = None
-                continue
-            except MissingDebugInfo as e:
-                missing_debuginfo.append(str(e))
-                ret = False
-                continue
-            except FetchError as e:
-                self.logger.error(e)
-                if ret == True: # need to check again
-                    ret = None
-                continue
-
-            # create reverse index for aliases in the source project
-            src_aliases = dict()
-            for lib in src_libs.keys():
-                for a in src_libs[lib]:
-                    src_aliases.setdefault(a, set()).add(lib)
-
-            # for each library in the destination project check if the same lib
-            # exists in the source project. If not check the aliases (symlinks)
-            # to catch soname changes. Generate pairs of matching libraries.
-            pairs = set()
-            for lib in dst_libs.keys():
-                if lib in src_libs:
-                    pairs.add((lib, lib))
-                else:
-                    self.logger.debug("%s not found in submission, checking aliases", lib)
-                    found = False
-                    for a in dst_libs[lib]:
-                        if a in src_aliases:
-                            for l in src_aliases[a]:
-                                pairs.add((lib, l))
-                                found = True
-                    if found == False:
-                        self.text_summary += "*Warning*: %s no longer packaged\n\n"%lib
-
-            self.logger.debug("to diff: %s", pformat(pairs))
-
-            # for each pair dump and compare the abi
-            for old, new in pairs:
-                # abi dump of old lib
-                old_base = os.path.join(UNPACKDIR, dst_project, dst_package, mr.dstrepo, mr.arch)
-                old_dump = os.path.join(CACHEDIR, 'old.dump')
-                # abi dump of new lib
-                new_base = os.path.join(UNPACKDIR, src_project, src_package, mr.srcrepo, mr.arch)
-                new_dump = os.path.join(CACHEDIR, 'new.dump')
-
-                def cleanup():
-                    if os.path.exists(old_dump):
-                        os.unlink(old_dump)
-                    if os.path.exists(new_dump):
-                        os.unlink(new_dump)
-
-                cleanup()
 
+                # create reverse index for aliases in the source project
+                src_aliases = dict()
+                for lib in src_libs.keys():
+                    for a in src_libs[lib]:
+                        src_aliases.setdefault(a, set()).add(lib)
+
+                # for each library in the destination project check if the same lib
+                # exists in the source project. If not check the aliases (symlinks)
+                # to catch soname changes. Generate pairs of matching libraries.
+                pairs = set()
+                for lib in dst_libs.keys():
+                    if lib in src_libs:
+                        pairs.add((lib, lib))
+                    else:
+                        self.logger.debug("%s not found in submission, checking aliases", lib)
+                        found = False
+                        for a in dst_libs[lib]:
+                            if a in src_aliases:
+                                for l in src_aliases[a]:
+                                    pairs.add((lib, l))
+                                    found = True
+                        if found == False:
+                            self.text_summary += "*Warning*: %s no longer packaged\n\n"%lib
+
+                self.logger.debug("to diff: %s", pformat(pairs))
+
+                for old, new in sorted(pairs):
+                    compare.append((mr, old, new, dst_libdebug[old], src_libdebug[new]))
+            self.logger.info("extracted %d repos in %.1fs", len(dst_extracted) + len(src_extracted), time.time() - start)
+
+            # abi dump of each library to compare, old ones from the
+            # destination and new ones from the source project
+            start = time.time()
+            dumps = dict()
+            for mr, old, new, old_debug, new_debug in compare:
                 # we just need that to pass a name to abi checker
+                if not so_re.match(old):
+                    continue
+                for base, lib, debuglib in (
+                        (os.path.join(UNPACKDIR, dst_project, dst_package, mr.dstrepo, mr.arch), old, old_debug),
+                        (os.path.join(UNPACKDIR, src_project, src_package, mr.srcrepo, mr.arch), new, new_debug)):
+                    if (base, lib) not in dumps:
+                        jobdir = os.path.join(workdir, 'dump-%d'%len(dumps))
+                        os.mkdir(jobdir)
+                        dump = os.path.join(jobdir, 'abi.dump')
+                        dumps[(base, lib)] = (dump, executor.submit(self.run_abi_dumper, dump, base, lib, debuglib, jobdir))
+
+            # run abichecker as soon as both dumps of a pair are done
+            checks = []
+            for mr, old, new, old_debug, new_debug in compare:
                 m = so_re.match(old)
-                htmlreport = 'report-%s-%s-%s-%s-%s-%08x.html'%(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, int(time.time()))
-
-                # run abichecker
-                if m \
-                    and self.run_abi_dumper(old_dump, old_base, old, dst_libdebug[old]) \
-                    and self.run_abi_dumper(new_dump, new_base, new, src_libdebug[new]):
+                if m:
+                    old_dump, old_dumped = dumps[(os.path.join(UNPACKDIR, dst_project, dst_package, mr.dstrepo, mr.arch), old)]
+                    new_dump, new_dumped = dumps[(os.path.join(UNPACKDIR, src_project, src_package, mr.srcrepo, mr.arch), new)]
+                    if old_dumped.result() and new_dumped.result():
+                        htmlreport = 'report-%s-%s-%s-%s-%s-%08x.html'%(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, int(time.time()))
                         reportfn = os.path.join(CACHEDIR, htmlreport)
-                        r = self.run_abi_checker(m.group(1), old_dump, new_dump, reportfn)
-                        if r is not None:
-                            self.logger.debug('report saved to %s, compatible: %d', reportfn, r)
-                            libresults.append(LibResult(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, htmlreport, r))
-                            if overall is None:
-                                overall = r
-                            elif overall == True and r == False:
-                                overall = r
+                        jobdir = os.path.join(workdir, 'check-%d'%len(checks))
+                        os.mkdir(jobdir)
+                        checks.append((mr, old, new, htmlreport, executor.submit(self.run_abi_checker, m.group(1), old_dump, new_dump, reportfn, jobdir)))
+                        continue
+                checks.append((mr, old, new, None, None))
+            # the loop above does not wait for the new dump of pairs whose old
+            # dump failed, so wait for all of them to time the dump stage
+            wait([dumped for _, dumped in dumps.values()])
+            self.logger.info("dumped %d libraries in %.1fs", len(dumps), time.time() - start)
+
+            # checks already started while dumping, this is the time spent
+            # waiting for them once all dumps are done
+            start = time.time()
+            for mr, old, new, htmlreport, checked in checks:
+                if checked is not None:
+                    r = checked.result()
+                    if r is not None:
+                        self.logger.debug('report saved to %s, compatible: %d', os.path.join(CACHEDIR, htmlreport), r)
+                        libresults.append(LibResult(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, htmlreport, r))
+                        if overall is None:
+                            overall = r
+                        elif overall == True and r == False:
+                            overall = r
                 else:
                     self.logger.error('failed to compare %s <> %s'%(old,new))
                     self.text_summary += "**Error**: ABI check failed on %s vs %s\n\n"%(old, new)
                     if ret == True: # need to check again
                         ret = None
+            self.logger.info("checked %d library pairs in %.1fs", len(checks), time.time() - start)
 
-                cleanup()
+        # only now that no extraction is running the downloaded rpms may be
+        # pruned
+        self.cache.prune()
 
         if missing_debuginfo:
             self.text_summary += 'debug information is missing for the following packages, can\'t check:\n<pre>'
@@ -648,7 +700,7 @@ class ABIChecker(ReviewBot.ReviewBot):
             #self.commentapi.delete_from_where_user(self.review_user, request_id = req.reqid)
             self.commentapi.add_comment(request_id = req.reqid, comment = msg)
 
-    def run_abi_checker(self, libname, old, new, output):
+    def run_abi_checker(self, libname, old, new, output, cwd=CACHEDIR):
         cmd = ['abi-compliance-checker',
                 '-lib', libname,
                 '-old', old,
@@ -656,27 +708,40 @@ class ABIChecker(ReviewBot.ReviewBot):
                 '-report-path', output
                 ]
         self.logger.debug(cmd)
-        r = subprocess.Popen(cmd, close_fds=True, cwd=CACHEDIR).wait()
+        start = time.time()
+        r = subprocess.Popen(cmd, close_fds=True, cwd=cwd).wait()
+        self.logger.debug("abi-compliance-checker %s took %.1fs", libname, time.time() - start)
         if r not in (0, 1):
             self.logger.error('abi-compliance-checker failed')
             # XXX: record error
             return None
         return r == 0
 
-    def run_abi_dumper(self, output, base, filename, debuglib):
+    def run_abi_dumper(self, output, base, filename, debuglib, cwd=CACHEDIR):
         cmd = ['abi-dumper',
                 '-o', output,
                 '-lver', os.path.basename(filename),
                 '/'.join([base, filename])]
         cmd.append('/'.join([base, debuglib]))
         self.logger.debug(cmd)
-        r = subprocess.Popen(cmd, close_fds=True, cwd=CACHEDIR).wait()
+        start = time.time()
+        r = subprocess.Popen(cmd, close_fds=True, cwd=cwd).wait()
+        self.logger.debug("abi-dumper %s took %.1fs", filename, time.time() - start)
         if r != 0:
             self.logger.error("failed to dump %s!"%filename)
             # XXX: record error
             return False
         return True
 
+    def _extract_all(self, executor, project, package, srcinfo, repos):
+        """ submit extract() of each (repo, arch) once and return a dict of
+        (repo, arch): future """
+        extracted = dict()
+        for repo, arch in repos:
+            if (repo, arch) not in extracted:
+                extracted[(repo, arch)] = executor.submit(self.extract, project, package, srcinfo, repo, arch)
+        return extracted
+
     def extract(self, project, package, srcinfo, repo, arch):
             # fetch cpio headers
             # check file lists for library packages
@@ -687,10 +752,6 @@ class ABIChecker(ReviewBot.ReviewBot):
                 self.logger.info(msg)
                 return None, None
 
-            # mtimes in cpio are not the original ones, so we need to fetch
-            # that separately :-(
-            mtimes= self._getmtimes(project, package, repo, arch)
-
             self.logger.debug("fetchlist %s", pformat(fetchlist))
             self.logger.debug("liblist %s", pformat(liblist))
             self.logger.debug("debuglist %s", pformat(debuglist))
@@ -698,69 +759,87 @@ class ABIChecker(ReviewBot.ReviewBot):
             debugfiles = debuglist.values()
 
             # fetch binary rpms
-            downloaded = self.download_files(project, package, repo, arch, fetchlist, mtimes)
+            downloaded = self.download_files(project, package, repo, arch, fetchlist)
 
             # extract binary rpms
-            tmpfile = os.path.join(CACHEDIR, "cpio")
+            base = os.path.join(UNPACKDIR, project, package, repo, arch)
+            wanted = set(liblist.keys()) | set(debugfiles)
             for fn in fetchlist:
                 self.logger.debug("extract %s"%fn)
-                with open(tmpfile, 'wb') as tmpfd:
-                    if fn not in downloaded:
-                        raise FetchError("%s was not downloaded!"%fn)
-                    self.logger.debug(downloaded[fn])
-                    r = subprocess.call(['rpm2cpio', downloaded[fn]], stdout=tmpfd, close_fds=True)
-                    if r != 0:
-                        raise FetchError("failed to extract %s!"%fn)
-                    tmpfd.close()
-                    os.unlink(downloaded[fn])
-                    cpio = CpioRead(tmpfile)
-                    cpio.read()
-                    for ch in cpio:
-                        fn = ch.filename.decode('utf-8')
-                        if fn.startswith('./'): # rpm payload is relative
-                            fn = fn[1:]
-                        self.logger.debug("cpio fn %s", fn)
-                        if fn not in liblist and fn not in debugfiles:
-                            continue
-                        dst = os.path.join(UNPACKDIR, project, package, repo, arch)
-                        dst += fn
-                        if not os.path.exists(os.path.dirname(dst)):
-                            os.makedirs(os.path.dirname(dst))
-                        self.logger.debug("dst %s", dst)
-                        # the filehandle in the cpio archive is private so
-                        # open it again
-                        with open(tmpfile, 'rb') as cpiofh:
-                            cpiofh.seek(ch.dataoff, os.SEEK_SET)
-                            with open(dst, 'wb') as fh:
-                                while True:
-                                    buf = cpiofh.read(4096)
-                                    if buf is None or buf == b'':
-                                        break
-                                    fh.write(buf)
-            os.unlink(tmpfile)
+                if fn not in downloaded:
+                    raise FetchError("%s was not downloaded!"%fn)
+                self.logger.debug(downloaded[fn])
+                self.extract_rpm(fn, downloaded[fn], base, wanted)
 
             return liblist, debuglist
 
-    def download_files(self, project, package, repo, arch, filenames, mtimes):
+    def extract_rpm(self, fn, path, base, wanted):
+        """ stream the payload of the rpm at path from rpm2cpio and write
+        the files in wanted below base, skipping all others """
+        p = subprocess.Popen(['rpm2cpio', path], stdout=subprocess.PIPE, bufsize=0, close_fds=True)
+        truncated = False
+        try:
+            for ch in Cpio(p.stdout):
+                name = ch.name
+                if name.startswith('./'): # rpm payload is relative
+                    name = name[1:]
+                self.logger.debug("cpio fn %s", name)
+                if name not in wanted:
+                    continue
+                dst = base + name
+                if not os.path.exists(os.path.dirname(dst)):
+                    os.makedirs(os.path.dirname(dst))
+                self.logger.debug("dst %s", dst)
+                with open(dst, 'wb') as fh:
+                    ch.copy(fh)
+            # consume the padding after the trailer so rpm2cpio can finish
+            p.stdout.read()
+        except EOFError:
+            truncated = True
+        finally:
+            p.stdout.close()
+            r = p.wait()
+        if r != 0 or truncated:
+            raise FetchError("failed to extract %s!"%fn)
+
+    def download_files(self, project, package, repo, arch, fetchlist):
+        """ returns a dict of filename: path of the rpm in the cache,
+        downloading the ones not cached yet """
         downloaded = dict()
-        for fn in filenames:
+        mtimes = None
+        for fn, hdrmd5 in fetchlist.items():
+            t = self.cache.rpm_get(hdrmd5)
+            if t is not None:
+                self.logger.debug("using cached %s", fn)
+                downloaded[fn] = t
+                continue
+            if mtimes is None:
+                # mtimes in cpio are not the original ones, so we need to fetch
+                # that separately :-(
+                mtimes = self._getmtimes(project, package, repo, arch) or dict()
             if fn not in mtimes:
                 raise FetchError("missing mtime information for %s, can't check"% fn)
-            repodir = os.path.join(DOWNLOADS, package, project, repo)
-            if not os.path.exists(repodir):
-                os.makedirs(repodir)
-            t = os.path.join(repodir, fn)
+            t = self.cache.rpm_temporary(hdrmd5)
             self._get_binary_file(project, repo, arch, package, fn, t, mtimes[fn])
-            downloaded[fn] = t
+            downloaded[fn] = self.cache.rpm_put(hdrmd5, t)
         return downloaded
 
     def _get_binary_file(self, project, repository, arch, package, filename, target, mtime):
         """Get a binary file from OBS."""
-        # Used to cache, but dropped as part of python3 migration.
+        # Cached by download_files() using the header md5.
         osc.core.get_binary_file(self.apiurl, project, repository, arch,
                                  filename, package=package,
                                  target_filename=target)
 
+    @property
+    def ts(self):
+        ts = getattr(self.local, 'ts', None)
+        if ts is None:
+            ts = rpm.TransactionSet()
+            ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
+            self.local.ts = ts
+        return ts
+
     def readRpmHeaderFD(self, fd):
         h = None
         try:
@@ -775,7 +854,43 @@ class ABIChecker(ReviewBot.ReviewBot):
             h = None
         return h
 
+    @staticmethod
+    def _rpmheader(h):
+        """ extract the fields needed from an rpm header """
+        def s(value):
+            # rpm < 4.16 returns bytes
+            if isinstance(value, bytes):
+                return value.decode('utf-8')
+            return value
+
+        files = [(s(fn), mode, s(lnk)) for fn, mode, lnk in zip(h['filenames'], h['filemodes'], h['filelinktos'])]
+        return RpmHeader(s(h['name']), s(h['arch']), s(h['version']), s(h['release']),
+                         bool(h['sourcepackage']), s(h['disturl']), files)
+
+    def _binaryversions(self, project, package, repo, arch):
+        """ returns a dict of rpm filename: header md5 """
+        url = osc.core.makeurl(self.apiurl, ('build', project, repo, arch, package), { 'view': 'binaryversions' })
+        try:
+            root = ET.parse(osc.core.http_GET(url)).getroot()
+        except HTTPError as e:
+            raise FetchError('failed to fetch binary versions: %s'%e)
+
+        return dict([(node.get('name'), node.get('hdrmd5')) for node in root.findall('binary')
+                     if node.get('name').endswith('.rpm') and node.get('hdrmd5')])
+
     def _fetchcpioheaders(self, project, package, repo, arch):
+        """ returns a list of (rpm filename, header md5, RpmHeader). The
+        headers are only fetched if any binary is not in the cache """
+        headers = []
+        for fn, hdrmd5 in sorted(self._binaryversions(project, package, repo, arch).items()):
+            h = self.cache.header_get(hdrmd5)
+            if h is None:
+                break
+            headers.append((fn, hdrmd5, h))
+        else:
+            self.logger.debug("using cached headers for %s/%s %s/%s", project, package, repo, arch)
+            return headers
+
         u = osc.core.makeurl(self.apiurl, [ 'build', project, repo, arch, package ],
             [ 'view=cpioheaders' ])
         try:
@@ -786,24 +901,30 @@ class ABIChecker(ReviewBot.ReviewBot):
         for chunk in r:
             tmpfile.write(chunk)
         tmpfile.close()
-        cpio = CpioRead(tmpfile.name)
-        cpio.read()
-        rpm_re = re.compile('(.+\.rpm)-[0-9A-Fa-f]{32}$')
-        for ch in cpio:
-            # ignore errors
-            if ch.filename == '.errors':
-                continue
-            # the filehandle in the cpio archive is private so
-            # open it again
-            with open(tmpfile.name, 'rb') as fh:
-                fh.seek(ch.dataoff, os.SEEK_SET)
-                h = self.readRpmHeaderFD(fh)
-                if h is None:
-                    raise FetchError("failed to read rpm header for %s"%ch.filename)
-                m = rpm_re.match(ch.filename.decode('utf-8'))
-                if m:
-                    yield m.group(1), h
-        os.unlink(tmpfile.name)
+        headers = []
+        try:
+            cpio = CpioRead(tmpfile.name)
+            cpio.read()
+            rpm_re = re.compile('(.+\.rpm)-([0-9A-Fa-f]{32})$')
+            for ch in cpio:
+                # ignore errors
+                if ch.filename == '.errors':
+                    continue
+                # the filehandle in the cpio archive is private so
+                # open it again
+                with open(tmpfile.name, 'rb') as fh:
+                    fh.seek(ch.dataoff, os.SEEK_SET)
+                    h = self.readRpmHeaderFD(fh)
+                    if h is None:
+                        raise FetchError("failed to read rpm header for %s"%ch.filename)
+                    m = rpm_re.match(ch.filename.decode('utf-8'))
+                    if m:
+                        h = self._rpmheader(h)
+                        self.cache.header_put(m.group(2), h)
+                        headers.append((m.group(1), m.group(2), h))
+        finally:
+            os.unlink(tmpfile.name)
+        return headers
 
     def _getmtimes(self, prj, pkg, repo, arch):
         """ returns a dict of filename: mtime """
@@ -979,42 +1100,45 @@ class ABIChecker(ReviewBot.ReviewBot):
     # belongs to that md5.
     def disturl_matches(self, disturl, prj, srcinfo):
         md5 = self._md5_disturl(disturl)
-        info = self.get_sourceinfo(prj, srcinfo.package, rev = md5)
-        self.logger.debug(pformat(srcinfo))
-        self.logger.debug(pformat(info))
-        if info.verifymd5 == srcinfo.verifymd5:
+        verifymd5 = self.cache.verifymd5_get(prj, srcinfo.package, md5)
+        if verifymd5 is None:
+            info = self.get_sourceinfo(prj, srcinfo.package, rev = md5)
+            self.logger.debug(pformat(srcinfo))
+            self.logger.debug(pformat(info))
+            verifymd5 = info.verifymd5
+            self.cache.verifymd5_put(prj, srcinfo.package, md5, verifymd5)
+        if verifymd5 == srcinfo.verifymd5:
             return True
         return False
 
     def compute_fetchlist(self, prj, pkg, srcinfo, repo, arch):
         """ scan binary rpms of the specified repo for libraries.
-        Returns a set of packages to fetch and the libraries found
+        Returns a dict of packages to fetch with their header md5 and the
+        libraries found
         """
         self.logger.debug('scanning %s/%s %s/%s'%(prj, pkg, repo, arch))
 
         headers = self._fetchcpioheaders(prj, pkg, repo, arch)
         missing_debuginfo = set()
         lib_packages = dict() # pkgname -> set(lib file names)
-        pkgs = dict() # pkgname -> cpiohdr, rpmhdr
+        pkgs = dict() # pkgname -> rpm filename, header md5, rpmhdr
         lib_aliases = dict()
-        for rpmfn, h in headers:
+        for rpmfn, hdrmd5, h in headers:
             # skip src rpm
-            if h['sourcepackage']:
+            if h.sourcepackage:
                 continue
-            pkgname = h['name'].decode('utf-8')
+            pkgname = h.name
             if pkgname.endswith('-32bit') or pkgname.endswith('-64bit'):
                 # -32bit and -64bit packages are just repackaged, so
                 # we skip them and only check the original one.
                 continue
             self.logger.debug("inspecting %s", pkgname)
-            if not self.disturl_matches(h['disturl'].decode('utf-8'), prj, srcinfo):
-                raise DistUrlMismatch(h['disturl'].decode('utf-8'), srcinfo)
-            pkgs[pkgname] = (rpmfn, h)
+            if not self.disturl_matches(h.disturl, prj, srcinfo):
+                raise DistUrlMismatch(h.disturl, srcinfo)
+            pkgs[pkgname] = (rpmfn, hdrmd5, h)
             if debugpkg_re.match(pkgname):
                 continue
-            for fn, mode, lnk in zip(h['filenames'], h['filemodes'], h['filelinktos']):
-                fn = fn.decode('utf-8')
-                lnk = lnk.decode('utf-8')
+            for fn, mode, lnk in h.files:
                 if so_re.match(fn):
                     if S_ISREG(mode):
                         self.logger.debug('found lib: %s'%fn)
@@ -1025,7 +1149,7 @@ class ABIChecker(ReviewBot.ReviewBot):
                         self.logger.debug('found alias: %s -> %s'%(alias, libname))
                         lib_aliases.setdefault(libname, set()).add(alias)
 
-        fetchlist = set()
+        fetchlist = dict()
         liblist = dict()
         debuglist = dict()
         # check whether debug info exists for each lib
@@ -1036,8 +1160,8 @@ class ABIChecker(ReviewBot.ReviewBot):
                 continue
 
             # check file list of debuginfo package
-            rpmfn, h = pkgs[dpkgname]
-            files = set ([f.decode('utf-8') for f in h['filenames']])
+            rpmfn, hdrmd5, h = pkgs[dpkgname]
+            files = set([f[0] for f in h.files])
             ok = True
             for lib in lib_packages[pkgname]:
                 libdebug = '/usr/lib/debug%s.debug'%lib
@@ -1048,18 +1172,18 @@ class ABIChecker(ReviewBot.ReviewBot):
                     # differ. BROKEN RIGHT NOW
                     # XXX: would have to actually read debuglink
                     # info to get that right so just guessing
-                    arch = h['arch'].decode('utf-8')
+                    arch = h.arch
                     if arch == 'i586':
                         arch = 'i386'
                     libdebug = '/usr/lib/debug%s-%s-%s.%s.debug'%(lib,
-                            h['version'].decode('utf-8'), h['release'].decode('utf-8'), arch)
+                            h.version, h.release, arch)
                     if libdebug not in files:
                         missing_debuginfo.add((prj, pkg, repo, arch, pkgname, lib))
                         ok = False
 
                 if ok:
-                    fetchlist.add(pkgs[pkgname][0])
-                    fetchlist.add(rpmfn)
+                    fetchlist[pkgs[pkgname][0]] = pkgs[pkgname][1]
+                    fetchlist[rpmfn] = hdrmd5
                     liblist.setdefault(lib, set())
                     debuglist.setdefault(lib, libdebug)
                     libname = os.path.basename(lib)
@@ -1083,6 +1207,8 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
         parser.add_option("--force", action="store_true", help="recheck requests that are already considered done")
         parser.add_option("--no-review", action="store_true", help="don't actually accept or decline, just comment")
         parser.add_option("--web-url", metavar="URL", help="URL of web service")
+        parser.add_option("--cache-size", metavar="MiB", type="int", help="size limit of downloaded rpm cache")
+        parser.add_option("--jobs", metavar="N", type="int", default=1, help="number of extractions and abi tool runs done in parallel")
         return parser
 
     def postoptparse(self):
@@ -1093,6 +1219,9 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
         else:
             self.optparser.error("must specify --web-url")
             ret = False
+        if self.options.jobs < 1:
+            self.optparser.error("--jobs must be at least 1")
+            ret = False
         return ret
 
     def setup_checker(self):
@@ -1102,6 +1231,9 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
             bot.no_review = True
         if self.options.force:
             bot.force = True
+        bot.jobs = self.options.jobs
+        if self.options.cache_size is not None:
+            bot.cache = ABICache(rpm_limit = self.options.cache_size * 1024 * 1024)
 
         return bot
 
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+from abichecker_common import CACHEDIR
+
+# Directory of the persistent rpm header and binary rpm cache.
+STOREDIR = os.path.join(CACHEDIR, 'store')
+
+# default size limits in bytes
+HEADER_LIMIT = 256 * 1024 * 1024
+RPM_LIMIT = 4 * 1024 * 1024 * 1024
+
+# fields of a binary rpm header needed to find libraries and debug info. files
+# is a list of (filename, mode, link target) tuples.
+RpmHeader = namedtuple('RpmHeader', ('name', 'arch', 'version', 'release', 'sourcepackage', 'disturl', 'files'))
+
+
+class LRUStore(object):
+    """ directory of files named by a content key (ie. md5)
+
+    Entries are touched when used so the least recently used ones are removed
+    first when pruning the store down to its size limit.
+    """
+
+    def __init__(self, directory, limit):
+        self.directory = directory
+        self.limit = limit
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def temporary(self, key):
+        """ path to write an entry to before moving it into the store """
+        return os.path.join(self.directory, '.tmp-%d-%d-%s'%(os.getpid(), threading.get_ident(), key))
+
+    def get(self, key):
+        """ returns the path of the entry or None """
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, source):
+        """ moves file source into the store and returns its path """
+        path = self.path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source, path)
+        return path
+
+    def entries(self):
+        for directory, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.startswith('.tmp-'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def prune(self):
+        """ removes least recently used entries until the store fits the limit """
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= self.limit:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed += 1
+        return removed
+
+
+class ABICache(object):
+    """ persistent content addressed cache of rpm headers and binary rpms
+
+    Both are keyed by the header md5 which OBS reports for each binary so
+    unchanged packages neither need their headers fetched and parsed nor the
+    rpms downloaded again. The verifymd5 of the sources a disturl refers to is
+    kept as well since it never changes.
+    """
+
+    def __init__(self, directory=STOREDIR, header_limit=HEADER_LIMIT, rpm_limit=RPM_LIMIT):
+        self.headers = LRUStore(os.path.join(directory, 'headers'), header_limit)
+        self.rpms = LRUStore(os.path.join(directory, 'rpms'), rpm_limit)
+        self.sources = LRUStore(os.path.join(directory, 'sources'), header_limit)
+
+    def _load(self, store, key):
+        path = store.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            # corrupt entry, fetch again
+            os.unlink(path)
+            return None
+
+    def _save(self, store, key, value):
+        tmp = store.temporary(key)
+        with open(tmp, 'w') as f:
+            json.dump(value, f)
+        store.put(key, tmp)
+
+    def header_get(self, hdrmd5):
+        value = self._load(self.headers, hdrmd5)
+        if value is None:
+            return None
+        value['files'] = [tuple(f) for f in value['files']]
+        return RpmHeader(**value)
+
+    def header_put(self, hdrmd5, header):
+        self._save(self.headers, hdrmd5, header._asdict())
+
+    def rpm_get(self, hdrmd5):
+        """ returns path of the cached rpm or None """
+        return self.rpms.get(hdrmd5)
+
+    def rpm_temporary(self, hdrmd5):
+        return self.rpms.temporary(hdrmd5)
+
+    def rpm_put(self, hdrmd5, source):
+        return self.rpms.put(hdrmd5, source)
+
+    def _source_key(self, project, package, srcmd5):
+        return '%s-%s'%(srcmd5, '_'.join((project, package)).replace('/', '_'))
+
+    def verifymd5_get(self, project, package, srcmd5):
+        return self._load(self.sources, self._source_key(project, package, srcmd5))
+
+    def verifymd5_put(self, project, package, srcmd5, verifymd5):
+        self._save(self.sources, self._source_key(project, package, srcmd5), verifymd5)
+
+    def prune(self):
+        for store in (self.headers, self.rpms, self.sources):
+            store.prune()
@@ -1,14 +1,23 @@
 #!/usr/bin/python3
 
 import argparse
+from bisect import bisect_right
 from collections import namedtuple
 from datetime import datetime
 from dateutil.parser import parse as date_parse
 from influxdb import InfluxDBClient
 from lxml import etree as ET
+import hashlib
+import heapq
+import json
+import marshal
+from operator import itemgetter
 import os
+import pickle
+import struct
 import subprocess
 import sys
+import tempfile
 import yaml
 
 import metrics_release
@@ -16,14 +25,28 @@ import osc.conf
 import osc.core
 from osc.core import HTTPError
 from osc.core import get_commitlog
+from osc.core import http_GET
+from osc.core import makeurl
 import osclib.conf
 from osclib.cache import Cache
+from osclib.cache_manager import CacheManager
 from osclib.conf import Config
 from osclib.core import project_pseudometa_package
+from osclib.core import source_file_load
 from osclib.stagingapi import StagingAPI
 
 SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
+# delta points of ingested requests for incremental ingest
+REQUESTS_STATE_VERSION = 2
 Point = namedtuple('Point', ['measurement', 'tags', 'fields', 'time', 'delta'])
+# number of points held in memory before being written to disk as a sorted run
+POINTS_RUN = 100000
+# time, request id, and length of the marshaled remainder of a point
+POINT_HEADER = struct.Struct('<qqI')
+# Compact form of a request with full history as extracted by request_record().
+Request = namedtuple('Request', ['id', 'type', 'state_when', 'priority', 'history', 'reviews', 'who_index'])
+History = namedtuple('History', ['when', 'who', 'description', 'comment'])
+Review = namedtuple('Review', ['attributes', 'history'])
 
 # Duplicate Leap config to handle 13.2 without issue.
 osclib.conf.DEFAULT[
@@ -31,16 +54,13 @@ osclib.conf.DEFAULT[
     r'openSUSE:(?P<project>Leap:(?P<version>[\d.]+))$']
 
 # Provide osc.core.get_request_list() that swaps out search() implementation to
-# capture the generated query, paginate over and yield each request to avoid
-# loading all requests at the same time. Additionally, use lxml ET to avoid
-# having to re-parse to perform complex xpaths.
+# capture the generated query, paginate over and yield each request as Request
+# record to avoid loading all requests at the same time.
 
 
-def get_request_list(*args, **kwargs):
+def get_request_list(*args, xpath=None, **kwargs):
     osc.core._search = osc.core.search
     osc.core.search = search_capture
-    osc.core._ET = osc.core.ET
-    osc.core.ET = ET
     osc.conf.config['include_request_from_project'] = False
 
     osc.core.get_request_list(*args, **kwargs)
@@ -48,47 +68,115 @@ def get_request_list(*args, **kwargs):
     osc.core.search = osc.core._search
 
     query = search_capture.query
-    for request in search_paginated_generator(query[0], query[1], **query[2]):
+    for request in search_paginated_generator(query[0], query[1], xpath=xpath, **query[2]):
         # Python 3 yield from.
         yield request
 
-    osc.core.ET = osc.core._ET
-
 
 def search_capture(apiurl, queries=None, **kwargs):
     search_capture.query = (apiurl, queries, kwargs)
     return {'request': ET.fromstring('<collection matches="0"></collection>')}
 
 # Provides a osc.core.search() implementation for use with get_request_list()
-# that paginates in sets of 1000 and yields each request.
+# that paginates in sets of 1000 and yields each request as parsed.
 
 
-def search_paginated_generator(apiurl, queries=None, **kwargs):
+def search_paginated_generator(apiurl, queries=None, xpath=None, **kwargs):
     if "action/target/@project='openSUSE:Factory'" in kwargs['request']:
         # Idealy this would be 250000, but poo#48437 and lack of OBS sort.
         kwargs['request'] = osc.core.xpath_join(kwargs['request'], '@id>450000', op='and')
+    if xpath:
+        kwargs['request'] = osc.core.xpath_join(kwargs['request'], xpath, op='and')
 
     request_count = 0
-    queries['request']['limit'] = 1000
-    queries['request']['offset'] = 0
+    query = queries['request']
+    query['match'] = kwargs['request']
+    query['limit'] = 1000
+    query['offset'] = 0
     while True:
-        collection = osc.core.search(apiurl, queries, **kwargs)['request']
-        if not request_count:
-            print('processing {:,} requests'.format(int(collection.get('matches'))))
+        url = osc.core.makeurl(apiurl, ['search', 'request'], query)
+        matches = None
+        for request in search_requests(osc.core.http_GET(url)):
+            if matches is None:
+                matches = request
+                if not request_count:
+                    print('processing {:,} requests'.format(matches))
+                continue
 
-        for request in collection.findall('request'):
             yield request
             request_count += 1
 
-        if request_count == int(collection.get('matches')):
+        if not matches or request_count >= matches:
             # Stop paging once the expected number of items has been returned.
             break
 
-        # Release memory as otherwise ET seems to hold onto it.
-        collection.clear()
-        queries['request']['offset'] += queries['request']['limit']
+        query['offset'] += query['limit']
 
 
+def search_requests(f):
+    """
+    Parse a request search result incrementally yielding the number of matches
+    followed by a Request record for each request which are discarded from the
+    tree once extracted.
+    """
+    for event, element in ET.iterparse(f, events=('start', 'end'), tag=('collection', 'request')):
+        if element.tag == 'collection':
+            if event == 'start':
+                yield int(element.get('matches'))
+            continue
+
+        if event == 'end':
+            yield request_record(element)
+
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def history_record(element):
+    description = element.find('description')
+    comment = element.find('comment')
+    return History(element.get('when'), element.get('who'),
+                   description.text if description is not None else None,
+                   comment.text if comment is not None else None)
+
+
+def request_record(request):
+    """
+    Extract a Request record from a request element with full history in a
+    single pass over its children.
+
+    The who_index maps the time of history entries with a comment, both in full
+    and without seconds, to those entries for who_workaround().
+    """
+    action_type = state_when = priority = None
+    history = []
+    reviews = []
+    for child in request:
+        if child.tag == 'action':
+            if action_type is None:
+                action_type = child.get('type')
+        elif child.tag == 'state':
+            if state_when is None:
+                state_when = child.get('when')
+        elif child.tag == 'history':
+            history.append(history_record(child))
+        elif child.tag == 'review':
+            reviews.append(Review(dict(child.items()), [history_record(h) for h in child.iterchildren('history')]))
+        elif child.tag == 'priority':
+            if priority is None:
+                priority = child.text or ''
+
+    who_index = {}
+    for entry in history:
+        if entry.when and entry.comment:
+            who_index.setdefault(entry.when, []).append(entry)
+            who_index.setdefault(entry.when[:-2], []).append(entry)
+
+    return Request(int(request.get('id')), action_type, state_when, priority, history, reviews, who_index)
+
+
+# Points of the request being ingested.
 points = []
 
 
@@ -101,155 +189,312 @@ def timestamp(datetime):
     return int(datetime.strftime('%s'))
 
 
-def ingest_requests(api, project):
+def point_write(f, key, point):
+    payload = marshal.dumps((point.measurement, point.tags, point.fields, point.delta))
+    f.write(POINT_HEADER.pack(key[0], key[1], len(payload)))
+    f.write(payload)
+
+
+def point_read(f):
+    while True:
+        header = f.read(POINT_HEADER.size)
+        if not header:
+            return
+
+        time, request_id, length = POINT_HEADER.unpack(header)
+        measurement, tags, fields, delta = marshal.loads(f.read(length))
+        yield (time, request_id), Point(measurement, tags, fields, time, delta)
+
+
+class PointRuns(object):
+    """
+    Points ordered by time and then request kept in memory up to POINTS_RUN
+    after which they are written to temporary files as sorted runs and merged
+    when iterated.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.runs = []
+        self.count = 0
+
+    def extend(self, request_id, points):
+        self.pending.extend(((point.time, request_id), point) for point in points)
+        self.count += len(points)
+        if len(self.pending) >= POINTS_RUN:
+            self.spill()
+
+    def spill(self):
+        self.pending.sort(key=itemgetter(0))
+        f = tempfile.TemporaryFile(prefix='metrics-')
+        for key, point in self.pending:
+            point_write(f, key, point)
+        f.seek(0)
+        self.runs.append(f)
+        self.pending = []
+
+    def merged(self, *iterables):
+        """Merge with other (key, point) iterables ordered by key."""
+        self.pending.sort(key=itemgetter(0))
+        iterables += tuple(point_read(f) for f in self.runs) + (self.pending,)
+        return heapq.merge(*iterables, key=itemgetter(0))
+
+    def close(self):
+        for f in self.runs:
+            f.close()
+
+
+def requests_state_path(project, extension):
+    return os.path.join(CacheManager.directory('metrics'), '{}.requests.{}'.format(project, extension))
+
+
+def requests_state_load(project):
+    path = requests_state_path(project, 'pickle')
+    if not os.path.exists(path) or not os.path.exists(requests_state_path(project, 'points')):
+        return None
+
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != REQUESTS_STATE_VERSION:
+        return None
+    return state
+
+
+def requests_state_save(project, state):
+    path = requests_state_path(project, 'pickle')
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=-1)
+    os.rename(path + '.tmp', path)
+
+
+def requests_state_points(stream, f):
+    # Write the delta points which make up the state of the next run as they
+    # are walked and before walk_points() updates the fields.
+    for key, point in stream:
+        if point.delta:
+            point_write(f, key, point)
+        yield point
+
+
+def ingest_requests(api, project, rebuild=False):
+    # The delta points of all requests are kept ordered by time in a file in
+    # order to continue counters when only ingesting requests finalized since
+    # the last run. The state itself consists of a digest and the first time
+    # of the delta points for each request to detect changes.
+    state = None if rebuild else requests_state_load(project)
+    if state:
+        print('incremental ingest of requests finalized since {}'.format(state['when']))
+        xpath = "state/@when>='{}'".format(state['when'])
+    else:
+        print('rebuilding all request points')
+        state = {'version': REQUESTS_STATE_VERSION, 'when': None, 'requests': {}}
+        xpath = None
+    incremental = state['when'] is not None
+
     requests = get_request_list(api.apiurl, project,
                                 req_state=('accepted', 'revoked', 'superseded'),
-                                withfullhistory=True)
+                                withfullhistory=True, xpath=xpath)
+    runs = PointRuns()
+    changed = set()
+    since = None
     for request in requests:
-        if request.find('action').get('type') not in ('submit', 'delete'):
-            # TODO Handle non-stageable requests via different flow.
+        state_when = request.state_when
+        if not state['when'] or state_when > state['when']:
+            state['when'] = state_when
+
+        ingest_request(api, project, request)
+        request_points = points[:]
+        del points[:]
+
+        request_id = request.id
+        delta = [point for point in request_points if point.delta]
+        digest = hashlib.sha1(pickle.dumps([tuple(point) for point in delta], protocol=4)).hexdigest()
+        previous = state['requests'].get(request_id)
+        if (previous and previous[0] == digest) or (not previous and not request_points):
+            # Unchanged since ingested (ie. finalized at the checkpoint) or no points.
             continue
 
-        created_at = date_parse(request.find('history').get('when'))
-        final_at = date_parse(request.find('state').get('when'))
-        final_at_history = date_parse(request.find('history[last()]').get('when'))
-        if final_at_history > final_at:
-            # Workaround for invalid dates: openSUSE/open-build-service#3858.
-            final_at = final_at_history
-
-        # TODO Track requests in psuedo-ignore state.
-        point('total', {'backlog': 1, 'open': 1}, created_at, {'event': 'create'}, True)
-        point('total', {'backlog': -1, 'open': -1}, final_at, {'event': 'close'}, True)
-
-        request_tags = {}
-        request_fields = {
-            'total': (final_at - created_at).total_seconds(),
-            'staged_count': len(request.findall('review[@by_group="factory-staging"]/history')),
-        }
-        # TODO Total time spent in backlog (ie factory-staging, but excluding when staged).
-
-        staged_first_review = request.xpath('review[contains(@by_project, "{}:Staging:")]'.format(project))
-        if len(staged_first_review):
-            by_project = staged_first_review[0].get('by_project')
-            request_tags['type'] = 'adi' if api.is_adi_project(by_project) else 'letter'
-
-            # TODO Determine current whitelists state based on dashboard revisions.
-            if project.startswith('openSUSE:Factory'):
-                splitter_whitelist = 'B C D E F G H I J'.split()
-                if splitter_whitelist:
-                    short = api.extract_staging_short(by_project)
-                    request_tags['whitelisted'] = short in splitter_whitelist
-            else:
-                # All letter where whitelisted since no restriction.
-                request_tags['whitelisted'] = request_tags['type'] == 'letter'
-
-        xpath = 'review[contains(@by_project, "{}:Staging:adi:") and @state="accepted"]/'.format(project)
-        xpath += 'history[comment[text() = "ready to accept"]]/@when'
-        ready_to_accept = request.xpath(xpath)
-        if len(ready_to_accept):
-            ready_to_accept = date_parse(ready_to_accept[0])
-            request_fields['ready'] = (final_at - ready_to_accept).total_seconds()
-
-            # TODO Points with indentical timestamps are merged so this can be placed in total
-            # measurement, but may make sense to keep this separate and make the others follow.
-            point('ready', {'count': 1}, ready_to_accept, delta=True)
-            point('ready', {'count': -1}, final_at, delta=True)
-
-        staged_first = request.xpath('review[@by_group="factory-staging"]/history/@when')
-        if len(staged_first):
-            staged_first = date_parse(staged_first[0])
-            request_fields['staged_first'] = (staged_first - created_at).total_seconds()
-
-            # TODO Decide if better to break out all measurements by time most relevant to event,
-            # time request was created, or time request was finalized. It may also make sense to
-            # keep separate measurement by different times like this one.
-            point('request_staged_first', {'value': request_fields['staged_first']}, staged_first, request_tags)
-
-        point('request', request_fields, final_at, request_tags)
-
-        # Staging related reviews.
-        for number, review in enumerate(
-                request.xpath('review[contains(@by_project, "{}:Staging:")]'.format(project)), start=1):
-            staged_at = date_parse(review.get('when'))
-
-            project_type = 'adi' if api.is_adi_project(review.get('by_project')) else 'letter'
-            short = api.extract_staging_short(review.get('by_project'))
-            point('staging', {'count': 1}, staged_at,
-                  {'id': short, 'type': project_type, 'event': 'select'}, True)
-            point('total', {'backlog': -1, 'staged': 1}, staged_at, {'event': 'select'}, True)
-
-            who = who_workaround(request, review)
-            review_tags = {'event': 'select', 'user': who, 'number': number}
-            review_tags.update(request_tags)
-            point('user', {'count': 1}, staged_at, review_tags)
-
-            history = review.find('history')
-            if history is not None:
-                unselected_at = date_parse(history.get('when'))
-            else:
-                unselected_at = final_at
-
-            # If a request is declined and re-opened it must be repaired before being re-staged. At
-            # which point the only possible open review should be the final one.
-            point('staging', {'count': -1}, unselected_at,
-                  {'id': short, 'type': project_type, 'event': 'unselect'}, True)
-            point('total', {'backlog': 1, 'staged': -1}, unselected_at, {'event': 'unselect'}, True)
-
-        # No-staging related reviews.
-        for review in request.xpath('review[not(contains(@by_project, "{}:Staging:"))]'.format(project)):
-            tags = {
-                # who_added is non-trivial due to openSUSE/open-build-service#3898.
-                'state': review.get('state'),
-            }
-
-            opened_at = date_parse(review.get('when'))
-            history = review.find('history')
-            if history is not None:
-                completed_at = date_parse(history.get('when'))
-                tags['who_completed'] = history.get('who')
+        # Rewrite from the earliest point, including previous points of a
+        # changed request since counters at those times are affected.
+        times = [point.time for point in request_points] + ([previous[1]] if previous else [])
+        since = min(times) if since is None else min(since, *times)
+        changed.add(request_id)
+        runs.extend(request_id, request_points)
+        if delta:
+            state['requests'][request_id] = (digest, min(point.time for point in delta))
+        elif previous:
+            del state['requests'][request_id]
+
+    print('finalizing {:,} points'.format(runs.count))
+    wrote = 0
+    path = requests_state_path(project, 'points')
+    if not incremental or changed:
+        with open(path + '.tmp', 'wb') as f:
+            if incremental:
+                # Replay delta points of other requests to recreate the
+                # counters, but only write from the first changed time.
+                with open(path, 'rb') as previous:
+                    stream = runs.merged((key, point) for key, point in point_read(previous) if key[1] not in changed)
+                    wrote = walk_points(requests_state_points(stream, f), project, since)
             else:
-                completed_at = final_at
-                # Does not seem to make sense to mirror user responsible for making final state
-                # change as the user who completed the review.
-
-            tags['key'] = []
-            tags['type'] = []
-            for name, value in sorted(review.items(), reverse=True):
-                if name.startswith('by_'):
-                    tags[name] = value
-                    tags['key'].append(value)
-                    tags['type'].append(name[3:])
-            tags['type'] = '_'.join(tags['type'])
-
-            point('review', {'open_for': (completed_at - opened_at).total_seconds()}, completed_at, tags)
-            point('review_count', {'count': 1}, opened_at, tags, True)
-            point('review_count', {'count': -1}, completed_at, tags, True)
-
-        found = []
-        for set_priority in request.xpath('history[description[contains(text(), "Request got a new priority:")]]'):
-            parts = set_priority.find('description').text.rsplit(' ', 3)
-            priority_previous = parts[1]
-            priority = parts[3]
-            if priority == priority_previous:
-                continue
+                wrote = walk_points(requests_state_points(runs.merged(), f), project, None)
+        os.rename(path + '.tmp', path)
 
-            changed_at = date_parse(set_priority.get('when'))
-            if priority_previous != 'moderate':
-                point('priority', {'count': -1}, changed_at, {'level': priority_previous}, True)
-            if priority != 'moderate':
-                point('priority', {'count': 1}, changed_at, {'level': priority}, True)
-                found.append(priority)
-
-        # Ensure a final removal entry is created when request is finalized.
-        priority = request.find('priority')
-        if priority is not None and priority.text != 'moderate':
-            if priority.text in found:
-                point('priority', {'count': -1}, final_at, {'level': priority.text}, True)
-            else:
-                print('unable to find priority history entry for {} to {}'.format(request.get('id'), priority.text))
+    runs.close()
+    requests_state_save(project, state)
+    return wrote
+
+
+def ingest_request(api, project, request):
+    if request.type not in ('submit', 'delete'):
+        # TODO Handle non-stageable requests via different flow.
+        return
+
+    staging = '{}:Staging:'.format(project)
+    staging_reviews = [review for review in request.reviews if staging in review.attributes.get('by_project', '')]
+    factory_staging_reviews = [review for review in request.reviews
+                               if review.attributes.get('by_group') == 'factory-staging']
+
+    created_at = date_parse(request.history[0].when)
+    final_at = date_parse(request.state_when)
+    final_at_history = date_parse(request.history[-1].when)
+    if final_at_history > final_at:
+        # Workaround for invalid dates: openSUSE/open-build-service#3858.
+        final_at = final_at_history
+
+    # TODO Track requests in psuedo-ignore state.
+    point('total', {'backlog': 1, 'open': 1}, created_at, {'event': 'create'}, True)
+    point('total', {'backlog': -1, 'open': -1}, final_at, {'event': 'close'}, True)
+
+    request_tags = {}
+    request_fields = {
+        'total': (final_at - created_at).total_seconds(),
+        'staged_count': sum(len(review.history) for review in factory_staging_reviews),
+    }
+    # TODO Total time spent in backlog (ie factory-staging, but excluding when staged).
+
+    if len(staging_reviews):
+        by_project = staging_reviews[0].attributes['by_project']
+        request_tags['type'] = 'adi' if api.is_adi_project(by_project) else 'letter'
+
+        # TODO Determine current whitelists state based on dashboard revisions.
+        if project.startswith('openSUSE:Factory'):
+            splitter_whitelist = 'B C D E F G H I J'.split()
+            if splitter_whitelist:
+                short = api.extract_staging_short(by_project)
+                request_tags['whitelisted'] = short in splitter_whitelist
+        else:
+            # All letter where whitelisted since no restriction.
+            request_tags['whitelisted'] = request_tags['type'] == 'letter'
+
+    adi = '{}:Staging:adi:'.format(project)
+    ready_to_accept = [history.when for review in request.reviews
+                       if adi in review.attributes.get('by_project', '') and review.attributes.get('state') == 'accepted'
+                       for history in review.history if history.comment == 'ready to accept']
+    if len(ready_to_accept):
+        ready_to_accept = date_parse(ready_to_accept[0])
+        request_fields['ready'] = (final_at - ready_to_accept).total_seconds()
+
+        # TODO Points with indentical timestamps are merged so this can be placed in total
+        # measurement, but may make sense to keep this separate and make the others follow.
+        point('ready', {'count': 1}, ready_to_accept, delta=True)
+        point('ready', {'count': -1}, final_at, delta=True)
+
+    staged_first = [history.when for review in factory_staging_reviews for history in review.history]
+    if len(staged_first):
+        staged_first = date_parse(staged_first[0])
+        request_fields['staged_first'] = (staged_first - created_at).total_seconds()
+
+        # TODO Decide if better to break out all measurements by time most relevant to event,
+        # time request was created, or time request was finalized. It may also make sense to
+        # keep separate measurement by different times like this one.
+        point('request_staged_first', {'value': request_fields['staged_first']}, staged_first, request_tags)
+
+    point('request', request_fields, final_at, request_tags)
+
+    # Staging related reviews.
+    for number, review in enumerate(staging_reviews, start=1):
+        staged_at = date_parse(review.attributes.get('when'))
+
+        project_type = 'adi' if api.is_adi_project(review.attributes['by_project']) else 'letter'
+        short = api.extract_staging_short(review.attributes['by_project'])
+        point('staging', {'count': 1}, staged_at,
+              {'id': short, 'type': project_type, 'event': 'select'}, True)
+        point('total', {'backlog': -1, 'staged': 1}, staged_at, {'event': 'select'}, True)
+
+        who = who_workaround(request, review)
+        review_tags = {'event': 'select', 'user': who, 'number': number}
+        review_tags.update(request_tags)
+        point('user', {'count': 1}, staged_at, review_tags)
+
+        if review.history:
+            unselected_at = date_parse(review.history[0].when)
+        else:
+            unselected_at = final_at
+
+        # If a request is declined and re-opened it must be repaired before being re-staged. At
+        # which point the only possible open review should be the final one.
+        point('staging', {'count': -1}, unselected_at,
+              {'id': short, 'type': project_type, 'event': 'unselect'}, True)
+        point('total', {'backlog': 1, 'staged': -1}, unselected_at, {'event': 'unselect'}, True)
 
-    print('finalizing {:,} points'.format(len(points)))
-    return walk_points(points, project)
+    # No-staging related reviews.
+    for review in request.reviews:
+        if staging in review.attributes.get('by_project', ''):
+            continue
+
+        tags = {
+            # who_added is non-trivial due to openSUSE/open-build-service#3898.
+            'state': review.attributes.get('state'),
+        }
+
+        opened_at = date_parse(review.attributes.get('when'))
+        if review.history:
+            completed_at = date_parse(review.history[0].when)
+            tags['who_completed'] = review.history[0].who
+        else:
+            completed_at = final_at
+            # Does not seem to make sense to mirror user responsible for making final state
+            # change as the user who completed the review.
+
+        tags['key'] = []
+        tags['type'] = []
+        for name, value in sorted(review.attributes.items(), reverse=True):
+            if name.startswith('by_'):
+                tags[name] = value
+                tags['key'].append(value)
+                tags['type'].append(name[3:])
+        tags['type'] = '_'.join(tags['type'])
+
+        point('review', {'open_for': (completed_at - opened_at).total_seconds()}, completed_at, tags)
+        point('review_count', {'count': 1}, opened_at, tags, True)
+        point('review_count', {'count': -1}, completed_at, tags, True)
+
+    found = []
+    for set_priority in request.history:
+        if not set_priority.description or 'Request got a new priority:' not in set_priority.description:
+            continue
+
+        parts = set_priority.description.rsplit(' ', 3)
+        priority_previous = parts[1]
+        priority = parts[3]
+        if priority == priority_previous:
+            continue
+
+        changed_at = date_parse(set_priority.when)
+        if priority_previous != 'moderate':
+            point('priority', {'count': -1}, changed_at, {'level': priority_previous}, True)
+        if priority != 'moderate':
+            point('priority', {'count': 1}, changed_at, {'level': priority}, True)
+            found.append(priority)
+
+    # Ensure a final removal entry is created when request is finalized.
+    priority = request.priority
+    if priority is not None and priority != 'moderate':
+        if priority in found:
+            point('priority', {'count': -1}, final_at, {'level': priority}, True)
+        else:
+            print('unable to find priority history entry for {} to {}'.format(request.id, priority))
 
 
 def who_workaround(request, review, relax=False):
@@ -258,15 +503,14 @@ def who_workaround(request, review, relax=False):
     # - openSUSE/open-build-service#3898
     global who_workaround_swap, who_workaround_miss
 
-    who = review.get('who')  # All that should be required (used as fallback).
-    when = review.get('when')
+    who = review.attributes.get('who')  # All that should be required (used as fallback).
+    when = review.attributes.get('when')
     if relax:
         # Super hack, chop off seconds to relax in hopes of finding potential.
         when = when[:-2]
 
-    who_real = request.xpath(
-        'history[contains(@when, "{}") and comment[contains(text(), "{}")]]/@who'.format(
-            when, review.get('by_project')))
+    by_project = review.attributes.get('by_project')
+    who_real = [history.who for history in request.who_index.get(when, []) if by_project in history.comment]
     if len(who_real):
         who = who_real[0]
         who_workaround_swap += 1
@@ -277,13 +521,15 @@ def who_workaround(request, review, relax=False):
 
     return who
 
-# Walk data points in order by time, adding up deltas and merging points at
+# Walk data points ordered by time, adding up deltas and merging points at
 # the same time. Data is converted to dict() and written to influx batches to
 # avoid extra memory usage required for all data in dict() and avoid influxdb
-# allocating memory for entire incoming data set at once.
+# allocating memory for entire incoming data set at once. When since is given
+# points before are only used to add up deltas and only delta points from then
+# on are replaced instead of dropping the measurements.
 
 
-def walk_points(points, target):
+def walk_points(points, target, since=None):
     global client
 
     measurements = set()
@@ -291,10 +537,15 @@ def walk_points(points, target):
     final = []
     time_last = None
     wrote = 0
-    for point in sorted(points, key=lambda l: l.time):
+    for point in points:
         if point.measurement not in measurements:
             # Wait until just before writing to drop measurement.
-            client.drop_measurement(point.measurement)
+            if since is None:
+                client.drop_measurement(point.measurement)
+            elif point.delta:
+                # Deltas are rewritten from since, but merged points may end
+                # up with the tags of a different point so remove them first.
+                client.query('DELETE FROM "{}" WHERE time >= {}s'.format(point.measurement, since))
             measurements.add(point.measurement)
 
         if point.time != time_last and len(final) >= 1000:
@@ -307,7 +558,8 @@ def walk_points(points, target):
         time_last = point.time
 
         if not point.delta:
-            final.append(dict(point._asdict()))
+            if since is None or point.time >= since:
+                final.append(dict(point._asdict()))
             continue
 
         # A more generic method like 'key' which ended up being needed is likely better.
@@ -329,7 +581,8 @@ def walk_points(points, target):
         else:
             point = dict(point._asdict())
             counters_tag['last'] = point
-            final.append(point)
+            if since is None or point['time'] >= since:
+                final.append(point)
         point['fields'].update(counters_tag['values'])
 
     # Write any remaining final points.
@@ -371,6 +624,9 @@ def ingest_release_schedule(project):
 def revision_index(api):
     if not hasattr(revision_index, 'index'):
         revision_index.index = {}
+        # Dates and revisions sorted by date for bisecting in revision_at().
+        revision_index.made = []
+        revision_index.revisions = []
 
         project, package = project_pseudometa_package(api.apiurl, api.project)
         try:
@@ -383,25 +639,88 @@ def revision_index(api):
             date = date_parse(logentry.find('date').text)
             revision_index.index[date] = logentry.get('revision')
 
+        revision_index.made = sorted(revision_index.index)
+        revision_index.revisions = [revision_index.index[made] for made in revision_index.made]
+
     return revision_index.index
 
 
 def revision_at(api, datetime):
-    index = revision_index(api)
-    for made, revision in sorted(index.items(), reverse=True):
-        if made <= datetime:
-            return revision
+    revision_index(api)
+    position = bisect_right(revision_index.made, datetime)
+    if position:
+        return revision_index.revisions[position - 1]
 
     return None
 
 
+# Dashboard files are stored by md5 along with the md5 of each file per
+# revision, appended as revisions are first seen, so that each revision is only
+# listed once and each version of a file only loaded once across runs.
+
+
+def dashboard_store(api):
+    if not hasattr(dashboard_store, 'revisions'):
+        project, package = project_pseudometa_package(api.apiurl, api.project)
+        dashboard_store.path = CacheManager.directory('metrics-dashboard', project, package)
+        dashboard_store.revisions = {}
+
+        index = os.path.join(dashboard_store.path, 'revisions.jsonl')
+        if os.path.exists(index):
+            with open(index) as f:
+                for line in f:
+                    revision, files = json.loads(line)
+                    dashboard_store.revisions[revision] = files
+
+    return dashboard_store.path, dashboard_store.revisions
+
+
+def dashboard_files(api, revision):
+    path, revisions = dashboard_store(api)
+    if revision not in revisions:
+        project, package = project_pseudometa_package(api.apiurl, api.project)
+        url = makeurl(api.apiurl, ['source', project, package], {'rev': revision, 'expand': 1})
+        try:
+            root = ET.parse(http_GET(url)).getroot()
+        except HTTPError:
+            return {}
+
+        files = {entry.get('name'): entry.get('md5') for entry in root.findall('entry')}
+        with open(os.path.join(path, 'revisions.jsonl'), 'a') as f:
+            f.write(json.dumps([revision, files]) + '\n')
+        revisions[revision] = files
+
+    return revisions[revision]
+
+
+def dashboard_file_load(api, filename, revision):
+    md5 = dashboard_files(api, revision).get(filename)
+    if md5 is None:
+        return None
+
+    path = os.path.join(dashboard_store(api)[0], md5)
+    if not os.path.exists(path):
+        project, package = project_pseudometa_package(api.apiurl, api.project)
+        content = source_file_load(api.apiurl, project, package, filename, revision)
+        if content is None:
+            return None
+
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.rename(path + '.tmp', path)
+
+    with open(path, encoding='utf-8') as f:
+        # Same as project_pseudometa_file_load().
+        return f.read().rstrip()
+
+
 def dashboard_at(api, filename, datetime=None, revision=None):
     if datetime:
         revision = revision_at(api, datetime)
     if not revision:
         return revision
 
-    content = api.pseudometa_file_load(filename, revision)
+    content = dashboard_file_load(api, filename, revision)
     if filename in ('ignored_requests'):
         if content:
             return yaml.safe_load(content)
@@ -510,7 +829,7 @@ def ingest_dashboard(api):
 
     count = 0
     points = []
-    for made, revision in sorted(index.items()):
+    for made, revision in zip(revision_index.made, revision_index.revisions):
         if not past:
             if revision == revision_last:
                 past = True
@@ -586,7 +905,7 @@ def main(args):
     global who_workaround_swap, who_workaround_miss
     who_workaround_swap = who_workaround_miss = 0
 
-    points_requests = ingest_requests(api, args.project)
+    points_requests = ingest_requests(api, args.project, args.rebuild)
     points_schedule = ingest_release_schedule(args.project)
 
     print('who_workaround_swap', who_workaround_swap)
@@ -610,6 +929,8 @@ if __name__ == '__main__':
     parser.add_argument('--heavy-cache', action='store_true',
                         help='cache ephemeral queries indefinitely (useful for development)')
     parser.add_argument('--release-only', action='store_true', help='ingest release metrics only')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='rebuild request metrics from all requests instead of only those finalized since last run')
     args = parser.parse_args()
 
     sys.exit(main(args))
@@ -1,3 +1,6 @@
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from datetime import timedelta
 import json
 import logging
@@ -8,6 +11,7 @@ from osc import core
 from osc import oscerr
 from osc.core import get_request_list
 from osclib.cache import Cache
+from osclib.cache_stats import CacheStats
 from osclib.cache_manager import CacheManager
 from osclib.core import entity_exists
 from osclib.core import package_kind
@@ -15,8 +19,10 @@ from osclib.core import package_list
 from osclib.core import package_list_kind_filtered
 from osclib.core import project_attribute_list
 from osclib.core import project_locked
+from osclib.fetch import fetch
 from osclib.origin import config_load
 from osclib.origin import config_origin_list
+from osclib.origin import origin_workaround_strip
 from osclib.origin import origin_find
 from osclib.origin import origin_history
 from osclib.origin import origin_potentials
@@ -28,9 +34,13 @@ from osclib.util import mail_send
 from shutil import copyfile
 import sys
 import time
+from urllib.parse import urlencode
 import yaml
 
 OSRT_ORIGIN_LOOKUP_TTL = 60 * 60 * 24 * 7
+OSRT_ORIGIN_LOOKUP_FULL_TTL = 60 * 60 * 24 * 28
+OSRT_ORIGIN_LOOKUP_PARTIAL_TTL = 60 * 60 * 24
+OSRT_ORIGIN_LOOKUP_JOBS = 4
 
 
 @cmdln.option('--debug', action='store_true', help='output debug information')
@@ -38,6 +48,8 @@ OSRT_ORIGIN_LOOKUP_TTL = 60 * 60 * 24 * 7
 @cmdln.option('--dry', action='store_true', help='perform a dry-run where applicable')
 @cmdln.option('--force-refresh', action='store_true', help='force refresh of data')
 @cmdln.option('--format', default='plain', help='output format')
+@cmdln.option('-j', '--jobs', type='int', default=OSRT_ORIGIN_LOOKUP_JOBS,
+              help='number of packages to process in parallel when generating the lookup')
 @cmdln.option('--listen', action='store_true', help='listen to events')
 @cmdln.option('--listen-seconds', help='number of seconds to listen to events')
 @cmdln.option('--mail', action='store_true', help='mail report to <confg:mail-release-list>')
@@ -60,13 +72,13 @@ def do_origin(self, subcmd, opts, *args):
 
     Usage:
         osc origin config [--origins-only]
-        osc origin cron
+        osc origin cron [--jobs N]
         osc origin history [--format json|yaml] PACKAGE
-        osc origin list [--force-refresh] [--format json|yaml]
+        osc origin list [--force-refresh] [--format json|yaml] [--jobs N]
         osc origin package [--debug] PACKAGE
         osc origin potentials [--format json|yaml] PACKAGE
         osc origin projects [--format json|yaml]
-        osc origin report [--diff] [--force-refresh] [--mail]
+        osc origin report [--diff] [--force-refresh] [--jobs N] [--mail]
         osc origin update [--listen] [--listen-seconds] [PACKAGE...]
     """
 
@@ -122,7 +134,8 @@ def osrt_origin_cron(apiurl, opts, *args):
                 continue
 
         # Force update lookup information.
-        lookup = osrt_origin_lookup(apiurl, project, force_refresh=True, quiet=True)
+        lookup = osrt_origin_lookup(apiurl, project, force_refresh=True, quiet=True, jobs=opts.jobs,
+                                    incremental=True)
         print('{} lookup updated for {} package(s)'.format(project, len(lookup)))
 
 
@@ -161,38 +174,39 @@ def osrt_origin_lookup_file(project, previous=False):
     return os.path.join(cache_dir, lookup_name)
 
 
-def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, quiet=False):
+def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, quiet=False,
+                       jobs=OSRT_ORIGIN_LOOKUP_JOBS, incremental=False):
     locked = project_locked(apiurl, project)
     if locked:
         force_refresh = False
 
     lookup_path = osrt_origin_lookup_file(project, previous)
+    elapsed = CacheStats.timer()
     if not force_refresh and os.path.exists(lookup_path):
         if not locked and not previous:
             # Force refresh of lookup information if expried.
             if time.time() - os.stat(lookup_path).st_mtime > OSRT_ORIGIN_LOOKUP_TTL:
-                return osrt_origin_lookup(apiurl, project, True)
+                CacheStats.record('origin-lookup', project, expired=1)
+                return osrt_origin_lookup(apiurl, project, True, jobs=jobs, incremental=True)
 
-        with open(lookup_path, 'r') as lookup_stream:
-            lookup = yaml.safe_load(lookup_stream)
+        lookup = osrt_origin_lookup_load(lookup_path)
 
-            if not isinstance(next(iter(lookup.values())), dict):
-                # Convert flat format to dictionary.
-                for package, origin in lookup.items():
-                    lookup[package] = {'origin': origin}
+        if not previous:
+            CacheStats.record('origin-lookup', project, hits=1, hit_seconds=elapsed())
     else:
         if previous:
             return None
 
-        packages = package_list_kind_filtered(apiurl, project)
+        packages = [str(package) for package in package_list_kind_filtered(apiurl, project)]
+        lookup = None
+        if incremental:
+            lookup = osrt_origin_lookup_incremental(apiurl, project, packages, lookup_path, jobs, quiet)
 
-        lookup = {}
-        for package in packages:
-            origin_info = origin_find(apiurl, project, package)
-            lookup[str(package)] = {
-                'origin': str(origin_info),
-                'revisions': origin_revision_state(apiurl, project, package, origin_info),
-            }
+        if lookup is None:
+            lookup = osrt_origin_lookup_generate(apiurl, project, packages, lookup_path, jobs, quiet)
+            state = osrt_origin_lookup_state(apiurl, project, packages, lookup)
+            state['full'] = time.time()
+            osrt_origin_lookup_state_save(lookup_path, state)
 
         if os.path.exists(lookup_path):
             lookup_path_previous = osrt_origin_lookup_file(project, True)
@@ -200,6 +214,13 @@ def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, qui
 
         with open(lookup_path, 'w+') as lookup_stream:
             yaml.dump(lookup, lookup_stream, default_flow_style=False)
+        try:
+            os.remove(osrt_origin_lookup_partial_file(lookup_path))
+        except FileNotFoundError:
+            pass
+
+        CacheStats.record('origin-lookup', project, misses=1, miss_seconds=elapsed(),
+                          bytes=os.path.getsize(lookup_path))
 
     if not previous and not quiet:
         dt = timedelta(seconds=time.time() - os.stat(lookup_path).st_mtime)
@@ -208,12 +229,246 @@ def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, qui
     return lookup
 
 
+def osrt_origin_lookup_load(lookup_path):
+    with open(lookup_path, 'r') as lookup_stream:
+        lookup = yaml.safe_load(lookup_stream)
+
+        if not isinstance(next(iter(lookup.values())), dict):
+            # Convert flat format to dictionary.
+            for package, origin in lookup.items():
+                lookup[package] = {'origin': origin}
+
+    return lookup
+
+
+def osrt_origin_lookup_incremental(apiurl, project, packages, lookup_path, jobs=1, quiet=False):
+    """
+    Refresh only the entries of packages whose source, or source in one of the
+    relevant origin projects, changed since the previous lookup was generated.
+
+    Source changes are detected by comparing srcmd5 from the sourceinfo of the
+    target and origin projects against the state stored alongside the lookup.
+    Packages whose origin was not determined, is pending, or a workaround are
+    always recomputed since those depend on requests rather than sources.
+
+    :return: merged lookup or None if a full refresh is required
+    """
+    state_previous = osrt_origin_lookup_state_load(lookup_path)
+    if not state_previous or not os.path.exists(lookup_path):
+        return None
+
+    if time.time() - state_previous.get('full', 0) > OSRT_ORIGIN_LOOKUP_FULL_TTL:
+        # Periodically regenerate everything to catch changes not reflected
+        # by source changes, like devel project changes.
+        return None
+
+    lookup_previous = osrt_origin_lookup_load(lookup_path)
+    if any('revisions' not in entry for entry in lookup_previous.values()):
+        return None
+
+    state = osrt_origin_lookup_state(apiurl, project, packages, lookup_previous)
+    if state['origins'] != state_previous['origins']:
+        return None
+
+    changed = []
+    for package in packages:
+        if osrt_origin_lookup_changed(project, package, lookup_previous.get(package),
+                                      state_previous, state):
+            changed.append(package)
+
+    if not quiet:
+        print('# refreshing {} of {} package(s) with changes'.format(len(changed), len(packages)), file=sys.stderr)
+
+    lookup = {package: lookup_previous[package] for package in packages if package not in changed}
+    lookup.update(osrt_origin_lookup_generate(apiurl, project, changed, lookup_path, jobs, quiet))
+
+    state['full'] = state_previous['full']
+    osrt_origin_lookup_state_save(lookup_path, state)
+
+    return lookup
+
+
+def osrt_origin_lookup_changed(project, package, entry, state_previous, state):
+    if entry is None:
+        return True
+
+    origin = entry['origin']
+    if origin == 'None' or origin.endswith('+') or origin != origin_workaround_strip(origin):
+        return True
+
+    for source_project in [project, origin] + state['origins']:
+        sources_previous = state_previous['projects'].get(source_project)
+        sources = state['projects'].get(source_project)
+        if sources_previous is None or sources is None:
+            # Unable to determine sources so assume changed.
+            return True
+
+        if sources_previous.get(package) != sources.get(package):
+            return True
+
+    return False
+
+
+def osrt_origin_lookup_state(apiurl, project, packages, lookup):
+    """
+    Collect srcmd5 of packages in the target project, all origin projects, and
+    the origin projects referenced by lookup not part of the config (ex. devel
+    projects) for which only the relevant packages are requested.
+    """
+    config = config_load(apiurl, project)
+    origins = sorted(set(origin_workaround_strip(origin) for origin in config_origin_list(config)
+                         if not origin.startswith('<devel>')))
+
+    project_packages = {source_project: None for source_project in [project] + origins}
+    for package, entry in lookup.items():
+        origin = entry['origin']
+        if origin == 'None' or origin.endswith('+') or origin in project_packages:
+            continue
+
+        project_packages.setdefault(origin, set()).add(package)
+
+    return {
+        'origins': origins,
+        'projects': osrt_origin_source_md5(apiurl, project_packages),
+    }
+
+
+def osrt_origin_source_md5(apiurl, project_packages):
+    """
+    :param project_packages: dict of project to packages of interest or None for all
+    :return: dict of project to dict of package to srcmd5 or None if unavailable
+    """
+    urls = []
+    for source_project, packages in project_packages.items():
+        url = core.makeurl(apiurl, ['source', source_project], {'view': 'info', 'nofilename': 1})
+        if packages and len(packages) <= 50:
+            url += '&' + urlencode([('package', package) for package in sorted(packages)])
+        urls.append(url)
+
+    projects = {}
+    for source_project, root in zip(project_packages.keys(), fetch(urls, ignore=(400, 403, 404))):
+        if root is None:
+            projects[source_project] = None
+            continue
+
+        projects[source_project] = {sourceinfo.get('package'): sourceinfo.get('srcmd5')
+                                    for sourceinfo in root.findall('sourceinfo')}
+
+    return projects
+
+
+def osrt_origin_lookup_state_file(lookup_path):
+    return lookup_path + '.state'
+
+
+def osrt_origin_lookup_state_load(lookup_path):
+    state_path = osrt_origin_lookup_state_file(lookup_path)
+    if not os.path.exists(state_path):
+        return None
+
+    with open(state_path, 'r') as state_stream:
+        try:
+            return json.load(state_stream)
+        except ValueError:
+            return None
+
+
+def osrt_origin_lookup_state_save(lookup_path, state):
+    with open(osrt_origin_lookup_state_file(lookup_path), 'w') as state_stream:
+        json.dump(state, state_stream)
+
+
+def osrt_origin_lookup_entry(apiurl, project, package):
+    origin_info = origin_find(apiurl, project, package)
+    return {
+        'origin': str(origin_info),
+        'revisions': origin_revision_state(apiurl, project, package, origin_info),
+    }
+
+
+def osrt_origin_lookup_partial_file(lookup_path):
+    return lookup_path + '.partial'
+
+
+def osrt_origin_lookup_partial_load(partial_path):
+    lookup = {}
+    if not os.path.exists(partial_path):
+        return lookup
+
+    if time.time() - os.stat(partial_path).st_mtime > OSRT_ORIGIN_LOOKUP_PARTIAL_TTL:
+        os.remove(partial_path)
+        return lookup
+
+    with open(partial_path, 'r') as partial_stream:
+        for line in partial_stream:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Last line may be incomplete if interrupted while writing.
+                continue
+            lookup[record['package']] = record['entry']
+
+    return lookup
+
+
+def osrt_origin_lookup_generate(apiurl, project, packages, lookup_path, jobs=1, quiet=False):
+    """
+    Generate lookup entries for packages using a pool of workers.
+
+    Completed entries are appended to a partial file next to the lookup so that
+    an interrupted run resumes with the remaining packages. The caller removes
+    the partial file once the lookup has been written.
+    """
+    packages = [str(package) for package in packages]
+    partial_path = osrt_origin_lookup_partial_file(lookup_path)
+    resumed = osrt_origin_lookup_partial_load(partial_path)
+    lookup = {package: resumed[package] for package in packages if package in resumed}
+    remaining = [package for package in packages if package not in lookup]
+
+    start = time.time()
+    total = len(packages)
+    if not quiet and len(lookup):
+        print('# resuming with {} of {} package(s) from partial lookup'.format(len(lookup), total), file=sys.stderr)
+
+    with open(partial_path, 'a') as partial_stream, ThreadPoolExecutor(max(jobs, 1)) as executor:
+        futures = {executor.submit(osrt_origin_lookup_entry, apiurl, project, package): package
+                   for package in remaining}
+        try:
+            for future in as_completed(futures):
+                package = futures[future]
+                lookup[package] = future.result()
+                osrt_origin_lookup_partial_write(partial_stream, package, lookup[package])
+
+                done = len(lookup)
+                logging.debug('{}/{} {}: {}'.format(done, total, package, lookup[package]['origin']))
+                if not quiet and (done % 100 == 0 or done == total):
+                    print('# {}/{} package(s) in {}'.format(
+                        done, total, timedelta(seconds=int(time.time() - start))), file=sys.stderr)
+        except BaseException:
+            # Do not process queued packages only to discard them, but keep
+            # those completed, or already in progress, for the next run.
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            for future, package in futures.items():
+                if package not in lookup and not future.cancelled() and future.exception() is None:
+                    osrt_origin_lookup_partial_write(partial_stream, package, future.result())
+            raise
+
+    return lookup
+
+
+def osrt_origin_lookup_partial_write(partial_stream, package, entry):
+    partial_stream.write(json.dumps({'package': package, 'entry': entry}) + '\n')
+    partial_stream.flush()
+
+
 def osrt_origin_max_key(dictionary, minimum):
     return max(len(max(dictionary.keys(), key=len)), minimum)
 
 
 def osrt_origin_list(apiurl, opts, *args):
-    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, quiet=opts.format != 'plain')
+    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, quiet=opts.format != 'plain', jobs=opts.jobs)
 
     if opts.format != 'plain':
         # Suppliment data with request information.
@@ -308,7 +563,7 @@ def osrt_origin_report_diff(lookup, lookup_previous):
 
 
 def osrt_origin_report(apiurl, opts, *args):
-    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh)
+    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, jobs=opts.jobs)
     origin_count = osrt_origin_report_count(lookup)
 
     columns = ['origin', 'count', 'percent']
@@ -1,10 +1,14 @@
 import datetime
 import hashlib
+import json
 import os
 import osc.core
 import re
+import sqlite3
 import sys
+import threading
 
+from contextlib import contextmanager
 from urllib.parse import unquote
 from urllib.parse import urlsplit, SplitResult
 from io import BytesIO
@@ -12,6 +16,7 @@ from io import BytesIO
 from osc import conf
 from osc.core import urlopen
 from osclib.cache_manager import CacheManager
+from osclib.cache_stats import CacheStats
 from osclib.conf import str2bool
 from osclib.util import rmtree_nfs_safe
 from time import time
@@ -33,14 +38,188 @@ def http_request(method, url, headers={}, data=None, file=None):
         # request acceptance which causes a GET to determine target project.
         Cache.delete(url)
 
+    elapsed = CacheStats.timer()
     ret = osc.core._http_request(method, url, headers, data, file)
 
     if method == 'GET':
         ret = Cache.put(url, ret)
 
+        _, _, match, _ = Cache.classify(url)
+        if match:
+            CacheStats.record('http', match, miss_seconds=elapsed())
+
     return ret
 
 
+class CacheBackendDirectory(object):
+    """
+    Store each cached response as its own file.
+
+    Files are named by the sha1 of the url and placed in CACHE_DIR/<host>/ or
+    CACHE_DIR/<host>/<project>/ when a project context is available. The
+    modification time of the project directory indicates the age of the project
+    cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, url, project, ttl):
+        path = Cache.path(url, project, include_file=True)
+        if os.path.exists(path):
+            if time() - os.path.getmtime(path) <= ttl:
+                return urlopen('file://' + path), None
+            return None, 'expired'
+        return None, 'does not exist'
+
+    def put(self, url, project, text):
+        path = Cache.path(url, project, include_file=True, makedirs=True)
+        with open(path, 'wb') as f:
+            f.write(text)
+
+    def delete(self, url, project):
+        path = Cache.path(url, project, include_file=True)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def project_age(self, apiurl, project):
+        directory = Cache.path(apiurl, project)
+        if os.path.exists(directory):
+            return time() - os.path.getmtime(directory)
+        return 0
+
+    def delete_project(self, apiurl, project):
+        path = Cache.path(apiurl, project)
+        if os.path.exists(path):
+            rmtree_nfs_safe(path)
+            return True
+        return False
+
+    def delete_all(self):
+        if os.path.exists(self.directory):
+            rmtree_nfs_safe(self.directory)
+
+
+class CacheBackendSqlite(object):
+    """
+    Store all cached responses for an apiurl in a single indexed sqlite file.
+
+    Avoids creating a file per url and the multiple stat calls per lookup of the
+    directory layout. Entries are keyed by url and record the project context
+    and modification time so that project expiration is a single indexed delete.
+    The project table mirrors the directory mtime semantics: the timestamp only
+    moves when a new entry is added for the project.
+
+    A single connection per host is shared by all threads of a process and
+    serialized by a lock rather than opening one per thread, which would leak a
+    connection for each short lived worker thread. Connections are never shared
+    with forked processes.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS cache ('
+        'url TEXT PRIMARY KEY, project TEXT, mtime REAL NOT NULL, data BLOB NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS cache_project ON cache (project)',
+        'CREATE INDEX IF NOT EXISTS cache_mtime ON cache (mtime)',
+        'CREATE TABLE IF NOT EXISTS project (name TEXT PRIMARY KEY, mtime REAL NOT NULL)',
+    ]
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.connections = {}
+        self.pid = os.getpid()
+        self.lock = threading.RLock()
+
+    @contextmanager
+    def connection(self, url):
+        if self.pid != os.getpid():
+            # Forked: the lock may have been held by another thread of the parent
+            # and the connections of the parent must not be used.
+            self.pid = os.getpid()
+            self.lock = threading.RLock()
+            self.connections = {}
+
+        with self.lock:
+            host = urlsplit(url).hostname
+            connection = self.connections.get(host)
+            if connection is None:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+
+                path = os.path.join(self.directory, '{}.sqlite'.format(host))
+                # Autocommit mode to avoid holding locks between statements.
+                connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+                # Losing the most recent entries on a crash is harmless for a cache
+                # and avoids a sync per write.
+                connection.execute('PRAGMA synchronous = OFF')
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+
+                # Entries that have not been updated for the CacheManager prune
+                # period will never be considered fresh again.
+                self.prune(connection, time() - CacheManager.PRUNE_TTL)
+
+                self.connections[host] = connection
+
+            yield connection
+
+    def get(self, url, project, ttl):
+        with self.connection(url) as connection:
+            row = connection.execute('SELECT mtime, data FROM cache WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None, 'does not exist'
+        if time() - row[0] <= ttl:
+            return BytesIO(row[1]), None
+        return None, 'expired'
+
+    def put(self, url, project, text):
+        now = time()
+        with self.connection(url) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                exists = connection.execute('SELECT 1 FROM cache WHERE url = ?', (url,)).fetchone()
+                connection.execute('INSERT OR REPLACE INTO cache (url, project, mtime, data) VALUES (?, ?, ?, ?)',
+                                   (url, project, now, sqlite3.Binary(text)))
+                if project and not exists:
+                    connection.execute('INSERT OR REPLACE INTO project (name, mtime) VALUES (?, ?)', (project, now))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def delete(self, url, project):
+        with self.connection(url) as connection:
+            cursor = connection.execute('DELETE FROM cache WHERE url = ?', (url,))
+            return cursor.rowcount > 0
+
+    def project_age(self, apiurl, project):
+        with self.connection(apiurl) as connection:
+            row = connection.execute('SELECT mtime FROM project WHERE name = ?', (project,)).fetchone()
+        return time() - row[0] if row else 0
+
+    def delete_project(self, apiurl, project):
+        with self.connection(apiurl) as connection:
+            connection.execute('DELETE FROM project WHERE name = ?', (project,))
+            cursor = connection.execute('DELETE FROM cache WHERE project = ?', (project,))
+            return cursor.rowcount > 0
+
+    def delete_all(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections = {}
+
+        if os.path.exists(self.directory):
+            rmtree_nfs_safe(self.directory)
+
+    @staticmethod
+    def prune(connection, before):
+        connection.execute('DELETE FROM cache WHERE mtime < ?', (before,))
+        connection.execute('DELETE FROM project WHERE mtime < ?', (before,))
+
+
 class Cache(object):
     """
     Provide a cache implementation for osc.core.http_request().
@@ -60,9 +239,18 @@ class Cache(object):
 
     Any paths without a project context will be cleared when updated using this
     cache, but obviously not for other contributors.
+
+    The storage backend is selected via $OSRT_CACHE_BACKEND and defaults to
+    BACKEND. The directory backend stores a file per url while the sqlite
+    backend stores a single indexed file per apiurl.
     """
 
     CACHE_DIR = None
+    BACKEND = 'directory'
+    BACKENDS = {
+        'directory': CacheBackendDirectory,
+        'sqlite': CacheBackendSqlite,
+    }
     TTL_LONG = 12 * 60 * 60
     TTL_MEDIUM = 30 * 60
     TTL_SHORT = 5 * 60
@@ -99,7 +287,16 @@ class Cache(object):
         r'/source/([^/]+)/(?:[^/?]+)(?:\?[^/]+)?$': TTL_DUPLICATE,
     }
 
+    CLASSIFIED_MAX = 10000
+    LAST_UPDATED_LIMIT = 5000
+    LAST_UPDATED_INCREMENTAL = 50
+
     last_updated = {}
+    backend = None
+    patterns = []
+    dispatcher = None
+    dispatch = {}
+    classified = {}
 
     @staticmethod
     def init(directory='main'):
@@ -110,7 +307,14 @@ class Cache(object):
 
         Cache.CACHE_DIR = CacheManager.directory('request', directory)
 
+        backend = os.environ.get('OSRT_CACHE_BACKEND', Cache.BACKEND)
+        if backend not in Cache.BACKENDS:
+            raise Exception('Unknown cache backend {} (choose from {})'.format(
+                backend, ', '.join(sorted(Cache.BACKENDS))))
+        Cache.backend = Cache.BACKENDS[backend](Cache.CACHE_DIR)
+
         Cache.patterns = []
+        Cache.dispatcher_compile()
 
         if str2bool(os.environ.get('OSRT_DISABLE_CACHE', '')):
             if conf.config['debug']:
@@ -119,6 +323,7 @@ class Cache(object):
 
         for pattern in Cache.PATTERNS:
             Cache.patterns.append(re.compile(pattern))
+        Cache.dispatcher_compile()
 
         # Replace http_request with wrapper function which needs a stored
         # version of the original function to call.
@@ -128,16 +333,14 @@ class Cache(object):
 
     @staticmethod
     def get(url):
-        url = unquote(url)
-        match, project = Cache.match(url)
+        url, apiurl, match, project = Cache.classify(url)
         if match:
-            path = Cache.path(url, project, include_file=True)
+            elapsed = CacheStats.timer()
             ttl = Cache.PATTERNS[match]
 
             if project:
                 # Given project context check to see if project has been updated
                 # remotely more recently than local cache.
-                apiurl, _ = Cache.spliturl(url)
                 Cache.last_updated_load(apiurl)
 
                 # Use the project last updated timestamp if availabe, otherwise
@@ -154,10 +357,7 @@ class Cache(object):
 
                 # Treat non-existant cache as brand new for the sake of history
                 # span check since it behaves as desired.
-                age = 0
-                directory = Cache.path(url, project)
-                if os.path.exists(directory):
-                    age = time() - os.path.getmtime(directory)
+                age = Cache.backend.project_age(apiurl, project)
 
                 # If history span is shorter than allowed cache life and the age
                 # of the current cache is older than history span with no
@@ -171,23 +371,23 @@ class Cache(object):
                 if history_span < ttl_delta and age_delta > history_span:
                     Cache.delete_project(apiurl, project)
 
-            if os.path.exists(path) and time() - os.path.getmtime(path) <= ttl:
+            data, reason = Cache.backend.get(url, project, ttl)
+            if data:
+                CacheStats.record('http', match, hits=1, hit_seconds=elapsed())
                 if conf.config['debug']:
                     print('CACHE_GET', url, file=sys.stderr)
-                return urlopen('file://' + path)
+                return data
             else:
-                reason = '(' + ('expired' if os.path.exists(path) else 'does not exist') + ')'
+                CacheStats.record('http', match, misses=1, expired=int(reason == 'expired'))
                 if conf.config['debug']:
-                    print('CACHE_MISS', url, reason, file=sys.stderr)
+                    print('CACHE_MISS', url, '(' + reason + ')', file=sys.stderr)
 
         return None
 
     @staticmethod
     def put(url, data):
-        url = unquote(url)
-        match, project = Cache.match(url)
+        url, _, match, project = Cache.classify(url)
         if match:
-            path = Cache.path(url, project, include_file=True, makedirs=True)
             ttl = Cache.PATTERNS[match]
             if ttl == 0:
                 return data
@@ -201,32 +401,27 @@ class Cache(object):
 
             if conf.config['debug']:
                 print('CACHE_PUT', url, project, file=sys.stderr)
-            f = open(path, 'wb')
-            f.write(text)
-            f.close()
+            Cache.backend.put(url, project, text)
+            CacheStats.record('http', match, bytes=len(text))
 
         return data
 
     @staticmethod
     def delete(url):
-        url = unquote(url)
-        match, project = Cache.match(url)
+        url, apiurl, match, project = Cache.classify(url)
         if match:
-            path = Cache.path(url, project, include_file=True)
-
             # Rather then wait for last updated statistics to expire, remove the
             # project cache if applicable.
             if project:
-                apiurl, _ = Cache.spliturl(url)
+                target_project = project
                 if project.isdigit():
                     # Clear target project cache upon request acceptance.
-                    project = osc.core.get_request(apiurl, project).actions[0].tgt_project
-                Cache.delete_project(apiurl, project)
+                    target_project = osc.core.get_request(apiurl, project).actions[0].tgt_project
+                Cache.delete_project(apiurl, target_project)
 
-            if os.path.exists(path):
+            if Cache.backend.delete(url, project):
                 if conf.config['debug']:
                     print('CACHE_DELETE', url, file=sys.stderr)
-                os.remove(path)
 
         # Also delete version without query. This does not handle other
         # variations using different query strings. Handy for PUT with ?force=1.
@@ -237,28 +432,69 @@ class Cache(object):
 
     @staticmethod
     def delete_project(apiurl, project):
-        path = Cache.path(apiurl, project)
-
-        if os.path.exists(path):
+        if Cache.backend.delete_project(apiurl, project):
             if conf.config['debug']:
                 print('CACHE_DELETE_PROJECT', apiurl, project, file=sys.stderr)
-            rmtree_nfs_safe(path)
 
     @staticmethod
     def delete_all():
-        if os.path.exists(Cache.CACHE_DIR):
+        if Cache.backend:
+            Cache.backend.delete_all()
+        elif Cache.CACHE_DIR and os.path.exists(Cache.CACHE_DIR):
             rmtree_nfs_safe(Cache.CACHE_DIR)
 
     @staticmethod
     def match(url):
         apiurl, path = Cache.spliturl(url)
-        for pattern in Cache.patterns:
-            match = pattern.match(path)
+        if Cache.dispatcher:
+            match = Cache.dispatcher.match(path)
             if match:
-                return (pattern.pattern,
-                        match.group(1) if len(match.groups()) > 0 else None)
+                # The outer group of the matching alternative closes last.
+                pattern, group = Cache.dispatch[match.lastgroup]
+                return (pattern, match.group(group) if group else None)
         return (False, None)
 
+    @staticmethod
+    def classify(url):
+        """
+        Unquote and match url against patterns, memoized since the same url is
+        typically classified by get() and put() and requested repeatedly.
+
+        :return: (url, apiurl, match, project)
+        """
+        classification = Cache.classified.get(url)
+        if classification is None:
+            url_unquoted = unquote(url)
+            apiurl, _ = Cache.spliturl(url_unquoted)
+            classification = (url_unquoted, apiurl) + Cache.match(url_unquoted)
+
+            if len(Cache.classified) >= Cache.CLASSIFIED_MAX:
+                Cache.classified.clear()
+            Cache.classified[url] = classification
+
+        return classification
+
+    @staticmethod
+    def dispatcher_compile():
+        """
+        Combine patterns into a single alternation so that matching is one pass.
+
+        Each pattern is wrapped in a named group to identify which alternative
+        matched and the group index of its project capture, if any, is recorded.
+        Alternatives are tried in order so the first matching pattern still wins.
+        """
+        alternatives = []
+        Cache.dispatch = {}
+        Cache.classified = {}
+        group = 1
+        for i, pattern in enumerate(Cache.patterns):
+            name = 'p{}'.format(i)
+            alternatives.append('(?P<{}>{})'.format(name, pattern.pattern))
+            Cache.dispatch[name] = (pattern.pattern, group + 1 if pattern.groups else None)
+            group += 1 + pattern.groups
+
+        Cache.dispatcher = re.compile('|'.join(alternatives)) if alternatives else None
+
     @staticmethod
     def spliturl(url):
         o = urlsplit(url)
@@ -294,15 +530,116 @@ class Cache(object):
         if apiurl in Cache.last_updated:
             return
 
-        url = osc.core.makeurl(apiurl, ['statistics', 'latest_updated'], {'limit': 5000})
-        root = ET.parse(osc.core.http_GET(url)).getroot()
+        # Start from the index persisted by a prior process and catch up on the
+        # changes since instead of parsing the full list on every start.
+        last_updated = Cache.last_updated_read(apiurl)
+        if last_updated:
+            Cache.last_updated[apiurl] = last_updated
+            Cache.last_updated_refresh(apiurl)
+            return
+
+        Cache.last_updated_reload(apiurl)
+
+    @staticmethod
+    def last_updated_reload(apiurl):
+        entries = Cache.last_updated_fetch(apiurl, Cache.LAST_UPDATED_LIMIT)
         last_updated = {}
+        for name, updated in entries:
+            if name not in last_updated:
+                last_updated[name] = updated
+
+        # Keep track of the first and last entry to indicate the covered timespan.
+        last_updated['__newest'] = entries[0][1]
+        last_updated['__oldest'] = entries[-1][1]
+        Cache.last_updated[apiurl] = last_updated
+        Cache.last_updated_write(apiurl)
+
+    @staticmethod
+    def last_updated_refresh(apiurl=None):
+        """
+        Merge in changes made since the newest known entry.
+
+        The latest_updated route only supports a limit so progressively larger
+        windows are requested until one overlaps the newest known entry, at
+        which point all newer entries are known to be contained. If no window
+        within the limit overlaps a full reload is performed.
+
+        Intended to be called between cycles of long-running processes. Without
+        an apiurl all loaded apiurls are refreshed.
+        """
+        if apiurl is None:
+            for apiurl in list(Cache.last_updated):
+                Cache.last_updated_refresh(apiurl)
+            return
+
+        last_updated = Cache.last_updated.get(apiurl)
+        if not last_updated or '__newest' not in last_updated:
+            Cache.last_updated_reload(apiurl)
+            return
+
+        newest = last_updated['__newest']
+        limit = Cache.LAST_UPDATED_INCREMENTAL
+        while limit < Cache.LAST_UPDATED_LIMIT:
+            entries = Cache.last_updated_fetch(apiurl, limit)
+            if len(entries) < limit or entries[-1][1] <= newest:
+                for name, updated in entries:
+                    if updated > last_updated.get(name, ''):
+                        last_updated[name] = updated
+                if len(entries):
+                    last_updated['__newest'] = max(newest, entries[0][1])
+
+                if conf.config['debug']:
+                    print('CACHE_LAST_UPDATED_REFRESH', apiurl, newest, len(entries), file=sys.stderr)
+                Cache.last_updated_write(apiurl)
+                return
+
+            limit *= 10
+
+        Cache.last_updated_reload(apiurl)
+
+    @staticmethod
+    def last_updated_fetch(apiurl, limit):
+        """
+        :return: list of (project, updated) tuples ordered newest first
+        """
+        url = osc.core.makeurl(apiurl, ['statistics', 'latest_updated'], {'limit': limit})
+        root = ET.parse(osc.core.http_GET(url)).getroot()
+        entries = []
         for entity in root:
             # Entities repesent either a project or package.
             key = 'name' if entity.tag == 'project' else 'project'
-            if entity.attrib[key] not in last_updated:
-                last_updated[entity.attrib[key]] = entity.attrib['updated']
+            entries.append((entity.attrib[key], entity.attrib['updated']))
+        return entries
 
-        # Keep track of the last entry to indicate the covered timespan.
-        last_updated['__oldest'] = entity.attrib['updated']
-        Cache.last_updated[apiurl] = last_updated
+    @staticmethod
+    def last_updated_path(apiurl):
+        return os.path.join(Cache.CACHE_DIR, '{}.last_updated.json'.format(urlsplit(apiurl).hostname))
+
+    @staticmethod
+    def last_updated_read(apiurl):
+        path = Cache.last_updated_path(apiurl)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                last_updated = json.load(f)
+        except ValueError:
+            return None
+
+        if '__newest' not in last_updated or '__oldest' not in last_updated:
+            return None
+
+        return last_updated
+
+    @staticmethod
+    def last_updated_write(apiurl):
+        path = Cache.last_updated_path(apiurl)
+        if not os.path.exists(Cache.CACHE_DIR):
+            os.makedirs(Cache.CACHE_DIR)
+
+        # Write atomically since other processes may be reading.
+        path_temp = '{}.{}'.format(path, os.getpid())
+        with open(path_temp, 'w') as f:
+            json.dump(Cache.last_updated[apiurl], f)
+        os.replace(path_temp, path)
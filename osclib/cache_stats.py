@@ -0,0 +1,140 @@
+import atexit
+import json
+import os
+import sys
+from time import time
+
+# Provide a registry into which the variety of caches report their effectiveness
+# so that TTLs and sizes can be tuned from data rather than guesswork. Entries
+# are keyed by cache name and a cache specific key, such as the URL pattern for
+# the HTTP cache or the function name for memoize.
+#
+# Statistics are written at exit when either of the following are set:
+#   $OSRT_CACHE_STATS: path to write JSON or - for stderr. The path may contain
+#                      {tool} and {pid} placeholders.
+#   $OSRT_CACHE_STATS_INFLUX: InfluxDB DSN (ex. influxdb://localhost:8086/osrt_telegraf)
+
+
+class CacheStats(object):
+    FIELDS = ['hits', 'misses', 'expired', 'evictions', 'bytes', 'hit_seconds', 'miss_seconds']
+
+    stats = {}
+    registered = False
+
+    @staticmethod
+    def record(cache, key, **fields):
+        """
+        Increment fields of the entry for cache and key.
+
+        Expirations are also counted as misses by the caller while seconds are
+        the time spent serving hits or on the work performed due to a miss.
+        """
+        entry = CacheStats.stats.get((cache, key))
+        if entry is None:
+            entry = CacheStats.stats[(cache, key)] = dict.fromkeys(CacheStats.FIELDS, 0)
+            CacheStats.register()
+
+        for field, value in fields.items():
+            entry[field] += value
+
+    @staticmethod
+    def timer():
+        """Return function that returns seconds elapsed since timer() was called."""
+        start = time()
+        return lambda: time() - start
+
+    @staticmethod
+    def entries(cache=None):
+        for (entry_cache, key), entry in sorted(CacheStats.stats.items()):
+            if cache and entry_cache != cache:
+                continue
+            yield entry_cache, key, entry
+
+    @staticmethod
+    def report():
+        """
+        Summarize all entries including an estimate of time saved.
+
+        Each hit is assumed to have saved the average time spent on a miss less
+        the time spent serving the hit.
+        """
+        report = []
+        for cache, key, entry in CacheStats.entries():
+            summary = {'cache': cache, 'key': key}
+            summary.update(entry)
+
+            saved = 0
+            if entry['misses']:
+                saved = entry['hits'] * entry['miss_seconds'] / entry['misses'] - entry['hit_seconds']
+            summary['saved_seconds'] = saved
+            report.append(summary)
+
+        return report
+
+    @staticmethod
+    def tool():
+        return os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+
+    @staticmethod
+    def dump(path):
+        data = {
+            'tool': CacheStats.tool(),
+            'pid': os.getpid(),
+            'time': int(time()),
+            'stats': CacheStats.report(),
+        }
+
+        if path == '-':
+            json.dump(data, sys.stderr, indent=2)
+            print(file=sys.stderr)
+            return
+
+        path = path.format(tool=data['tool'], pid=data['pid'])
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    @staticmethod
+    def influx_write(dsn):
+        # Only required when writing statistics and not by all tools.
+        from influxdb import InfluxDBClient
+
+        tool = CacheStats.tool()
+        points = []
+        for summary in CacheStats.report():
+            points.append({
+                'measurement': 'cache',
+                'tags': {
+                    'tool': tool,
+                    'cache': summary.pop('cache'),
+                    'key': summary.pop('key'),
+                },
+                'fields': summary,
+            })
+
+        client = InfluxDBClient.from_dsn(dsn)
+        client.write_points(points)
+
+    @staticmethod
+    def exit():
+        if not CacheStats.stats:
+            return
+
+        path = os.environ.get('OSRT_CACHE_STATS')
+        if path:
+            CacheStats.dump(path)
+
+        dsn = os.environ.get('OSRT_CACHE_STATS_INFLUX')
+        if dsn:
+            try:
+                CacheStats.influx_write(dsn)
+            except Exception as e:
+                print('unable to write cache statistics to influx: {}'.format(e), file=sys.stderr)
+
+    @staticmethod
+    def register():
+        if CacheStats.registered:
+            return
+        CacheStats.registered = True
+
+        if os.environ.get('OSRT_CACHE_STATS') or os.environ.get('OSRT_CACHE_STATS_INFLUX'):
+            atexit.register(CacheStats.exit)
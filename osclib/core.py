@@ -27,6 +27,7 @@ from osc.core import xpath_join
 from osc.util.helper import decode_it
 from osc import conf
 from osclib.conf import Config
+from osclib.fetch import fetch
 from osclib.memoize import memoize
 import traceback
 
@@ -301,12 +302,17 @@ def project_locked(apiurl, project):
 def fileinfo_ext_all(apiurl, project, repo, arch, package):
     url = makeurl(apiurl, ['build', project, repo, arch, package])
     binaries = ET.parse(http_GET(url)).getroot()
+    urls = []
     for binary in binaries.findall('binary'):
         filename = binary.get('filename')
         if not filename.endswith('.rpm'):
             continue
 
-        yield fileinfo_ext(apiurl, project, repo, arch, package, filename)
+        urls.append(makeurl(apiurl,
+                            ['build', project, repo, arch, package, filename],
+                            {'view': 'fileinfo_ext'}))
+
+    yield from fetch(urls)
 
 
 def fileinfo_ext(apiurl, project, repo, arch, package, filename):
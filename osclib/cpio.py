@@ -1,68 +1,189 @@
 #!/usr/bin/python3
 
-import struct
+import io
+import os
+import stat
+
+# Size of buffer used to copy or skip member contents when they can not be
+# transferred within the kernel.
+BUFSIZE = 1024 * 1024
+
+HEADER_LENGTH = 110
+MAGIC = (b'070701', b'070702')
+TRAILER = 'TRAILER!!!'
 
 
 class Cpio(object):
-    def __init__(self, buf):
-        self.buf = buf
-        self.off = 0
+    """Read a newc (SVR4) cpio archive sequentially from a stream.
+
+    The archive is never buffered as a whole so it may be consumed directly
+    from the output of rpm2cpio. Contents of members not read by the time the
+    next member is requested are skipped.
+
+    When given an unbuffered file object (ie. a pipe from subprocess.Popen()
+    with bufsize=0 or open(..., buffering=0)) CpioFile.copy() moves contents
+    within the kernel via splice() or copy_file_range() where supported.
+    """
+
+    def __init__(self, fh):
+        if isinstance(fh, (bytes, bytearray, memoryview)):
+            fh = io.BytesIO(fh)
+        self.fh = fh
+        self.current = None
+        self.buffer = None
 
     def __iter__(self):
         return self
 
-    def next(self):
-        f = CpioFile(self.off, self.buf)
+    def __next__(self):
+        if self.current is not None:
+            self.current.skip()
+            self.current = None
+
+        header = self.read_exact(HEADER_LENGTH)
+        if header[:6] not in MAGIC:
+            raise Exception('invalid cpio header {}'.format(header[:6]))
+
+        f = CpioFile(self, header)
+        name = self.read_exact(f.c_namesize + padding(HEADER_LENGTH + f.c_namesize))
+        f.name = name[:f.c_namesize - 1].decode('utf-8', 'surrogateescape')
         if f.fin():
             raise StopIteration
-        self.off = self.off + f.length()
-        return f
 
+        self.current = f
+        return f
 
-class CpioFile(object):
-    def __init__(self, off, buf):
-        self.off = off
-        self.buf = buf
-
-        if (off & 3):
-            raise Exception("invalid offset %d" % off)
+    def read_exact(self, size):
+        data = self.fh.read(size)
+        # Unbuffered streams may return less than requested.
+        while len(data) < size:
+            chunk = self.fh.read(size - len(data))
+            if not chunk:
+                raise EOFError('truncated cpio archive')
+            data += chunk
+        return data
+
+    def skip(self, size):
+        if not size:
+            return
+
+        if self.fh.seekable():
+            self.fh.seek(size, os.SEEK_CUR)
+            return
+
+        with open(os.devnull, 'wb') as devnull:
+            self.copy(devnull, size)
+
+    def copy(self, fh, size):
+        """Copy size bytes from the archive to file object fh."""
+        fh.flush()
+        size = self.copy_kernel(fh, size)
+        if not size:
+            return
+
+        if self.buffer is None:
+            self.buffer = bytearray(BUFSIZE)
+        view = memoryview(self.buffer)
+        while size:
+            count = self.fh.readinto(view[:min(size, BUFSIZE)])
+            if not count:
+                raise EOFError('truncated cpio archive')
+            fh.write(view[:count])
+            size -= count
+
+    def copy_kernel(self, fh, size):
+        """Copy as much as possible of size bytes without passing through userspace.
+
+        Returns the number of bytes left to copy.
+        """
+        source = raw_fileno(self.fh)
+        if source is None or not hasattr(fh, 'fileno'):
+            return size
+
+        mode = os.fstat(source).st_mode
+        if stat.S_ISFIFO(mode) and hasattr(os, 'splice'):
+            transfer = os.splice
+        elif stat.S_ISREG(mode) and hasattr(os, 'copy_file_range'):
+            transfer = os.copy_file_range
+        else:
+            return size
+
+        destination = fh.fileno()
+        try:
+            while size:
+                count = transfer(source, destination, min(size, BUFSIZE))
+                if not count:
+                    raise EOFError('truncated cpio archive')
+                size -= count
+        except OSError:
+            # Not supported for the given files (ie. copy_file_range() across
+            # file systems on older kernels) so copy the remainder instead.
+            pass
+
+        return size
 
-        fmt = "6s8s8s8s8s8s8s8s8s8s8s8s8s8s"
-        off = self.off + struct.calcsize(fmt)
 
-        fields = struct.unpack(fmt, buf[self.off:off])
+class CpioFile(object):
+    """Member of a Cpio archive whose contents may be read only once."""
 
-        if fields[0] != "070701":
-            raise Exception("invalid cpio header %s" % self.c_magic)
+    NAMES = ('c_ino', 'c_mode', 'c_uid', 'c_gid',
+             'c_nlink', 'c_mtime', 'c_filesize',
+             'c_devmajor', 'c_devminor', 'c_rdevmajor',
+             'c_rdevminor', 'c_namesize', 'c_check')
 
-        names = ("c_ino", "c_mode", "c_uid", "c_gid",
-                 "c_nlink", "c_mtime", "c_filesize",
-                 "c_devmajor", "c_devminor", "c_rdevmajor",
-                 "c_rdevminor", "c_namesize", "c_check")
-        for (n, v) in zip(names, fields[1:]):
-            setattr(self, n, int(v, 16))
+    def __init__(self, cpio, header):
+        self.cpio = cpio
+        for i, name in enumerate(self.NAMES):
+            setattr(self, name, int(header[6 + i * 8:14 + i * 8], 16))
 
-        nlen = self.c_namesize - 1
-        self.name = struct.unpack('%ds' % nlen, buf[off:off + nlen])[0]
-        off = off + nlen + 1
-        if (off & 3):
-            off = off + 4 - (off & 3)   # padding
-        self.payloadstart = off
+        self.name = None
+        self.remaining = self.c_filesize
+        self.padding = padding(self.c_filesize)
 
     def fin(self):
-        return self.name == 'TRAILER!!!'
+        return self.name == TRAILER
 
     def __str__(self):
-        return "[%s %d]" % (self.name, self.c_filesize)
+        return '[{} {}]'.format(self.name, self.c_filesize)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.cpio.read_exact(size)
+        self.consumed(size)
+        return data
 
     def header(self):
-        return self.buf[self.payloadstart:self.payloadstart + self.c_filesize]
+        """Return the whole contents (ie. rpm header in view=cpioheaders)."""
+        return self.read()
+
+    def copy(self, fh):
+        """Write the remaining contents to file object fh."""
+        size = self.remaining
+        self.cpio.copy(fh, size)
+        self.consumed(size)
+
+    def skip(self):
+        size = self.remaining
+        self.cpio.skip(size + self.padding)
+        self.remaining = self.padding = 0
+
+    def consumed(self, size):
+        self.remaining -= size
+        if not self.remaining and self.padding:
+            self.cpio.read_exact(self.padding)
+            self.padding = 0
+
+
+def padding(offset):
+    return (4 - (offset % 4)) % 4
+
 
-    def length(self):
-        len = self.payloadstart - self.off + self.c_filesize
-        if (self.c_filesize & 3):
-            len = len + 4 - (self.c_filesize & 3)
-        return len
+def raw_fileno(fh):
+    # Only safe to bypass file objects which do not buffer themselves.
+    if not isinstance(fh, io.FileIO):
+        return None
+    return fh.fileno()
 
 
 if __name__ == '__main__':
@@ -75,10 +196,9 @@ if __name__ == '__main__':
     (options, args) = parser.parse_args()
 
     for fn in args:
-        fh = open(fn, 'rb')
-        cpio = Cpio(fh.read())
-        for i in cpio:
-            print(i)
-            ofh = open(i.name, 'wb')
-            ofh.write(i.header())
-            ofh.close()
+        with open(fn, 'rb', buffering=0) as fh:
+            for i in Cpio(fh):
+                print(i)
+                if stat.S_ISREG(i.c_mode):
+                    with open(os.path.basename(i.name), 'wb') as ofh:
+                        i.copy(ofh)
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import socket
+import time
+from urllib.error import HTTPError
+from urllib.error import URLError
+
+from lxml import etree as ET
+import osc.core
+
+# Default number of requests, and thus connections, made concurrently.
+FETCH_CONCURRENCY = 8
+# Default number of retries of a request, waiting up to half a minute in total.
+FETCH_RETRIES = 7
+RETRY_SLEEP_MAX = 60
+
+logger = logging.getLogger()
+
+
+def retried_GET(url, retries=FETCH_RETRIES):
+    """
+    Perform GET request retrying on server errors, service in progress, and
+    timeouts with increasing delay in the same manner as StagingAPI.
+
+    Requests go through osc.core.http_GET() and thus osclib.cache.Cache when
+    initialized.
+
+    :param retries: maximum number of retries or None for no limit
+    """
+    retry_sleep_seconds = 1
+    attempt = 0
+    while True:
+        try:
+            return osc.core.http_GET(url)
+        except HTTPError as e:
+            if not (500 <= e.code <= 599 or (e.code == 400 and e.reason == 'service in progress')):
+                raise e
+            error = e
+            reason = e.code
+        except URLError as e:
+            if not isinstance(e.reason, (TimeoutError, socket.timeout)):
+                raise e
+            error = e
+            reason = 'timeout'
+
+        attempt += 1
+        if retries is not None and attempt > retries:
+            raise error
+
+        logger.warning('Error {}, retrying {} in {}s'.format(reason, url, retry_sleep_seconds))
+        time.sleep(retry_sleep_seconds)
+        # Increase sleep time up to one minute to avoid hammering the server
+        # in case of real problems.
+        if retry_sleep_seconds < RETRY_SLEEP_MAX:
+            retry_sleep_seconds += 1
+
+
+def fetch(urls, concurrency=FETCH_CONCURRENCY, parse=True, ignore=(), retries=FETCH_RETRIES):
+    """
+    Fetch a batch of urls concurrently.
+
+    Requests are performed by a bounded pool of worker threads, which limits
+    the number of simultaneous connections, and use the same transport as
+    osc.core.http_GET() so authentication, connection reuse (where provided by
+    osc), and cache hits from osclib.cache.Cache apply. Each request is retried
+    as with retried_GET().
+
+    :param concurrency: maximum number of requests in flight
+    :param parse: return parsed lxml roots instead of response bodies
+    :param ignore: HTTP error codes for which None is returned instead of raising
+    :param retries: maximum number of retries per request or None for no limit
+    :return: list of results in the same order as urls
+    """
+    def fetch_one(url):
+        try:
+            response = retried_GET(url, retries)
+        except HTTPError as e:
+            if e.code in ignore:
+                return None
+            raise e
+
+        if parse:
+            return ET.parse(response).getroot()
+        return response.read()
+
+    urls = list(urls)
+    concurrency = min(concurrency, len(urls))
+    if concurrency <= 1:
+        return [fetch_one(url) for url in urls]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(fetch_one, urls))
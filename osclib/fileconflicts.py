@@ -0,0 +1,432 @@
+import gzip
+import re
+
+# In-process port of the findfileconflicts script which finds files provided by
+# more than one package in a susetags packages file. The same compact tables
+# are used: directories and "mode flags owner:group -> link" combinations are
+# interned into lists and files are keyed by "<directory index>/<name>" with the
+# value "<package>/<mode index>", where package is "name version release arch".
+
+DIRECTORY = 0o40000
+FILE = 0o100000
+SYMLINK = 0o120000
+GHOST = 0o100
+
+FTYPES = {
+    0o01: 'p',
+    0o02: 'c',
+    0o04: 'd',
+    0o06: 'b',
+    0o10: '-',
+    0o12: 'l',
+    0o14: 's',
+}
+
+PACKAGES_IGNORED_RE = re.compile(r'^(glibc-usrmerge-bootstrap-helper|bash-legacybin) ')
+USRMERGE_RE = re.compile(r'^120777 0 root:root (/(?:s?bin|lib(?:64)?)) -> /?usr(/(?:s?bin|lib(?:64)?))$')
+USRMERGE_DIRECTORY_RE = re.compile(r'^/(?:s?bin|lib(?:64)?)')
+LINK_RE = re.compile(r'^(12.*)( -> .*?)$')
+FILE_RE = re.compile(r'^(\d+ (\d+) \S+) (.*/)(.*?)$')
+FLAG_RE = re.compile(r'^(\d+ )(\d+)')
+DIRECTORY_PARENT_RE = re.compile(r'^(.*/)(.*?)/$')
+FILE_KEY_RE = re.compile(r'^(\d+)/(.*)')
+IGNORED_RE = re.compile(r'/etc/uefi/certs/.*crt')
+
+
+def octal(string):
+    # Leading octal digits as with perl oct().
+    return int(re.match(r'\d*', string).group(0) or '0', 8)
+
+
+class FileConflicts(object):
+    def __init__(self):
+        # directory path -> index into directories
+        self.directory_index = {'/': 0}
+        self.directories = ['/']
+        # "mode flags owner:group -> link" -> index into modes
+        self.mode_index = {'40755 0 root:root': 0}
+        self.modes = ['40755 0 root:root']
+        self.modes_type = [DIRECTORY]
+        self.modes_ghost = [0]
+        # "<directory index>/<name>" -> "<package>/<mode index>"
+        self.files = {}
+        # same key as files -> list of all "<package>/<mode index>"
+        self.filesc = {}
+
+        self.usrmerge = False
+        self.conflicts = {}
+        self.obsoletes = {}
+        self.whatprovides = {}
+
+    def directory(self, path):
+        n = self.directory_index.get(path)
+        if n is None:
+            n = len(self.directories)
+            self.directory_index[path] = n
+            self.directories.append(path)
+        return n
+
+    def file_add(self, package, line):
+        if PACKAGES_IGNORED_RE.match(package):
+            return
+        if package.startswith('filesystem '):
+            match = USRMERGE_RE.match(line)
+            if match and match.group(1) == match.group(2):
+                self.usrmerge = True
+
+        # 120777 0 root:root /usr/bin/foo -> /usr/sbin/bar
+        link = ''
+        match = LINK_RE.match(line)
+        if match:
+            line, link = match.groups()
+
+        # 120777 0 root:root /usr/bin/foo
+        match = FILE_RE.match(line)
+        if not match:
+            return
+        perms = match.group(1)
+        flag = octal(match.group(2))
+        n = self.directory(match.group(3))
+
+        # special ghost handling
+        if flag & GHOST:
+            # ghost directories must not conflict due to file flag mismatch
+            if octal(perms) & 0o7770000 == DIRECTORY:
+                flag ^= GHOST
+                perms = FLAG_RE.sub(lambda m: m.group(1) + '{:o}'.format(flag), perms, count=1)
+            # ignore link target
+            link = ''
+            # pretend a ghost file has normal mode
+            if perms.startswith('100000'):
+                perms = '100644' + perms[6:]
+
+        key = perms + link
+        m = self.mode_index.get(key)
+        if m is None:
+            m = len(self.modes)
+            self.mode_index[key] = m
+            self.modes.append(key)
+            self.modes_type.append(octal(perms) & 0o7770000)
+            self.modes_ghost.append(flag & GHOST)
+
+        f = '{}/{}'.format(n, match.group(4))
+        value = '{}/{}'.format(package, m)
+        if f in self.files:
+            if not self.filesc.get(f):
+                self.filesc[f] = [self.files[f]]
+            self.filesc[f].append(value)
+        else:
+            self.files[f] = value
+
+    def parse(self, lines):
+        package = ''
+        section = None
+        for line in lines:
+            line = line.rstrip('\n')
+            if section:
+                if line == '-' + section + ':':
+                    section = None
+                    continue
+
+                if section == 'Flx':
+                    self.file_add(package, line)
+                    continue
+
+                # no version stuff
+                name = line.split(' ', 1)[0]
+                if section == 'Prv':
+                    self.whatprovides.setdefault(name, []).append(package)
+                elif section == 'Con':
+                    if name.startswith('otherproviders(') and name.endswith(')'):
+                        name = name[len('otherproviders('):-1]
+                    self.conflicts.setdefault(package, []).append(name)
+                else:
+                    self.obsoletes.setdefault(package, []).append(name)
+                continue
+
+            if line.startswith('=Pkg: '):
+                package = line[len('=Pkg: '):]
+                self.obsoletes.setdefault(package, []).append(package.split(' ', 1)[0])
+            elif line in ('+Con:', '+Obs:', '+Prv:'):
+                if package:
+                    section = line[1:-1]
+            elif line == '+Flx:':
+                section = 'Flx'
+
+    def usrmerge_apply(self):
+        # Move files in /bin, /sbin, /lib, and /lib64 to their /usr counterpart.
+        for rn in range(len(self.directories)):
+            rd = self.directories[rn]
+            if not USRMERGE_DIRECTORY_RE.match(rd):
+                continue
+
+            d = '/usr' + rd
+            n = self.directory_index.get(d)
+            if n is None:
+                # no such directory in /usr so rename the existing one keeping the index
+                self.directory_index[d] = rn
+                del self.directory_index[rd]
+                self.directories[rn] = d
+                continue
+
+            prefix = '{}/'.format(rn)
+            for rf in [rf for rf in self.files if rf.startswith(prefix)]:
+                f = '{}{}'.format(n, rf[len(prefix) - 1:])
+                if self.files.get(f):
+                    # merge known conflicts of the / file into the /usr file
+                    if not self.filesc.get(f):
+                        self.filesc[f] = [self.files[f]]
+                    if self.filesc.get(rf):
+                        self.filesc[f].extend(self.filesc[rf])
+                    else:
+                        self.filesc[f].append(self.files[rf])
+                    self.filesc.pop(rf, None)
+                else:
+                    self.files[f] = self.files[rf]
+                del self.files[rf]
+                # entry cannot be removed without renumbering so mark it invalid
+                self.directories[rn] = '*** {} ***'.format(rd)
+
+    def mode(self, value):
+        return int(value.split('/', 1)[1])
+
+    def directories_connect(self):
+        """Add all parent directories and return files that are also directories."""
+        implicit_conflicts = []
+        # directories appended while iterating are visited as well
+        i = 0
+        while i < len(self.directories):
+            match = DIRECTORY_PARENT_RE.match(self.directories[i])
+            i += 1
+            if not match:
+                continue
+
+            n = self.directory_index.get(match.group(1))
+            if n is None:
+                self.directory(match.group(1))
+                continue
+
+            f = '{}/{}'.format(n, match.group(2))
+            if not self.files.get(f):
+                continue
+            if self.modes_type[self.mode(self.files[f])] == DIRECTORY:
+                continue
+            # conflict unless another package provides it as a directory
+            if any(self.modes_type[self.mode(value)] == DIRECTORY for value in self.filesc.get(f, [])):
+                continue
+            implicit_conflicts.append(f)
+
+        return implicit_conflicts
+
+    def implicit_conflicts_add(self, implicit_conflicts):
+        # Determine packages owning files within the implicit directories.
+        parents = {}
+        for directory in self.directories:
+            match = DIRECTORY_PARENT_RE.match(directory)
+            if match:
+                parents[self.directory_index.get(directory)] = self.directory_index.get(match.group(1))
+
+        baddir = {}
+        for f in implicit_conflicts:
+            n, x = f.split('/', 1)
+            baddir[self.directory_index.get(self.directories[int(n)] + x + '/')] = f
+
+        done = False
+        while not done:
+            done = True
+            for i, parent in sorted(parents.items(), key=lambda item: item[0] or 0):
+                if parent is None:
+                    continue
+                if baddir.get(parent) and not baddir.get(i):
+                    baddir[i] = baddir[parent]
+                    done = False
+
+        baddir_packages = {}
+        for f, value in self.files.items():
+            n = int(f.split('/', 1)[0])
+            if not baddir.get(n):
+                continue
+            for value in self.filesc.get(f) or [value]:
+                baddir_packages.setdefault(baddir[n], set()).add(value.split('/', 1)[0] + '/0')
+
+        for f in implicit_conflicts:
+            if not self.filesc.get(f):
+                self.filesc[f] = [self.files[f]]
+            packages = baddir_packages.get(f) or {'implicit_directory 0 0 noarch pkg/0'}
+            self.filesc[f].extend(sorted(packages))
+
+    def trivial_reduce(self):
+        # Drop conflicts between versions of the same package and directories.
+        for f in sorted(self.filesc):
+            allm = None
+            allc = True
+            name_first = None
+            package_last = None
+            for value in self.filesc[f]:
+                package, m = value.split('/', 1)
+                m = int(m)
+                name = package.split(' ', 1)[0]
+                if allm is None:
+                    allm = m
+                if allm != m:
+                    allm = -1
+                if name_first is None:
+                    name_first = name
+                if name_first != name:
+                    allc = False
+                if package_last and package == package_last:
+                    allc = False
+                package_last = package
+
+            if allc:
+                del self.filesc[f]
+            elif allm is not None and allm >= 0 and self.modes_type[allm] == DIRECTORY:
+                del self.filesc[f]
+
+    def conflicts_explicit(self, needed):
+        conflicts = set()
+
+        def add(p1, p2):
+            conflicts.add((p1, p2))
+            conflicts.add((p2, p1))
+
+        for package in sorted(self.conflicts):
+            if package not in needed:
+                continue
+            for c in self.conflicts[package]:
+                for p in self.whatprovides.get(c, []):
+                    if p != package:
+                        add(package, p)
+
+        for package in sorted(self.obsoletes):
+            if package not in needed:
+                continue
+            for c in self.obsoletes[package]:
+                for p in self.whatprovides.get(c, []):
+                    if p != package and p.startswith(c + ' '):
+                        add(package, p)
+
+        # let 32bit packages conflict with the i586 version
+        for package in sorted(needed):
+            match = re.match(r'^([^ ]+)-32bit ', package)
+            if not match:
+                continue
+            name = match.group(1)
+            i586_re = re.compile(r'^' + re.escape(name) + r' .* i[56]86$')
+            for p in self.whatprovides.get(name, []):
+                if p != package and i586_re.match(p):
+                    add(package, p)
+
+        return conflicts
+
+    def beautify_mode(self, m):
+        mode = self.modes[m].split(None, 2)
+        fm = octal(mode[0])
+        ft = FTYPES.get(fm >> 12 & 0o77, '?')
+        fm &= ~0o770000
+
+        flags = ''
+        rt = octal(mode[1])
+        for bit, char in ((0o2, 'd'), (0o1, 'c'), (0o10, 'm'), (0o20, 'n'), (0o100, 'g'), (0o200, 'l'), (0o400, 'r')):
+            if rt & bit:
+                flags += char
+        rt &= ~0o733
+        if rt:
+            flags += '{:o}'.format(rt)
+        if flags:
+            flags += ' '
+        return '{}{}{:03o} {}'.format(flags, ft, fm, mode[2] if len(mode) > 2 else '')
+
+    def pair_files(self, p1, p2, files):
+        found = []
+        prefixes = (p1 + '/', p2 + '/')
+        for f in files:
+            pp = []
+            for value in self.filesc[f]:
+                for prefix in prefixes:
+                    if value.startswith(prefix):
+                        pp.append(int(value[len(prefix):]))
+                        break
+            if not pp:
+                continue
+
+            modes = set(pp)
+            info = ''
+            if len(modes) == 1:
+                m = pp[0]
+                # no conflict if all directories, all ghosts, or all links of the same mode
+                if self.modes_type[m] in (DIRECTORY, SYMLINK) or self.modes_ghost[m] == GHOST:
+                    continue
+            else:
+                # don't report mode mismatches for files/symlinks that are not ghosts
+                for m in modes:
+                    if self.modes_type[m] not in (FILE, SYMLINK) or self.modes_ghost[m] == GHOST:
+                        info = ' [mode mismatch: {}]'.format(', '.join(self.beautify_mode(m) for m in pp))
+                        break
+
+            match = FILE_KEY_RE.match(f)
+            path = self.directories[int(match.group(1))] + match.group(2)
+            if not IGNORED_RE.search(path):
+                found.append(path + info)
+
+        return found
+
+    def check(self, skip=None):
+        if self.usrmerge:
+            self.usrmerge_apply()
+
+        implicit_conflicts = self.directories_connect()
+        if implicit_conflicts:
+            self.implicit_conflicts_add(implicit_conflicts)
+
+        # free memory
+        self.files = {}
+
+        self.trivial_reduce()
+
+        needed = set()
+        tocheck = {}
+        tocheck_files = {}
+        for f in sorted(self.filesc):
+            self.filesc[f] = sorted(self.filesc[f])
+            packages = [value.split('/', 1)[0] for value in self.filesc[f]]
+            needed.update(packages)
+            key = '\n'.join(packages)
+            tocheck.setdefault(key, packages)
+            tocheck_files.setdefault(key, []).append(f)
+
+        conflicts = self.conflicts_explicit(needed)
+
+        # check each package combination for all candidates
+        for key in sorted(tocheck):
+            packages = tocheck[key]
+            for i, p1 in enumerate(packages):
+                sp1 = p1.split()
+                for p2 in packages[i + 1:]:
+                    if (p1, p2) in conflicts:
+                        continue
+                    sp2 = p2.split()
+                    if skip and skip(sp1, sp2):
+                        continue
+
+                    files = self.pair_files(p1, p2, tocheck_files[key])
+                    if files:
+                        yield sp1[:4], sp2[:4], files
+
+
+def fileconflicts(path, skip=None):
+    """
+    Find file conflicts between packages in a susetags packages file.
+
+    Yields (package1, package2, files) for each conflicting pair of packages
+    in the same order as the findfileconflicts script where packages are
+    [name, version, release, arch] lists. Since finding the files in conflict
+    is most of the work, pairs for which skip(package1, package2) is true are
+    not considered at all.
+    """
+    detector = FileConflicts()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='surrogateescape') as f:
+        detector.parse(f)
+
+    yield from detector.check(skip)
@@ -1,68 +1,200 @@
+from contextlib import contextmanager
 from datetime import datetime
-import fcntl
 from functools import wraps
 import os
 from osclib.cache_manager import CacheManager
-import shelve
+from osclib.cache_stats import CacheStats
 import pickle
+import sqlite3
+import threading
+from time import time
 
 # Where the cache files are stored
 CACHEDIR = CacheManager.directory('memoize')
 
 
-def memoize(ttl=None, session=False, add_invalidate=False):
+class MemoizeStore(object):
+    """Persistent store for a memoized function backed by sqlite.
+
+    Each function is stored in its own database file with the timestamp kept in
+    an indexed column separate from the pickled value. Hits only require a
+    shared lock so concurrent processes reading the same cache do not serialize
+    and eviction of the oldest slots is a single indexed delete that never
+    unpickles values.
+
+    A single connection is shared by all threads of a process and serialized by
+    a lock rather than opening one per thread, which would leak a connection for
+    each short lived worker thread. The connection is never shared with forked
+    processes.
+
+    The number of rows is tracked per process instead of counted on each put
+    and only verified once it reaches the limit or every nclean puts, which
+    also picks up rows written by other processes.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS memoize (key BLOB PRIMARY KEY, timestamp REAL NOT NULL, value BLOB NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS memoize_timestamp ON memoize (timestamp)',
+    ]
+
+    def __init__(self, name, path, slots, nclean):
+        self.name = name
+        self.path = path
+        self.slots = slots
+        self.nclean = nclean
+        self._connection = None
+        self.pid = os.getpid()
+        self.lock = threading.RLock()
+        self.count = None
+        self.puts = 0
+
+    @contextmanager
+    def connection(self):
+        if self.pid != os.getpid():
+            # Forked: the lock may have been held by another thread of the parent
+            # and the connection of the parent must not be used.
+            self.pid = os.getpid()
+            self.lock = threading.RLock()
+            self._connection = None
+            self.count = None
+
+        with self.lock:
+            if self._connection is None:
+                # Autocommit mode to avoid holding locks between statements.
+                connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+                connection.execute('PRAGMA synchronous = OFF')
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+                self._connection = connection
+
+            yield self._connection
+
+    def get(self, key, ttl):
+        """Return (found, value) for key if stored within ttl seconds."""
+        with self.connection() as connection:
+            row = connection.execute(
+                'SELECT value FROM memoize WHERE key = ? AND timestamp > ?', (key, time() - ttl)).fetchone()
+        if row is None:
+            return False, None
+        return True, pickle.loads(row[0])
+
+    def put(self, key, value):
+        """Store value and return the number of slots evicted to make room."""
+        value = pickle.dumps(value, protocol=-1)
+        with self.connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                new = connection.execute('SELECT 1 FROM memoize WHERE key = ?', (key,)).fetchone() is None
+                connection.execute('INSERT OR REPLACE INTO memoize (key, timestamp, value) VALUES (?, ?, ?)',
+                                   (key, time(), sqlite3.Binary(value)))
+                if new and self.count is not None:
+                    self.count += 1
+                evicted = self.clean(connection)
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                self.count = None
+                raise
+
+        CacheStats.record('memoize', self.name, bytes=len(value))
+        return evicted
+
+    def clean(self, connection):
+        self.puts += 1
+        if self.count is None or self.count >= self.slots or self.puts >= self.nclean:
+            self.count = connection.execute('SELECT COUNT(*) FROM memoize').fetchone()[0]
+            self.puts = 0
+        if self.count < self.slots:
+            return 0
+
+        nclean = self.nclean + self.count - self.slots
+        connection.execute('DELETE FROM memoize WHERE key IN '
+                           '(SELECT key FROM memoize ORDER BY timestamp LIMIT ?)', (nclean,))
+        self.count -= nclean
+        return nclean
+
+    def delete(self, key):
+        with self.connection() as connection:
+            deleted = connection.execute('DELETE FROM memoize WHERE key = ?', (key,)).rowcount
+            if self.count is not None:
+                self.count -= deleted
+
+    def clear(self):
+        with self.connection() as connection:
+            connection.execute('DELETE FROM memoize')
+            self.count = 0
+
+    def __len__(self):
+        with self.connection() as connection:
+            return connection.execute('SELECT COUNT(*) FROM memoize').fetchone()[0]
+
+
+class MemoizeSession(object):
+    """In-memory store for a memoized function reset by memoize_session_reset()."""
+
+    def __init__(self):
+        self.cache = {}
+
+    def get(self, key, ttl):
+        if key in self.cache:
+            timestamp, value = self.cache[key]
+            if (datetime.now() - timestamp).total_seconds() < ttl:
+                return True, value
+        return False, None
+
+    def put(self, key, value):
+        self.cache[key] = (datetime.now(), value)
+        return 0
+
+    def delete(self, key):
+        self.cache.pop(key, None)
+
+    def clear(self):
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.cache)
+
+
+def memoize(ttl=None, session=False, add_invalidate=False, slots=None, nclean=None):
     """Decorator function to implement a persistent cache.
 
     >>> @memoize()
     ... def test_func(a):
     ...     return a
 
-    Internally, the memoized function has a cache:
-
-    >>> cache = [c.cell_contents for c in test_func.func_closure if 'sync' in dir(c.cell_contents)][0]
-    >>> 'sync' in dir(cache)
-    True
+    Internally, the memoized function has a store:
 
-    There is a limit of the size of the cache
-
-    >>> for k in cache:
-    ...     del cache[k]
-    >>> len(cache)
+    >>> store = test_func.memoize_store
+    >>> store.clear()
+    >>> len(store)
     0
 
+    There is a limit of the size of the cache which can be configured per
+    function using slots and nclean.
+
     >>> for i in range(4095):
-    ...     test_func(i)
-    ... len(cache)
+    ...     _ = test_func(i)
+    >>> len(store)
     4095
 
     >>> test_func(0)
     0
 
-    >>> len(cache)
+    >>> len(store)
     4095
 
     >>> test_func(4095)
     4095
 
-    >>> len(cache)
+    >>> len(store)
     3072
 
-    >>> test_func(0)
-    0
+    Hits and misses are reported to CacheStats per function:
 
-    >>> len(cache)
-    3073
-
-    >>> from datetime import timedelta
-    >>> k = [k for k in cache if cPickle.loads(k) == ((0,), {})][0]
-    >>> t, v = cache[k]
-    >>> t = t - timedelta(days=10)
-    >>> cache[k] = (t, v)
-    >>> test_func(0)
-    0
-    >>> t2, v = cache[k]
-    >>> t != t2
-    True
+    >>> stats = memoize_stats()[test_func.__module__ + '.test_func']
+    >>> stats['hits'], stats['misses'], stats['evictions']
+    (1, 4096, 1024)
 
     """
 
@@ -70,46 +202,18 @@ def memoize(ttl=None, session=False, add_invalidate=False):
     SLOTS = 4096            # Number of slots in the cache file
     NCLEAN = 1024           # Number of slots to remove when limit reached
     TIMEOUT = 60 * 60 * 2   # Time to live for every cache slot (seconds)
-    memoize.session_functions = []
 
     def _memoize(fn):
-        # Implement a POSIX lock / unlock extension for shelves. Inspired
-        # on ActiveState Code recipe #576591
-        def _lock(filename):
-            lckfile = open(filename + '.lck', 'w')
-            fcntl.flock(lckfile.fileno(), fcntl.LOCK_EX)
-            return lckfile
-
-        def _unlock(lckfile):
-            fcntl.flock(lckfile.fileno(), fcntl.LOCK_UN)
-            lckfile.close()
-
-        def _open_cache(cache_name):
-            if not session:
-                lckfile = _lock(cache_name)
-                cache = shelve.open(cache_name, protocol=-1)
-                # Store a reference to the lckfile to avoid to be
-                # closed by gc
-                cache.lckfile = lckfile
-            else:
+        name = '{}.{}'.format(fn.__module__, fn.__qualname__)
+        cache_name = 'memoize-session' if session else 'memoize'
+
+        def _open_cache():
+            if session:
                 if not hasattr(fn, '_memoize_session_cache'):
-                    fn._memoize_session_cache = {}
+                    fn._memoize_session_cache = MemoizeSession()
                     memoize.session_functions.append(fn)
-                cache = fn._memoize_session_cache
-            return cache
-
-        def _close_cache(cache):
-            if not session:
-                cache.close()
-                _unlock(cache.lckfile)
-
-        def _clean_cache(cache):
-            len_cache = len(cache)
-            if len_cache >= SLOTS:
-                nclean = NCLEAN + len_cache - SLOTS
-                keys_to_delete = sorted(cache, key=lambda k: cache[k][0])[:nclean]
-                for key in keys_to_delete:
-                    del cache[key]
+                return fn._memoize_session_cache
+            return store
 
         def _key(obj):
             # Pickle doesn't guarantee that there is a single
@@ -120,20 +224,21 @@ def memoize(ttl=None, session=False, add_invalidate=False):
             key = pickle.dumps(pickle.loads(key), protocol=-1)
             return key
 
+        def _key_args(args, kwargs):
+            first = str(args[0]) if isinstance(args[0], object) else args[0]
+            return _key((first, args[1:], kwargs))
+
         def _invalidate(*args, **kwargs):
-            key = _key((args, kwargs))
-            cache = _open_cache(cache_name)
-            if key in cache:
-                del cache[key]
+            _open_cache().delete(_key_args(args, kwargs))
 
         def _invalidate_all():
-            cache = _open_cache(cache_name)
-            cache.clear()
+            _open_cache().clear()
 
         def _add_invalidate_method(_self):
             name = '_invalidate_%s' % fn.__name__
             if not hasattr(_self, name):
-                setattr(_self, name, _invalidate)
+                # Bind to the instance so the key matches the one used by _fn.
+                setattr(_self, name, lambda *args, **kwargs: _invalidate(_self, *args, **kwargs))
 
             name = '_invalidate_all'
             if not hasattr(_self, name):
@@ -141,34 +246,48 @@ def memoize(ttl=None, session=False, add_invalidate=False):
 
         @wraps(fn)
         def _fn(*args, **kwargs):
-            def total_seconds(td):
-                return (td.microseconds + (td.seconds + td.days * 24 * 3600.) * 10**6) / 10**6
-            now = datetime.now()
             if add_invalidate:
                 _self = args[0]
                 _add_invalidate_method(_self)
-            first = str(args[0]) if isinstance(args[0], object) else args[0]
-            key = _key((first, args[1:], kwargs))
-            updated = False
-            cache = _open_cache(cache_name)
-            if key in cache:
-                timestamp, value = cache[key]
-                updated = True if total_seconds(now - timestamp) < ttl else False
-            if not updated:
+            key = _key_args(args, kwargs)
+            cache = _open_cache()
+            elapsed = CacheStats.timer()
+            found, value = cache.get(key, ttl)
+            if found:
+                CacheStats.record(cache_name, name, hits=1, hit_seconds=elapsed())
+            else:
+                elapsed = CacheStats.timer()
                 value = fn(*args, **kwargs)
-                cache[key] = (now, value)
-            _clean_cache(cache)
-            _close_cache(cache)
+                CacheStats.record(cache_name, name, misses=1, miss_seconds=elapsed())
+                evicted = cache.put(key, value)
+                if evicted:
+                    CacheStats.record(cache_name, name, evictions=evicted)
             return value
 
-        cache_name = os.path.join(CACHEDIR, fn.__name__)
+        store = None
+        if not session:
+            store = MemoizeStore(name, os.path.join(CACHEDIR, fn.__name__ + '.sqlite'),
+                                 slots if slots else SLOTS, nclean if nclean else NCLEAN)
+            _fn.memoize_store = store
         return _fn
 
     ttl = ttl if ttl else TIMEOUT
     return _memoize
 
 
+memoize.session_functions = []
+
+
 def memoize_session_reset():
     """Reset all session caches."""
-    for i, _ in enumerate(memoize.session_functions):
-        memoize.session_functions[i]._memoize_session_cache = {}
+    for fn in memoize.session_functions:
+        fn._memoize_session_cache.clear()
+
+
+def memoize_stats():
+    """Return CacheStats entries of memoized functions keyed by function name."""
+    stats = {}
+    for cache in ('memoize', 'memoize-session'):
+        for _, name, entry in CacheStats.entries(cache):
+            stats[name] = dict(entry)
+    return stats
@@ -1,22 +1,32 @@
+import fcntl
+import json
 import logging
 import os
 import re
 import requests
+import shutil
 import subprocess
 import tempfile
 import glob
+from contextlib import contextmanager
 from fnmatch import fnmatch
 from lxml import etree as ET
 from osc.core import http_GET
 
-import yaml
-
 from osclib.cache_manager import CacheManager
+from osclib.fileconflicts import fileconflicts
 
 logger = logging.getLogger('InstallChecker')
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 CACHEDIR = CacheManager.directory('repository-meta')
+# package descriptions of all headers within a mirrored directory
+SUSETAGS_INDEX = 'susetags-index-2.json'
+SUSETAGS_SNIPPETS = 'susetags-2'
+# number of headers passed to CreatePackageDescr at once
+SNIPPETS_BATCH = 1000
+# length of the output suffix by which followup_replace() finds candidates
+FOLLOWUP_ANCHOR = 16
 
 
 class CorruptRepos(Exception):
@@ -62,28 +72,21 @@ def _check_conflicts_whitelist(sp1, sp2, whitelist):
 
 
 def _fileconflicts(pfile, target_packages, whitelist):
-    script = os.path.join(SCRIPT_PATH, '..', 'findfileconflicts')
-    p = subprocess.run(['perl', script, pfile], stdout=subprocess.PIPE)
-    if p.returncode or len(p.stdout):
-        output = ''
-        conflicts = yaml.safe_load(p.stdout)
-        for conflict in conflicts:
-            sp1 = conflict['between'][0]
-            sp2 = conflict['between'][1]
-
-            if not sp1[0] in target_packages and not sp2[0] in target_packages:
-                continue
+    def skip(sp1, sp2):
+        return sp1[0] not in target_packages and sp2[0] not in target_packages
 
-            if _check_conflicts_whitelist(sp1, sp2, whitelist):
-                continue
+    output = ''
+    for sp1, sp2, files in fileconflicts(pfile, skip):
+        if _check_conflicts_whitelist(sp1, sp2, whitelist):
+            continue
 
-            output += "found conflict of {} with {}\n".format(_format_pkg(sp1), _format_pkg(sp2))
-            for file in conflict['conflicts'].split('\n'):
-                output += "  {}\n".format(file)
-            output += "\n"
+        output += "found conflict of {} with {}\n".format(_format_pkg(sp1), _format_pkg(sp2))
+        for file in files:
+            output += "  {}\n".format(file)
+        output += "\n"
 
-        if len(output):
-            return output
+    if len(output):
+        return output
 
 
 def filter_release(line):
@@ -137,24 +140,234 @@ def parsed_installcheck(repos, arch, target_packages, whitelist):
     return reported_problems
 
 
-def installcheck(directories, arch, whitelist, ignore_conflicts):
+def followup_replace(outputs):
+    """
+    Replace the output of other packages within the output of each package by
+    FOLLOWUP(package).
+
+    The result is the same as replacing the outputs of all other packages in
+    order, but only outputs whose last FOLLOWUP_ANCHOR characters occur in
+    the searched output are tried instead of searching for every output in
+    every other.
+
+    :param outputs: dict of package to output in order of installcheck
+    :return: dict of package to output with followups replaced
+    """
+    outputs = dict(outputs)
+    names = list(outputs)
+    # outputs too short to have an anchor are always tried
+    anchors = dict()
+    short = set()
+
+    def index(i, add):
+        output = outputs[names[i]]
+        if len(output) < FOLLOWUP_ANCHOR:
+            members = short
+        else:
+            members = anchors.setdefault(output[-FOLLOWUP_ANCHOR:], set())
+        if add:
+            members.add(i)
+        else:
+            members.discard(i)
+
+    def candidates(output, start, end):
+        found = set()
+        for position in range(max(start, 0), min(end, len(output)) - FOLLOWUP_ANCHOR + 1):
+            found.update(anchors.get(output[position:position + FOLLOWUP_ANCHOR], ()))
+        return found
+
+    for i in range(len(names)):
+        index(i, True)
+
+    for i, package1 in enumerate(names):
+        output = outputs[package1]
+        pending = sorted(candidates(output, 0, len(output)) | short)
+        while pending:
+            j = pending.pop(0)
+            if j == i:
+                continue
+            followup = 'FOLLOWUP(' + names[j] + ')'
+            replaced = output.replace(outputs[names[j]], followup)
+            if replaced == output:
+                continue
 
-    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
-        pfile = os.path.join(dir, 'packages')
+            # only substrings overlapping a replacement may complete outputs not found before
+            output = replaced
+            found = set()
+            position = output.find(followup)
+            while position >= 0:
+                found |= candidates(output, position - FOLLOWUP_ANCHOR + 1, position + len(followup) + FOLLOWUP_ANCHOR - 1)
+                position = output.find(followup, position + 1)
+            pending = sorted(set(pending) | {k for k in found if k > j})
+
+        index(i, False)
+        outputs[package1] = output
+        index(i, True)
+
+    return outputs
+
+
+def _package_name(filename):
+    # Same as write_repo_susetags_file.pl.
+    if re.match(r'^[a-z0-9]{32}-', filename):
+        return re.sub(r'^[^-]+-(.*)\.rpm', r'\1', filename)
+    return re.sub(r'^(.*)-[^-]+-[^-]+.rpm', r'\1', filename)
 
-        script = os.path.join(SCRIPT_PATH, '..', 'write_repo_susetags_file.pl')
-        parts = ['perl', script, dir] + directories
 
-        p = subprocess.run(parts)
+def _snippets_create(packages):
+    # Create the per header cache of CreatePackageDescr for the given packages.
+    for i in range(0, len(packages), SNIPPETS_BATCH):
+        p = subprocess.run(['perl', '-I', os.path.join(SCRIPT_PATH, '..'), '-MCreatePackageDescr', '-e',
+                            'CreatePackageDescr::package_snippet($_) for @ARGV', '--'] +
+                           packages[i:i + SNIPPETS_BATCH])
         if p.returncode:
-            # technically only 126, but there is no other value atm -
-            # so if some other perl error happens, we don't continue
             raise CorruptRepos
 
-        target_packages = []
-        with open(os.path.join(dir, 'catalog.yml')) as file:
-            catalog = yaml.safe_load(file)
-            target_packages = catalog.get(directories[0], [])
+
+def _snippet_valid(snippet):
+    return len(snippet) and b'=Pkg:    ' not in snippet
+
+
+@contextmanager
+def _susetags_locked(directory):
+    # The snippets file and its index are replaced separately so both writers
+    # and readers must hold the lock to never pair an index with the snippets
+    # file of another generation.
+    cachedir = os.path.join(directory, '.cache')
+    os.makedirs(cachedir, exist_ok=True)
+    with open(os.path.join(cachedir, SUSETAGS_INDEX + '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def susetags_index(directory):
+    """
+    Return the susetags package descriptions index of a mirrored directory.
+
+    The descriptions of all rpm headers in the directory are concatenated into
+    a single file indexed by header file name, package name, source, and
+    offset. Since header files are named by their header md5 the index is
+    only extended by the headers added since it was last written. Their
+    descriptions are created by CreatePackageDescr which keeps a file per
+    header.
+
+    The snippets file may be replaced once the lock on the directory is
+    released so it must be read within _susetags_locked() instead.
+    """
+    with _susetags_locked(directory):
+        return _susetags_index(directory)
+
+
+def _susetags_index(directory):
+    cachedir = os.path.join(directory, '.cache')
+    index_path = os.path.join(cachedir, SUSETAGS_INDEX)
+    snippets_path = os.path.join(cachedir, SUSETAGS_SNIPPETS)
+
+    # same order as perl glob()
+    filenames = sorted((os.path.basename(f) for f in glob.glob(glob.escape(directory) + '/*.rpm')),
+                       key=lambda f: (f.lower(), f))
+    names = set()
+    packages = []
+    for filename in filenames:
+        # mark as used
+        os.utime(os.path.join(directory, filename))
+        name = _package_name(filename)
+        if name not in names:
+            names.add(name)
+            packages.append((filename, name))
+
+    index = []
+    if os.path.exists(index_path) and os.path.exists(snippets_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    if [entry[0] for entry in index] == [filename for filename, _ in packages]:
+        return index
+
+    known = {entry[0]: entry for entry in index}
+    missing = [os.path.join(directory, filename) for filename, _ in packages if filename not in known]
+    if missing:
+        logger.debug('creating package descriptions for {} headers in {}'.format(len(missing), directory))
+        _snippets_create(missing)
+
+    os.makedirs(cachedir, exist_ok=True)
+    suffix = '.{}.tmp'.format(os.getpid())
+    index_new = []
+    offset = 0
+    with open(snippets_path + suffix, 'wb') as out:
+        old = open(snippets_path, 'rb') if known else None
+        try:
+            for filename, name in packages:
+                if filename in known:
+                    old.seek(known[filename][3])
+                    snippet = old.read(known[filename][4])
+                else:
+                    with open(os.path.join(cachedir, '2-' + filename), 'rb') as f:
+                        snippet = f.read()
+                    if not _snippet_valid(snippet):
+                        raise CorruptRepos
+
+                match = re.search(rb'=Src: ([^ ]*)', snippet)
+                source = match.group(1).decode('utf-8') if match else None
+                out.write(snippet)
+                index_new.append([filename, name, source, offset, len(snippet)])
+                offset += len(snippet)
+        finally:
+            if old:
+                old.close()
+
+    with open(index_path + suffix, 'w') as f:
+        json.dump(index_new, f)
+    os.rename(snippets_path + suffix, snippets_path)
+    os.rename(index_path + suffix, index_path)
+
+    return index_new
+
+
+def susetags_write(path, directories):
+    """
+    Write susetags packages file for the mirrored directories to path.
+
+    Equivalent to write_repo_susetags_file.pl, packages from earlier directories
+    take precedence over those of the same name in later ones, but built by
+    concatenating the descriptions kept by susetags_index().
+
+    :return: catalog of {directory: {name: source}}
+    """
+    written = set()
+    catalog = {}
+    with open(path, 'wb') as out:
+        out.write(b'=Ver: 2.0\n')
+        for directory in directories:
+            with _susetags_locked(directory):
+                index = _susetags_index(directory)
+                entries = [entry for entry in index if entry[1] not in written]
+                if not entries:
+                    continue
+
+                snippets_path = os.path.join(directory, '.cache', SUSETAGS_SNIPPETS)
+                with open(snippets_path, 'rb') as f:
+                    if len(entries) == len(index):
+                        shutil.copyfileobj(f, out)
+                    else:
+                        for entry in entries:
+                            f.seek(entry[3])
+                            out.write(f.read(entry[4]))
+
+            catalog[directory] = {}
+            for _, name, source, _, _ in entries:
+                written.add(name)
+                catalog[directory][name] = source or 'unknown'
+
+    return catalog
+
+
+def installcheck(directories, arch, whitelist, ignore_conflicts):
+
+    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
+        pfile = os.path.join(dir, 'packages')
+
+        catalog = susetags_write(pfile, directories)
+        target_packages = catalog.get(directories[0], [])
 
         parts = []
         output = _fileconflicts(pfile, target_packages, ignore_conflicts)
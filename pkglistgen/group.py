@@ -120,102 +120,60 @@ class Group(object):
     def solve(self, use_recommends=False):
         """ base: list of base groups or None """
 
-        solved = dict()
-        for arch in self.pkglist.filtered_architectures:
-            solved[arch] = dict()
-
-        self.srcpkgs = dict()
-        self.recommends = dict()
-        self.suggested = dict()
-        for arch in self.pkglist.filtered_architectures:
-            pool = self.pkglist.prepare_pool(arch, False)
-            solver = pool.Solver()
-            solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
-            solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
-
-            # pool.set_debuglevel(10)
-            suggested = dict()
-
-            # packages resulting from explicit recommended expansion
-            extra = []
-
-            def solve_one_package(n, group):
-                jobs = list(self.pkglist.lockjobs[arch])
-                sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
-                if sel.isempty():
-                    self.logger.debug('{}.{}: package {} not found'.format(self.name, arch, n))
-                    self.not_found.setdefault(n, set()).add(arch)
-                    return
-                else:
-                    if n in self.expand_recommended:
-                        for s in sel.solvables():
-                            for dep in s.lookup_deparray(solv.SOLVABLE_RECOMMENDS):
-                                # only add recommends that exist as packages
-                                rec = pool.select(dep.str(), solv.Selection.SELECTION_NAME)
-                                if not rec.isempty():
-                                    extra.append([dep.str(), group + ':recommended:' + n])
-
-                    jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-                locked = self.locked | self.pkglist.unwanted
-                for lock in locked:
-                    sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
-                    # if we can't find it, it probably is not as important
-                    if not sel.isempty():
-                        jobs += sel.jobs(solv.Job.SOLVER_LOCK)
-
-                for s in self.silents:
-                    sel = pool.select(str(s), solv.Selection.SELECTION_NAME | solv.Selection.SELECTION_FLAT)
-                    if sel.isempty():
-                        self.logger.warning('{}.{}: silent package {} not found'.format(self.name, arch, s))
-                    else:
-                        jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-                problems = solver.solve(jobs)
-                if problems:
-                    for problem in problems:
-                        msg = 'unresolvable: {}:{}.{}: {}'.format(self.name, n, arch, problem)
-                        self.logger.debug(msg)
-                        self.unresolvable[arch][n] = str(problem)
-                    return
-
-                for s in solver.get_recommended():
-                    if s.name in locked:
-                        continue
-                    self.recommends.setdefault(s.name, group + ':' + n)
-                if n in self.expand_suggested:
-                    for s in solver.get_suggested():
-                        suggested[s.name] = group + ':suggested:' + n
-                        self.suggested.setdefault(s.name, suggested[s.name])
-
-                trans = solver.transaction()
-                if trans.isempty():
-                    self.logger.error('%s.%s: nothing to do', self.name, arch)
-                    return
-
-                for s in trans.newsolvables():
-                    solved[arch].setdefault(s.name, group + ':' + n)
-                    if None:
-                        reason, rule = solver.describe_decision(s)
-                        print(self.name, s.name, reason, rule.info().problemstr())
-                    # don't ask me why, but that's how it seems to work
-                    if s.lookup_void(solv.SOLVABLE_SOURCENAME):
-                        src = s.name
-                    else:
-                        src = s.lookup_str(solv.SOLVABLE_SOURCENAME)
-                    self.srcpkgs[src] = group + ':' + s.name
-
-            start = time.time()
-            for n, group in self.packages[arch]:
-                solve_one_package(n, group)
+        group_start = time.time()
+        results = [self.solve_arch(arch, use_recommends) for arch in self.pkglist.filtered_architectures]
+        self.logger.info('%s - solving took %f', self.name, time.time() - group_start)
+        self.solve_merge(results)
+
+    def solve_arch(self, arch, use_recommends=False):
+        """
+        Solve the group for a single architecture without modifying the group.
+
+        Architectures are independent of each other so they may be solved in
+        separate processes. The results are combined by solve_merge().
+        """
+        result = {
+            'arch': arch,
+            'solved': dict(),
+            'unresolvable': dict(),
+            'not_found': [],
+            'recommends': dict(),
+            'suggested': dict(),
+            'srcpkgs': dict(),
+        }
+        solved = result['solved']
+
+        start = time.time()
+        pool = self.pkglist.prepare_pool(arch, False)
+        pool_duration = time.time() - start
+        solver = pool.Solver()
+        solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
+        solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
+
+        # pool.set_debuglevel(10)
+        suggested = dict()
+
+        # packages resulting from explicit recommended expansion
+        extra = []
+
+        def solve_one_package(n, group):
+            jobs = list(self.pkglist.lockjobs[arch])
+            sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
+            if sel.isempty():
+                self.logger.debug('{}.{}: package {} not found'.format(self.name, arch, n))
+                result['not_found'].append(n)
+                return
+            else:
+                if n in self.expand_recommended:
+                    for s in sel.solvables():
+                        for dep in s.lookup_deparray(solv.SOLVABLE_RECOMMENDS):
+                            # only add recommends that exist as packages
+                            rec = pool.select(dep.str(), solv.Selection.SELECTION_NAME)
+                            if not rec.isempty():
+                                extra.append([dep.str(), group + ':recommended:' + n])
 
-            # resetup the pool with ignored conflicts to get supplements from the list
-            pool = self.pkglist.prepare_pool(arch, True)
-            solver = pool.Solver()
-            solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
-            solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
+                jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
 
-            jobs = list(self.pkglist.lockjobs[arch])
             locked = self.locked | self.pkglist.unwanted
             for lock in locked:
                 sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
@@ -223,19 +181,107 @@ class Group(object):
                 if not sel.isempty():
                     jobs += sel.jobs(solv.Job.SOLVER_LOCK)
 
-            for n in list(solved[arch]) + list(suggested):
-                if n in locked:
+            for s in self.silents:
+                sel = pool.select(str(s), solv.Selection.SELECTION_NAME | solv.Selection.SELECTION_FLAT)
+                if sel.isempty():
+                    self.logger.warning('{}.{}: silent package {} not found'.format(self.name, arch, s))
+                else:
+                    jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+
+            problems = solver.solve(jobs)
+            if problems:
+                for problem in problems:
+                    msg = 'unresolvable: {}:{}.{}: {}'.format(self.name, n, arch, problem)
+                    self.logger.debug(msg)
+                    result['unresolvable'][n] = str(problem)
+                return
+
+            for s in solver.get_recommended():
+                if s.name in locked:
                     continue
-                sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
-                jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+                result['recommends'].setdefault(s.name, group + ':' + n)
+            if n in self.expand_suggested:
+                for s in solver.get_suggested():
+                    suggested[s.name] = group + ':suggested:' + n
+                    result['suggested'].setdefault(s.name, suggested[s.name])
 
-            solver.solve(jobs)
             trans = solver.transaction()
+            if trans.isempty():
+                self.logger.error('%s.%s: nothing to do', self.name, arch)
+                return
+
             for s in trans.newsolvables():
-                solved[arch].setdefault(s.name, group + ':expansion')
+                solved.setdefault(s.name, group + ':' + n)
+                if None:
+                    reason, rule = solver.describe_decision(s)
+                    print(self.name, s.name, reason, rule.info().problemstr())
+                # don't ask me why, but that's how it seems to work
+                if s.lookup_void(solv.SOLVABLE_SOURCENAME):
+                    src = s.name
+                else:
+                    src = s.lookup_str(solv.SOLVABLE_SOURCENAME)
+                result['srcpkgs'][src] = group + ':' + s.name
+
+        group = None
+        for n, group in self.packages[arch]:
+            solve_one_package(n, group)
+
+        # resetup the pool with ignored conflicts to get supplements from the list
+        pool_start = time.time()
+        pool = self.pkglist.prepare_pool(arch, True)
+        pool_duration += time.time() - pool_start
+        solver = pool.Solver()
+        solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
+        solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
+
+        jobs = list(self.pkglist.lockjobs[arch])
+        locked = self.locked | self.pkglist.unwanted
+        for lock in locked:
+            sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
+            # if we can't find it, it probably is not as important
+            if not sel.isempty():
+                jobs += sel.jobs(solv.Job.SOLVER_LOCK)
+
+        for n in list(solved) + list(suggested):
+            if n in locked:
+                continue
+            sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
+            jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+
+        solver.solve(jobs)
+        trans = solver.transaction()
+        for s in trans.newsolvables():
+            solved.setdefault(s.name, group + ':expansion')
+
+        end = time.time()
+        self.logger.info('%s.%s - solving took %f (pool %f)', self.name, arch, end - start, pool_duration)
+
+        return result
 
-            end = time.time()
-            self.logger.info('%s - solving took %f', self.name, end - start)
+    def solve_merge(self, results):
+        """
+        Combine the results of solve_arch() for all architectures.
+
+        Results are merged in architecture order which yields the same group as
+        solving all architectures in sequence regardless of where they were
+        solved.
+        """
+        solved = dict()
+        self.srcpkgs = dict()
+        self.recommends = dict()
+        self.suggested = dict()
+        for result in sorted(results, key=lambda result: result['arch']):
+            arch = result['arch']
+            solved[arch] = result['solved']
+            self.unresolvable[arch].update(result['unresolvable'])
+            for n in result['not_found']:
+                self.not_found.setdefault(n, set()).add(arch)
+            for name, reason in result['recommends'].items():
+                self.recommends.setdefault(name, reason)
+            for name, reason in result['suggested'].items():
+                self.suggested.setdefault(name, reason)
+            # later architectures take precedence as when solved in sequence
+            self.srcpkgs.update(result['srcpkgs'])
 
         common = None
         # compute common packages across all architectures
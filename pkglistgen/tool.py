@@ -1,13 +1,18 @@
 import ToolBase
+import fcntl
 import glob
 import logging
+import multiprocessing
 import os
 import re
 import solv
 import shutil
 import subprocess
+import time
 import yaml
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree as ET
 
 from osc.core import checkout_package
@@ -33,8 +38,23 @@ SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 
 PRODUCT_SERVICE = '/usr/lib/obs/service/create_single_product'
 
+# Default number of repositories updated concurrently, raised per project via
+# pkglistgen-update-jobs.
+UPDATE_JOBS = 1
+
 # share header cache with repochecker
 CACHEDIR = CacheManager.directory('repository-meta')
+# solv fragment per rpm header in CACHEDIR
+FRAGMENTDIR = CacheManager.directory('repository-solv')
+
+
+# PkgListGen instance solved by forked workers of PkgListGen.solve_modules()
+_solve_pkglist = None
+
+
+def _solve_arch(task):
+    groupname, arch, use_recommends = task
+    return _solve_pkglist.groups[groupname].solve_arch(arch, use_recommends)
 
 
 class MismatchedRepoException(Exception):
@@ -57,6 +77,7 @@ class PkgListGen(ToolBase.ToolBase):
         self.input_dir = '.'
         self.output_dir = '.'
         self.lockjobs = dict()
+        self.pools = dict()
         self.ignore_broken = False
         self.unwanted = set()
         self.output = None
@@ -150,6 +171,11 @@ class PkgListGen(ToolBase.ToolBase):
         return summary
 
     def solve_module(self, groupname, includes, excludes, use_recommends):
+        importants = self._inherit_module(groupname, includes)
+        self.groups[groupname].solve(use_recommends)
+        self._finish_module(groupname, excludes, importants)
+
+    def _inherit_module(self, groupname, includes):
         g = self.groups[groupname]
         importants = set()
         for i in includes:
@@ -161,7 +187,10 @@ class PkgListGen(ToolBase.ToolBase):
             else:
                 importants.add(name)
             g.inherit(self.groups[name])
-        g.solve(use_recommends)
+        return importants
+
+    def _finish_module(self, groupname, excludes, importants):
+        g = self.groups[groupname]
         for e in excludes:
             g.ignore(self.groups[e])
         for i in importants:
@@ -175,6 +204,53 @@ class PkgListGen(ToolBase.ToolBase):
                     if package[0] not in g.solved_packages['*']:
                         self.logger.error(f'Missing {package[0]} in {groupname} for {arch}')
 
+    def solve_modules(self, modules, jobs=1):
+        """
+        Solve modules given as (groupname, includes, excludes, use_recommends).
+
+        With more than one job every module and architecture combination is
+        solved in a pool of forked processes. Solving only depends on the
+        packages inherited from includes, not on the solved includes, so all
+        inheritance is done upfront and excludes are applied afterwards in the
+        original order. The resulting groups are identical to solving modules
+        in sequence.
+        """
+        names = [module[0] for module in modules]
+        if jobs <= 1 or len(names) != len(set(names)):
+            # a module listed twice inherits twice and must be solved in sequence
+            for module in modules:
+                self.solve_module(*module)
+            return
+
+        importants = [self._inherit_module(groupname, includes) for groupname, includes, _, _ in modules]
+
+        # prepare the pools before forking so the workers share them
+        for arch in self.filtered_architectures:
+            self.prepare_pool(arch, False)
+            self.prepare_pool(arch, True)
+
+        tasks = []
+        for groupname, _, _, use_recommends in modules:
+            for arch in self.filtered_architectures:
+                tasks.append((groupname, arch, use_recommends))
+
+        start = time.time()
+        global _solve_pkglist
+        _solve_pkglist = self
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(_solve_arch, tasks))
+        finally:
+            _solve_pkglist = None
+        self.logger.info('solving %d modules with %d jobs took %f', len(modules), jobs, time.time() - start)
+
+        for groupname, _, _, _ in modules:
+            group_results = [r for (name, _, _), r in zip(tasks, results) if name == groupname]
+            self.groups[groupname].solve_merge(group_results)
+
+        for (groupname, _, excludes, _), module_importants in zip(modules, importants):
+            self._finish_module(groupname, excludes, module_importants)
+
     def expand_repos(self, project, repo='standard'):
         return repository_path_expand(self.apiurl, project, repo)
 
@@ -212,6 +288,28 @@ class PkgListGen(ToolBase.ToolBase):
             self.logger.warning('package %s provides supported locale but is not grouped', p)
 
     def prepare_pool(self, arch, ignore_conflicts):
+        """
+        Return the pool for arch with lockjobs for it in self.lockjobs[arch].
+
+        Pools are cached per (arch, ignore_conflicts) so that the solv files are
+        only loaded once per run. Callers must not modify the pool itself and
+        should create a new Solver from it, which starts with a clean state.
+        """
+        key = (arch, ignore_conflicts)
+        if key not in self.pools:
+            start = time.time()
+            self.pools[key] = self._prepare_pool(arch, ignore_conflicts)
+            self.logger.debug('preparing pool {} (ignore conflicts: {}) took {:f}'.format(
+                arch, ignore_conflicts, time.time() - start))
+
+        pool, lockjobs = self.pools[key]
+        self.lockjobs[arch] = lockjobs
+        return pool
+
+    def reset_pools(self):
+        self.pools = dict()
+
+    def _prepare_pool(self, arch, ignore_conflicts):
         pool = solv.Pool()
         # the i586 DVD is really a i686 one
         if arch == 'i586':
@@ -219,7 +317,7 @@ class PkgListGen(ToolBase.ToolBase):
         else:
             pool.setarch(arch)
 
-        self.lockjobs[arch] = []
+        lockjobs = []
         solvables = set()
 
         for project, reponame in self.repos:
@@ -237,7 +335,7 @@ class PkgListGen(ToolBase.ToolBase):
                     solvable.unset(solv.SOLVABLE_OBSOLETES)
                 # only take the first solvable in the repo chain
                 if not self.use_newest_version and solvable.name in solvables:
-                    self.lockjobs[arch].append(pool.Job(solv.Job.SOLVER_SOLVABLE | solv.Job.SOLVER_LOCK, solvable.id))
+                    lockjobs.append(pool.Job(solv.Job.SOLVER_SOLVABLE | solv.Job.SOLVER_LOCK, solvable.id))
                 solvables.add(solvable.name)
 
         pool.addfileprovides()
@@ -246,7 +344,7 @@ class PkgListGen(ToolBase.ToolBase):
         for locale in self.locales:
             pool.set_namespaceproviders(solv.NAMESPACE_LANGUAGE, pool.Dep(locale), True)
 
-        return pool
+        return pool, lockjobs
 
     # parse file and merge all groups
     def _parse_unneeded(self, filename):
@@ -359,53 +457,177 @@ class PkgListGen(ToolBase.ToolBase):
         args.append('--nodebug')
         args.append('{}/public/build/{}/{}/{}'.format(self.apiurl, project, repo, arch))
         args.append(d)
+        # Prefix the progress since repositories may be updated concurrently.
         with subprocess.Popen(args, stdout=subprocess.PIPE) as p:
             for line in p.stdout:
-                self.logger.info(line.decode('utf-8').rstrip())
+                self.logger.info('%s/%s/%s: %s', project, repo, arch, line.decode('utf-8').rstrip())
             if p.wait() != 0:
                 raise Exception("Mirroring repository failed")
 
-        files = [os.path.join(d, f)
-                 for f in os.listdir(d) if f.endswith('.rpm')]
-        suffix = f'.{os.getpid()}.tmp'
-        fh = open(solv_file + suffix, 'w')
-        p = subprocess.Popen(
-            ['rpms2solv', '-m', '-', '-0'], stdin=subprocess.PIPE, stdout=fh)
-        p.communicate(bytes('\0'.join(files), 'utf-8'))
-        fh.close()
-        if p.wait() != 0:
-            raise Exception("rpm2solv failed")
-        os.rename(solv_file + suffix, solv_file)
+        fragment_dir = os.path.join(FRAGMENTDIR, project, repo, arch)
+        self.rpms2solv(d, fragment_dir, solv_file)
 
         # Create hash file now that solv creation is complete.
         open(solv_file_hash, 'a').close()
 
-    def update_repos(self, architectures):
-        for project, repo in self.repos:
-            for arch in architectures:
-                # Fetch state before mirroring in-case it changes during download.
+    @staticmethod
+    def _solv_write(repo, path):
+        suffix = f'.{os.getpid()}.tmp'
+        f = solv.xfopen(path + suffix, 'w')
+        repo.write(f)
+        f.close()
+        os.rename(path + suffix, path)
+
+    def rpms2solv(self, directory, fragment_dir, solv_file):
+        """
+        Generate solv_file from the rpm headers mirrored into directory.
+
+        Each header is converted once into a solv fragment kept in fragment_dir
+        and keyed by the header file name (hdrmd5-name.rpm) which changes along
+        with the header. Only headers without a fragment are converted, with the
+        same flags as rpms2solv, and all fragments are then merged into
+        solv_file as done by mergesolv.
+        """
+        os.makedirs(fragment_dir, exist_ok=True)
+        headers = sorted(f for f in os.listdir(directory) if f.endswith('.rpm'))
+        wanted = set(header + '.solv' for header in headers)
+        fragments = set(os.listdir(fragment_dir))
+        file_utils.unlink_list(fragment_dir, fragments - wanted)
+
+        pool = solv.Pool()
+        flags = solv.Repo.REPO_REUSE_REPODATA | solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.REPO_NO_LOCATION
+        converted = 0
+        for header in headers:
+            if header + '.solv' in fragments:
+                continue
+
+            repo = pool.add_repo(header)
+            if not repo.add_rpm(os.path.join(directory, header), flags):
+                raise Exception('rpm2solv failed for {}'.format(header))
+            repo.internalize()
+            self._solv_write(repo, os.path.join(fragment_dir, header + '.solv'))
+            repo.free(True)
+            converted += 1
+
+        repo = pool.add_repo(os.path.basename(solv_file))
+        for header in headers:
+            if not repo.add_solv(os.path.join(fragment_dir, header + '.solv')):
+                raise Exception('failed to merge solv fragment of {}'.format(header))
+        repo.internalize()
+        self._solv_write(repo, solv_file)
+
+        self.logger.debug('converted %d of %d headers in %s', converted, len(headers), directory)
+
+    def update_repos(self, architectures, jobs=1):
+        """
+        Update the solv files of all repositories for the given architectures.
+
+        Repositories are independent so up to jobs of them are refreshed
+        concurrently. Each is locked against concurrent updates of the same
+        mirror directory by other threads or processes and the time spent on
+        each is summarized once all are complete.
+        """
+        # Pools loaded from the previous solv files are no longer valid.
+        self.reset_pools()
+
+        targets = [(project, repo, arch) for project, repo in self.repos for arch in architectures]
+        start = time.time()
+        if jobs <= 1:
+            durations = [self.update_repo(*target) for target in targets]
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                durations = list(executor.map(lambda target: self.update_repo(*target), targets))
+
+        for target, (status, duration) in sorted(zip(targets, durations), key=lambda item: -item[1][1]):
+            self.logger.info('%s %s in %.1fs', '/'.join(target), status, duration)
+        self.logger.info('updating %d repositories with %d jobs took %.1fs', len(targets), jobs, time.time() - start)
+
+    def update_repo(self, project, repo, arch):
+        """Update the solv file of a single repository and return (status, seconds)."""
+        start = time.time()
+        # Fetch state before mirroring in-case it changes during download.
+        state = repository_arch_state(self.apiurl, project, repo, arch)
+        if state is None:
+            # Repo might not have this architecture
+            return 'missing', time.time() - start
+
+        d = os.path.join(CACHEDIR, project, repo, arch)
+        os.makedirs(os.path.dirname(d), exist_ok=True)
+        # bs_mirrorfull locks .lock within the directory for the download only.
+        with open(d + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            repo_solv_name = 'repo-{}-{}-{}.solv'.format(project, repo, arch)
+            # Would be preferable to include hash in name, but cumbersome to handle without
+            # reworking a fair bit since the state needs to be tracked.
+            solv_file = os.path.join(CACHEDIR, repo_solv_name)
+            solv_file_hash = '{}::{}'.format(solv_file, state)
+            if os.path.exists(solv_file) and os.path.exists(solv_file_hash):
+                # Solve file exists and hash unchanged, skip updating solv.
+                self.logger.debug('skipping solv generation for {} due to matching state {}'.format(
+                    '/'.join([project, repo, arch]), state))
+                status = 'unchanged'
+            else:
+                self.update_one_repo(project, repo, arch, solv_file, solv_file_hash)
+                status = 'updated'
+            shutil.copy(solv_file, f'./repo-{project}-{repo}-{arch}-{state}.solv')
+
+        return status, time.time() - start
+
+    def _weakremovers_pool(self):
+        """
+        Load the current repositories of all architectures into a pool once.
+
+        Returns the pool along with an index of the architectures (i686 treated
+        as i586) each package name is available for and the packages obsoleting
+        a given name so that old package lists can be checked by lookup rather
+        than loading all repositories for each of them.
+        """
+        pool = solv.Pool()
+        pool.setarch()
+
+        for arch in self.all_architectures:
+            for project, repo in self.repos:
+                # check back the repo state to avoid suprises
                 state = repository_arch_state(self.apiurl, project, repo, arch)
                 if state is None:
-                    # Repo might not have this architecture
+                    self.logger.debug(f'Skipping {project}/{repo}/{arch}')
+                fn = f'repo-{project}-{repo}-{arch}-{state}.solv'
+                r = pool.add_repo('/'.join([project, repo]))
+                if not r.add_solv(fn):
+                    raise MismatchedRepoException('failed to add repo {}/{}/{}.'.format(project, repo, arch))
+
+        provides = dict()
+        obsoletes = dict()
+        obsoletes_complex = []
+        for s in pool.solvables_iter():
+            # same as considered by whatprovides() and whatmatchesdep()
+            if not s.installable():
+                continue
+
+            arch = s.arch
+            if arch == 'i686':
+                arch = 'i586'
+            provides.setdefault(s.name, set()).add(arch)
+
+            for dep in s.lookup_deparray(solv.SOLVABLE_OBSOLETES):
+                name = dep.str().split(' ')[0]
+                if name.startswith('('):
+                    # rich dependencies are matched against every package
+                    obsoletes_complex.append(s)
                     continue
+                obsoletes.setdefault(name, []).append(s)
 
-                repo_solv_name = 'repo-{}-{}-{}.solv'.format(project, repo, arch)
-                # Would be preferable to include hash in name, but cumbersome to handle without
-                # reworking a fair bit since the state needs to be tracked.
-                solv_file = os.path.join(CACHEDIR, repo_solv_name)
-                solv_file_hash = '{}::{}'.format(solv_file, state)
-                if os.path.exists(solv_file) and os.path.exists(solv_file_hash):
-                    # Solve file exists and hash unchanged, skip updating solv.
-                    self.logger.debug('skipping solv generation for {} due to matching state {}'.format(
-                        '/'.join([project, repo, arch]), state))
-                else:
-                    self.update_one_repo(project, repo, arch, solv_file, solv_file_hash)
-                shutil.copy(solv_file, f'./repo-{project}-{repo}-{arch}-{state}.solv')
+        return pool, provides, obsoletes, obsoletes_complex
 
     def create_weakremovers(self, target, target_config, directory, output):
         drops = dict()
         dropped_repos = dict()
 
+        pool, provides, obsoletes, obsoletes_complex = self._weakremovers_pool()
+        accepted_archs = set(self.all_architectures)
+        accepted_archs.add('noarch')
+
         root = yaml.safe_load(open(os.path.join(directory, 'config.yml')))
         for item in root:
             key = list(item)[0]
@@ -417,29 +639,10 @@ class PkgListGen(ToolBase.ToolBase):
                 oldrepos |= set(glob.glob(os.path.join(directory, f"{key}_*.packages.{suffix}")))
                 oldrepos |= set(glob.glob(os.path.join(directory, f"{key}.packages.{suffix}")))
             for oldrepo in sorted(oldrepos):
-                pool = solv.Pool()
-                pool.setarch()
-
                 # we need some progress in the debug output - or gocd gets nervous
                 self.logger.debug('checking {}'.format(oldrepo))
                 oldsysrepo = file_utils.add_susetags(pool, oldrepo)
 
-                for arch in self.all_architectures:
-                    for project, repo in self.repos:
-                        # check back the repo state to avoid suprises
-                        state = repository_arch_state(self.apiurl, project, repo, arch)
-                        if state is None:
-                            self.logger.debug(f'Skipping {project}/{repo}/{arch}')
-                        fn = f'repo-{project}-{repo}-{arch}-{state}.solv'
-                        r = pool.add_repo('/'.join([project, repo]))
-                        if not r.add_solv(fn):
-                            raise MismatchedRepoException('failed to add repo {}/{}/{}.'.format(project, repo, arch))
-
-                pool.createwhatprovides()
-
-                accepted_archs = set(self.all_architectures)
-                accepted_archs.add('noarch')
-
                 for s in oldsysrepo.solvables_iter():
                     oldarch = s.arch
                     if oldarch == 'i686':
@@ -448,27 +651,17 @@ class PkgListGen(ToolBase.ToolBase):
                     if oldarch not in accepted_archs:
                         continue
 
-                    haveit = False
-                    for s2 in pool.whatprovides(s.nameid):
-                        if s2.repo == oldsysrepo or s.nameid != s2.nameid:
-                            continue
-                        newarch = s2.arch
-                        if newarch == 'i686':
-                            newarch = 'i586'
-                        if oldarch != newarch and newarch != 'noarch' and oldarch != 'noarch':
-                            continue
-                        haveit = True
-                        break
-                    if haveit:
+                    newarchs = provides.get(s.name)
+                    if newarchs and (oldarch in newarchs or 'noarch' in newarchs or oldarch == 'noarch'):
                         continue
 
                     # check for already obsoleted packages
                     nevr = pool.rel2id(s.nameid, s.evrid, solv.REL_EQ)
-                    for s2 in pool.whatmatchesdep(solv.SOLVABLE_OBSOLETES, nevr):
-                        if s2.repo == oldsysrepo:
-                            continue
-                        haveit = True
-                        break
+                    haveit = False
+                    for s2 in obsoletes.get(s.name, []) + obsoletes_complex:
+                        if s2.matchesdep(solv.SOLVABLE_OBSOLETES, nevr):
+                            haveit = True
+                            break
                     if haveit:
                         continue
                     if s.name not in drops:
@@ -479,7 +672,7 @@ class PkgListGen(ToolBase.ToolBase):
                         drops[s.name]['archs'].add(oldarch)
                     dropped_repos[key] = 1
 
-                del pool
+                oldsysrepo.free(True)
 
         for repo in sorted(dropped_repos):
             repo_output = False
@@ -506,7 +699,8 @@ class PkgListGen(ToolBase.ToolBase):
                 print('%endif', file=output)
         output.flush()
 
-    def solve_project(self, ignore_unresolvable=False, ignore_recommended=False, locale=None, locales_from=None):
+    def solve_project(self, ignore_unresolvable=False, ignore_recommended=False, locale=None, locales_from=None,
+                      jobs=1):
         self.load_all_groups()
         if not self.output:
             self.logger.error('OUTPUT not defined')
@@ -523,6 +717,7 @@ class PkgListGen(ToolBase.ToolBase):
                 self.locales |= set([lang.text for lang in root.findall('.//linguas/language')])
 
         modules = []
+        pending = []
         # the yml parser makes an array out of everything, so
         # we loop a bit more than what we support
         for group in self.output:
@@ -533,7 +728,7 @@ class PkgListGen(ToolBase.ToolBase):
             includes = settings.get('includes', [])
             excludes = settings.get('excludes', [])
             use_recommends = settings.get('recommends', global_use_recommends)
-            self.solve_module(groupname, includes, excludes, use_recommends)
+            pending.append((groupname, includes, excludes, use_recommends))
             g = self.groups[groupname]
             # the default is a little double negated but Factory has ignore_broken
             # as default and we only disable it for single groups (for now)
@@ -542,6 +737,8 @@ class PkgListGen(ToolBase.ToolBase):
             g.default_support_status = settings.get('default-support', 'unsupported')
             modules.append(g)
 
+        self.solve_modules(pending, jobs)
+
         # not defined for openSUSE
         overlap = self.groups.get('overlap')
         for module in modules:
@@ -676,7 +873,7 @@ class PkgListGen(ToolBase.ToolBase):
         logging.debug('-> do_update')
         # make sure we only calculcate existant architectures
         self.filter_architectures(target_archs(api.apiurl, project, main_repo))
-        self.update_repos(self.filtered_architectures)
+        self.update_repos(self.filtered_architectures, int(target_config.get('pkglistgen-update-jobs', UPDATE_JOBS)))
 
         if only_release_packages:
             self.load_all_groups()
@@ -686,7 +883,8 @@ class PkgListGen(ToolBase.ToolBase):
                                          ignore_recommended=str2bool(
                                              target_config.get('pkglistgen-ignore-recommended')),
                                          locale=target_config.get('pkglistgen-locale'),
-                                         locales_from=target_config.get('pkglistgen-locales-from'))
+                                         locales_from=target_config.get('pkglistgen-locales-from'),
+                                         jobs=int(target_config.get('pkglistgen-solve-jobs', 1)))
 
         if stop_after_solve:
             return
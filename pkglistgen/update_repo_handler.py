@@ -1,8 +1,6 @@
 
 import glob
-import gzip
 import hashlib
-import io
 import logging
 import os.path
 import re
@@ -15,6 +13,7 @@ import tempfile
 import requests
 import solv
 import yaml
+import zlib
 from lxml import etree as ET
 
 import osc.core
@@ -25,6 +24,9 @@ from urllib.parse import urljoin, urlparse
 
 logger = logging.getLogger()
 
+# Size of chunks in which repository metadata is downloaded.
+CHUNK_SIZE = 1024 * 1024
+
 
 def dump_solv_build(baseurl):
     """Determine repo format and build string from remote repository."""
@@ -64,6 +66,38 @@ def dump_solv_build(baseurl):
     raise Exception(baseurl + 'includes no build number')
 
 
+def download_gunzip(url, f, sha256_expected=None):
+    """
+    Download gzip compressed url decompressing into the file f.
+
+    The download is streamed in chunks that are hashed and decompressed as
+    they arrive so neither the compressed nor decompressed content is ever
+    held in memory as a whole.
+    """
+    with requests.get(url, stream=True) as response:
+        if response.status_code != requests.codes.ok:
+            raise Exception(url + ' does not exist')
+
+        sha256 = hashlib.sha256()
+        # gzip header and trailer, may consist of multiple members
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            sha256.update(chunk)
+            while chunk:
+                f.write(decompressor.decompress(chunk))
+                chunk = decompressor.unused_data
+                if chunk:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        f.write(decompressor.flush())
+        if not decompressor.eof:
+            raise Exception(url + ' is truncated')
+        f.flush()
+
+    sha256 = sha256.hexdigest()
+    if sha256_expected and sha256 != sha256_expected:
+        raise Exception('checksums do not match {} != {}'.format(sha256, sha256_expected))
+
+
 def parse_repomd(repo, baseurl):
     url = urljoin(baseurl, 'repodata/repomd.xml')
     repomd = requests.get(url)
@@ -82,22 +116,11 @@ def parse_repomd(repo, baseurl):
     os.lseek(f.fileno(), 0, os.SEEK_SET)
     repo.add_repomdxml(solv.xfopen_fd(None, f.fileno()), 0)
     url = urljoin(baseurl, location)
-    with requests.get(url, stream=True) as primary:
-        if primary.status_code != requests.codes.ok:
-            raise Exception(url + ' does not exist')
-        sha256 = hashlib.sha256(primary.content).hexdigest()
-        if sha256 != sha256_expected:
-            raise Exception('checksums do not match {} != {}'.format(sha256, sha256_expected))
-
-        content = gzip.GzipFile(fileobj=io.BytesIO(primary.content))
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(content.read())
-        f.flush()
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        repo.add_rpmmd(solv.xfopen_fd(None, f.fileno()), None, 0)
-        return True
-
-    return False
+    f = tempfile.TemporaryFile()
+    download_gunzip(url, f, sha256_expected)
+    os.lseek(f.fileno(), 0, os.SEEK_SET)
+    repo.add_rpmmd(solv.xfopen_fd(None, f.fileno()), None, 0)
+    return True
 
 
 def parse_susetags(repo, baseurl):
@@ -118,22 +141,15 @@ def parse_susetags(repo, baseurl):
         descrdir = 'suse/setup/descr'
 
     url = urljoin(baseurl, descrdir + '/packages.gz')
-    with requests.get(url, stream=True) as packages:
-        if packages.status_code != requests.codes.ok:
-            raise Exception(url + ' does not exist')
-
-        content = gzip.GzipFile(fileobj=io.BytesIO(packages.content))
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(content.read())
-        f.flush()
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        try:
-            repo.add_susetags(f, defvendorid, None, solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.SUSETAGS_RECORD_SHARES)
-        except TypeError:
-            logger.error(f"Failed to add susetags for {url}")
-            return False
-        return True
-    return False
+    f = tempfile.TemporaryFile()
+    download_gunzip(url, f)
+    os.lseek(f.fileno(), 0, os.SEEK_SET)
+    try:
+        repo.add_susetags(f, defvendorid, None, solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.SUSETAGS_RECORD_SHARES)
+    except TypeError:
+        logger.error(f"Failed to add susetags for {url}")
+        return False
+    return True
 
 
 def dump_solv(name, baseurl):
@@ -5,7 +5,6 @@ import hashlib
 import logging
 import os
 import os.path
-import subprocess
 import sys
 import tempfile
 import cmdln
@@ -23,7 +22,7 @@ from osclib.conf import Config
 from osclib.core import (http_DELETE, http_GET, makeurl,
                          repository_path_expand, repository_path_search,
                          target_archs, source_file_load, source_file_ensure)
-from osclib.repochecks import mirror, parsed_installcheck, CorruptRepos
+from osclib.repochecks import followup_replace, mirror, parsed_installcheck, susetags_write
 from osclib.comments import CommentAPI
 
 
@@ -194,37 +193,13 @@ class RepoChecker():
         with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
             pfile = os.path.join(dir, 'packages')
 
-            SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
-            script = os.path.join(SCRIPT_PATH, 'write_repo_susetags_file.pl')
-            parts = ['perl', script, dir] + directories
-
-            p = subprocess.run(parts)
-            if p.returncode:
-                # technically only 126, but there is no other value atm -
-                # so if some other perl error happens, we don't continue
-                raise CorruptRepos
-
-            target_packages = []
-            with open(os.path.join(dir, 'catalog.yml')) as file:
-                catalog = yaml.safe_load(file)
-                if catalog is not None:
-                    target_packages = catalog.get(directories[0], [])
+            catalog = susetags_write(pfile, directories)
+            target_packages = catalog.get(directories[0], [])
 
             parsed = parsed_installcheck([pfile] + primaryxmls, arch, target_packages, [])
+            outputs = followup_replace({package: "\n".join(entry['output']) for package, entry in parsed.items()})
             for package in parsed:
-                parsed[package]['output'] = "\n".join(parsed[package]['output'])
-
-            # let's risk a N*N algorithm in the hope that we have a limited N
-            for package1 in parsed:
-                output = parsed[package1]['output']
-                for package2 in parsed:
-                    if package1 == package2:
-                        continue
-                    output = output.replace(parsed[package2]['output'], 'FOLLOWUP(' + package2 + ')')
-                parsed[package1]['output'] = output
-
-            for package in parsed:
-                parsed[package]['output'] = self._split_and_filter(parsed[package]['output'])
+                parsed[package]['output'] = self._split_and_filter(outputs[package])
 
         url = makeurl(self.apiurl, ['build', project, '_result'], {'repository': repository, 'arch': arch})
         root = ET.parse(http_GET(url)).getroot()
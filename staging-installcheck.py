@@ -2,10 +2,13 @@
 
 import argparse
 import logging
+import multiprocessing
 import os
 import re
 import sys
+import time
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from urllib.error import HTTPError
 
 import osc.core
@@ -25,6 +28,17 @@ from osclib.stagingapi import StagingAPI
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 CheckResult = namedtuple('CheckResult', ('success', 'comment'))
 
+# InstallChecker used by forked workers of InstallChecker.staging() and __main__
+_checker = None
+
+
+def _check_arch(check):
+    return _checker.check_arch(*check)
+
+
+def _staging(staging):
+    return _checker.staging(staging)
+
 
 class InstallChecker(object):
     def __init__(self, api, config):
@@ -122,7 +136,8 @@ class InstallChecker(object):
             args = args.replace(',', ' ').split(' ')
         return set(args)
 
-    def staging(self, project, force=False):
+    def staging(self, project, force=False, jobs=1):
+        """Check project with up to jobs architectures checked in parallel processes."""
         api = self.api
 
         repository = self.api.cmain_repo
@@ -180,40 +195,25 @@ class InstallChecker(object):
             if req.get('type') == 'delete':
                 result = self.check_delete_request(req, to_ignore, to_delete, result_comment) and result
 
-        for arch in architectures:
-            # hit the first repository in the target project (if existant)
-            target_pair = None
-            directories = []
-            for pair_project, pair_repository in repository_pairs:
-                # ignore repositories only inherited for config
-                if repository_arch_state(self.api.apiurl, pair_project, pair_repository, arch):
-                    if not target_pair and pair_project == api.project:
-                        target_pair = [pair_project, pair_repository]
-
-                    directories.append(mirror(self.api.apiurl, pair_project, pair_repository, arch))
-
-            if not api.is_adi_project(project):
-                # For "leaky" ring packages in letter stagings, where the
-                # repository setup does not include the target project, that are
-                # not intended to to have all run-time dependencies satisfied.
-                whitelist = self.ring_whitelist
-            else:
-                whitelist = set()
-
-            whitelist |= to_ignore
-            ignore_conflicts = self.ignore_conflicts | to_ignore
-
-            check = self.cycle_check(project, repository, arch)
-            if not check.success:
-                self.logger.warning('Cycle check failed')
-                result_comment.append(check.comment)
-                result = False
-
-            check = self.install_check(directories, arch, whitelist, ignore_conflicts)
-            if not check.success:
-                self.logger.warning('Install check failed')
-                result_comment.append(check.comment)
-                result = False
+        checks = [(project, repository, repository_pairs, arch, to_ignore) for arch in architectures]
+        if jobs > 1 and len(checks) > 1:
+            global _checker
+            _checker = self
+            try:
+                with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+                    arch_results = list(executor.map(_check_arch, checks))
+            finally:
+                _checker = None
+        else:
+            arch_results = [self.check_arch(*check) for check in checks]
+
+        # results are in order of architectures regardless of completion order
+        for arch, (failed, duration) in zip(architectures, arch_results):
+            self.logger.info('{}/{}/{} checked in {:.1f}s'.format(project, repository, arch, duration))
+            for check in failed:
+                if not check.success:
+                    result_comment.append(check.comment)
+                    result = False
 
         duplicates = duplicated_binaries_in_repo(self.api.apiurl, project, repository)
         # remove white listed duplicates
@@ -238,6 +238,46 @@ class InstallChecker(object):
 
         return result
 
+    def check_arch(self, project, repository, repository_pairs, arch, to_ignore):
+        """Run cycle and install check for arch returning failed CheckResults and duration."""
+        api = self.api
+        start = time.time()
+
+        # hit the first repository in the target project (if existant)
+        target_pair = None
+        directories = []
+        for pair_project, pair_repository in repository_pairs:
+            # ignore repositories only inherited for config
+            if repository_arch_state(self.api.apiurl, pair_project, pair_repository, arch):
+                if not target_pair and pair_project == api.project:
+                    target_pair = [pair_project, pair_repository]
+
+                directories.append(mirror(self.api.apiurl, pair_project, pair_repository, arch))
+
+        if not api.is_adi_project(project):
+            # For "leaky" ring packages in letter stagings, where the
+            # repository setup does not include the target project, that are
+            # not intended to to have all run-time dependencies satisfied.
+            whitelist = set(self.ring_whitelist)
+        else:
+            whitelist = set()
+
+        whitelist |= to_ignore
+        ignore_conflicts = self.ignore_conflicts | to_ignore
+
+        failed = []
+        check = self.cycle_check(project, repository, arch)
+        if not check.success:
+            self.logger.warning('Cycle check failed')
+            failed.append(check)
+
+        check = self.install_check(directories, arch, whitelist, ignore_conflicts)
+        if not check.success:
+            self.logger.warning('Install check failed')
+            failed.append(check)
+
+        return failed, time.time() - start
+
     def upload_failure(self, project, comment):
         print(project, '\n'.join(comment))
         url = self.api.makeurl(['source', 'home:repo-checker', 'reports', project])
@@ -357,6 +397,8 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--debug', action='store_true', default=False,
                         help='enable debug information')
     parser.add_argument('-A', '--apiurl', metavar='URL', help='API URL')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of architectures or stagings checked in parallel')
 
     args = parser.parse_args()
 
@@ -374,10 +416,16 @@ if __name__ == '__main__':
         logging.basicConfig(level=logging.INFO)
 
     if args.staging:
-        if not staging_report.staging(api.prj_from_short(args.staging), force=True):
+        if not staging_report.staging(api.prj_from_short(args.staging), force=True, jobs=args.jobs):
             sys.exit(1)
     else:
-        for staging in api.get_staging_projects():
-            if api.is_adi_project(staging):
+        stagings = [staging for staging in api.get_staging_projects() if api.is_adi_project(staging)]
+        if args.jobs > 1:
+            # stagings are independent so check them in parallel instead of their architectures
+            _checker = staging_report
+            with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+                list(executor.map(_staging, stagings))
+        else:
+            for staging in stagings:
                 staging_report.staging(staging)
     sys.exit(0)
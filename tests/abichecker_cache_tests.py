@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'abichecker'))
+
+from abichecker_cache import ABICache  # noqa: E402
+from abichecker_cache import LRUStore  # noqa: E402
+from abichecker_cache import RpmHeader  # noqa: E402
+
+
+class TestLRUStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = LRUStore(os.path.join(self.tmpdir.name, 'store'), 30)
+        self.time = 1000
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def put(self, key, size=10):
+        tmp = self.store.temporary(key)
+        with open(tmp, 'wb') as f:
+            f.write(b'x' * size)
+        path = self.store.put(key, tmp)
+        self.touch(path)
+        return path
+
+    def touch(self, path):
+        # explicit times since mtime resolution may not order quick writes
+        self.time += 1
+        os.utime(path, (self.time, self.time))
+
+    def keys(self):
+        return sorted(os.path.basename(path) for _, _, path in self.store.entries())
+
+    def test_put_get(self):
+        self.assertIsNone(self.store.get('aa11'))
+        path = self.put('aa11')
+        self.assertEqual(path, os.path.join(self.store.directory, 'aa', 'aa11'))
+        self.assertFalse(os.path.exists(self.store.temporary('aa11')))
+        self.assertEqual(self.store.get('aa11'), path)
+
+        # Temporary files being written are not entries.
+        open(self.store.temporary('bb22'), 'w').close()
+        self.assertEqual(self.keys(), ['aa11'])
+
+    def test_prune(self):
+        for key in ('aa11', 'bb22', 'cc33'):
+            self.put(key)
+        self.assertEqual(self.store.prune(), 0)
+
+        # Using an entry makes it the most recently used.
+        self.store.get('aa11')
+        self.put('dd44')
+        self.assertEqual(self.store.prune(), 1)
+        self.assertEqual(self.keys(), ['aa11', 'cc33', 'dd44'])
+
+        self.put('ee55', 25)
+        self.assertEqual(self.store.prune(), 3)
+        self.assertEqual(self.keys(), ['aa11'])
+
+        self.store.limit = 0
+        self.assertEqual(self.store.prune(), 1)
+        self.assertEqual(self.keys(), [])
+
+
+class TestABICache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ABICache(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_header(self):
+        header = RpmHeader('libfoo1', 'x86_64', '1.0', '1.1', 'foo-1.0-1.1.src.rpm', 'obs://build/foo',
+                           [('/usr/lib64/libfoo.so.1', 0o120777, 'libfoo.so.1.0'),
+                            ('/usr/lib64/libfoo.so.1.0', 0o100755, '')])
+        self.assertIsNone(self.cache.header_get('a' * 32))
+        self.cache.header_put('a' * 32, header)
+        self.assertEqual(self.cache.header_get('a' * 32), header)
+
+    def test_corrupt(self):
+        path = self.cache.headers.path('b' * 32)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('{"name":')
+        self.assertIsNone(self.cache.header_get('b' * 32))
+        self.assertFalse(os.path.exists(path))
+
+    def test_verifymd5(self):
+        self.assertIsNone(self.cache.verifymd5_get('openSUSE:Factory', 'foo', 'c' * 32))
+        self.cache.verifymd5_put('openSUSE:Factory', 'foo', 'c' * 32, 'd' * 32)
+        self.assertEqual(self.cache.verifymd5_get('openSUSE:Factory', 'foo', 'c' * 32), 'd' * 32)
+        self.assertIsNone(self.cache.verifymd5_get('openSUSE:Leap:15.2', 'foo', 'c' * 32))
+
+    def test_rpm(self):
+        self.assertIsNone(self.cache.rpm_get('e' * 32))
+        tmp = self.cache.rpm_temporary('e' * 32)
+        with open(tmp, 'wb') as f:
+            f.write(b'rpm')
+        path = self.cache.rpm_put('e' * 32, tmp)
+        self.assertEqual(self.cache.rpm_get('e' * 32), path)
+
+        self.cache.rpms.limit = 0
+        self.cache.prune()
+        self.assertIsNone(self.cache.rpm_get('e' * 32))
@@ -0,0 +1,110 @@
+from collections import namedtuple
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'abichecker'))
+
+import abichecker  # noqa: E402
+from abichecker import MR  # noqa: E402
+
+SourceInfo = namedtuple('SourceInfo', ('package', 'verifymd5'))
+
+ARCHITECTURES = ['aarch64', 'i586', 'ppc64le', 'x86_64']
+
+# library: aliases
+LIBS = {
+    '/usr/lib64/libfoo.so.1': {'libfoo.so.1'},
+    '/usr/lib64/libbar.so.2': set(),
+    '/usr/lib64/libbaz.so.3': set(),
+}
+
+
+class TestABICheckerScheduling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(abichecker, 'CACHEDIR', self.tmpdir.name),
+            mock.patch.object(abichecker, 'UNPACKDIR', os.path.join(self.tmpdir.name, 'unpacked')),
+            mock.patch.object(abichecker, 'time', mock.Mock(wraps=time, time=lambda: 0)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmpdir.cleanup()
+
+    def checker(self, jobs):
+        checker = abichecker.ABIChecker.__new__(abichecker.ABIChecker)
+        checker.logger = logging.getLogger('abichecker')
+        checker.jobs = jobs
+        checker.cache = mock.Mock()
+        checker.reports = []
+        checker.text_summary = ''
+        checker.has_staging = lambda project: False
+        checker.get_sourceinfo = lambda project, package, rev=None: SourceInfo(package, project)
+        repos = {MR('standard', 'standard', arch) for arch in ARCHITECTURES}
+        repos.add(MR('other', 'standard', 'x86_64'))
+        checker.findrepos = lambda *args: repos
+        checker._maintenance_hack = lambda *args: (None, None, None, None)
+
+        self.calls = []
+        self.lock = threading.Lock()
+
+        def call(*args):
+            with self.lock:
+                self.calls.append(args)
+            # let concurrent calls overlap
+            time.sleep(0.01)
+
+        def extract(project, package, srcinfo, repo, arch):
+            call('extract', project, repo, arch)
+            if project == 'home:user' and arch == 'ppc64le':
+                raise abichecker.FetchError('{}/{} failed'.format(repo, arch))
+            return LIBS, {lib: '/usr/lib/debug' + lib + '.debug' for lib in LIBS}
+
+        def run_abi_dumper(output, base, filename, debuglib, cwd):
+            call('dump', os.path.relpath(base, abichecker.UNPACKDIR), filename)
+            self.assertTrue(os.path.isdir(cwd))
+            return not ('libbaz' in filename and base.endswith('aarch64'))
+
+        def run_abi_checker(libname, old, new, output, cwd):
+            call('check', libname)
+            self.assertTrue(os.path.isdir(cwd))
+            return libname != 'bar'
+
+        checker.extract = extract
+        checker.run_abi_dumper = run_abi_dumper
+        checker.run_abi_checker = run_abi_checker
+        return checker
+
+    def check(self, jobs):
+        checker = self.checker(jobs)
+        ret = checker.check_source_submission('home:user', 'foo', None, 'openSUSE:Factory', 'foo')
+        checker.cache.prune.assert_called_once_with()
+        return ret, checker.reports, checker.text_summary, sorted(self.calls)
+
+    def test_jobs(self):
+        ret, reports, text_summary, calls = self.check(1)
+        self.assertEqual(ret, None)
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0].result, False)
+        self.assertIn('ABI check failed on /usr/lib64/libbaz.so.3', text_summary)
+
+        # Each repo is extracted and each library dumped only once even when
+        # shared by several repo mappings.
+        extracts = [call for call in calls if call[0] == 'extract']
+        self.assertEqual(len(extracts), len(set(extracts)))
+        self.assertEqual(len(extracts), len(ARCHITECTURES) * 2 + 1)
+        dumps = [call for call in calls if call[0] == 'dump']
+        self.assertEqual(len(dumps), len(set(dumps)))
+        self.assertNotIn(('dump', 'home:user/foo/standard/ppc64le', '/usr/lib64/libfoo.so.1'), dumps)
+
+        self.assertEqual(self.check(4), (ret, reports, text_summary, calls))
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+"""
+Compare the osclib.cache.Cache storage backends.
+
+Populates each backend with synthetic responses spread across projects and
+measures put, hit, and miss latency as well as the time to expire projects via
+delete_project().
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+from osclib.cache import Cache
+
+
+def urls_generate(apiurl, projects, packages):
+    for p in range(projects):
+        project = 'openSUSE:Factory:Staging:{}'.format(p)
+        for package in range(packages):
+            yield '{}/source/{}/package-{}/_meta'.format(apiurl, project, package), project
+
+
+def timed(label, count, function):
+    start = perf_counter()
+    function()
+    duration = perf_counter() - start
+    print('  {:<16} {:>10.3f}s {:>10.1f}us/op'.format(label, duration, duration / count * 10**6))
+
+
+def benchmark(name, directory, args):
+    Cache.CACHE_DIR = os.path.join(directory, name)
+    backend = Cache.BACKENDS[name](Cache.CACHE_DIR)
+    urls = list(urls_generate(args.apiurl, args.projects, args.packages))
+    body = b'x' * args.size
+
+    print(name)
+
+    def put():
+        for url, project in urls:
+            backend.put(url, project, body)
+
+    def get():
+        for url, project in urls:
+            data, _ = backend.get(url, project, Cache.TTL_LONG)
+            data.read()
+
+    def miss():
+        for url, project in urls:
+            backend.get(url + '?missing', project, Cache.TTL_LONG)
+
+    def project_age():
+        for url, project in urls:
+            backend.project_age(args.apiurl, project)
+
+    def delete_project():
+        for p in range(args.projects):
+            backend.delete_project(args.apiurl, 'openSUSE:Factory:Staging:{}'.format(p))
+
+    count = len(urls)
+    timed('put', count, put)
+    timed('get (hit)', count, get)
+    timed('get (miss)', count, miss)
+    timed('project_age', count, project_age)
+    timed('delete_project', args.projects, delete_project)
+    backend.delete_all()
+
+
+def main(args):
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        for name in args.backend or sorted(Cache.BACKENDS):
+            benchmark(name, directory, args)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--apiurl', default='https://api.example.com', help='apiurl used to build urls')
+    parser.add_argument('--backend', action='append', choices=sorted(Cache.BACKENDS), help='backend(s) to benchmark')
+    parser.add_argument('--directory', help='parent directory for cache (ex. NFS mount)')
+    parser.add_argument('--projects', type=int, default=50, help='number of projects')
+    parser.add_argument('--packages', type=int, default=200, help='number of packages per project')
+    parser.add_argument('--size', type=int, default=2048, help='response size in bytes')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+"""
+Compare sequential pattern matching against the osclib.cache.Cache dispatcher.
+
+Replays a url stream through the original per-pattern loop, the combined
+dispatcher, and the memoized classification used by get(), put(), and delete().
+A recorded stream can be provided as a file with one url per line, for example
+extracted from the CACHE_* lines printed by a staging run with debug enabled:
+
+    osc -d staging check 2>&1 | grep -oP '^CACHE_\\w+ \\K\\S+' > urls.txt
+
+Otherwise a synthetic stream resembling a staging run is generated.
+"""
+
+import argparse
+import random
+import re
+from time import perf_counter
+from urllib.parse import unquote
+
+from osclib.cache import Cache
+
+
+def urls_synthetic(apiurl, count):
+    paths = [
+        '/build/openSUSE:Factory:Staging:{letter}/_result?view=summary',
+        '/build/openSUSE:Factory/standard/x86_64/_builddepinfo',
+        '/group/factory-staging',
+        '/request/{number}?withhistory=1',
+        "/search/package?match=[@project='openSUSE:Factory:Staging:{letter}']",
+        "/search/project/id?match=starts-with(@name,'openSUSE:Factory:Staging:')",
+        '/source',
+        '/source/openSUSE:Factory:Staging:{letter}',
+        '/source/openSUSE:Factory/package-{number}/_history',
+        '/source/openSUSE:Factory/package-{number}/_meta',
+        '/source/openSUSE:Factory:Staging/dashboard/config',
+        '/source/openSUSE:Factory:Staging:{letter}/_attribute/OSRT:Config',
+        '/statistics/latest_updated?limit=5000',
+        '/source/openSUSE:Factory:Staging:{letter}/_meta',
+        '/source/openSUSE:Factory/package-{number}?view=info',
+        '/source/openSUSE:Factory/package-{number}/package-{number}.spec',
+        '/status_message',
+        '/person/user-{number}',
+    ]
+    random.seed(0)
+    for _ in range(count):
+        path = random.choice(paths).format(
+            letter=random.choice('ABCDEFGHIJ'), number=random.randint(0, 300))
+        yield apiurl + path
+
+
+def match_sequential(patterns, url):
+    apiurl, path = Cache.spliturl(url)
+    for pattern in patterns:
+        match = pattern.match(path)
+        if match:
+            return (pattern.pattern,
+                    match.group(1) if len(match.groups()) > 0 else None)
+    return (False, None)
+
+
+def timed(label, count, function):
+    start = perf_counter()
+    function()
+    duration = perf_counter() - start
+    print('{:<24} {:>10.3f}s {:>10.2f}us/url'.format(label, duration, duration / count * 10**6))
+
+
+def main(args):
+    if args.urls:
+        with open(args.urls) as f:
+            urls = [line.strip() for line in f if line.strip()]
+    else:
+        urls = list(urls_synthetic(args.apiurl, args.count))
+
+    patterns = [re.compile(pattern) for pattern in Cache.PATTERNS]
+    Cache.patterns = patterns
+    Cache.dispatcher_compile()
+
+    for url in urls:
+        url = unquote(url)
+        expected = match_sequential(patterns, url)
+        if Cache.match(url) != expected:
+            raise Exception('dispatcher mismatch for {}: {} != {}'.format(url, Cache.match(url), expected))
+
+    print('{:,} urls, {:,} unique, {} patterns'.format(len(urls), len(set(urls)), len(patterns)))
+
+    # Each request is classified by get() and put() or by delete().
+    def sequential():
+        for url in urls:
+            for _ in range(2):
+                match_sequential(patterns, unquote(url))
+                Cache.spliturl(unquote(url))
+
+    def dispatcher():
+        for url in urls:
+            for _ in range(2):
+                Cache.match(unquote(url))
+                Cache.spliturl(unquote(url))
+
+    def classify():
+        for url in urls:
+            for _ in range(2):
+                Cache.classify(url)
+
+    timed('sequential', len(urls), sequential)
+    timed('dispatcher', len(urls), dispatcher)
+    timed('dispatcher + memo', len(urls), classify)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--apiurl', default='https://api.example.com', help='apiurl used for synthetic urls')
+    parser.add_argument('--count', type=int, default=100000, help='number of synthetic urls')
+    parser.add_argument('--urls', help='file containing recorded urls, one per line')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+"""
+Compare extraction of library files from an rpm payload by osclib.cpio.Cpio
+streaming from rpm2cpio with the previous approach of abichecker of writing
+the whole payload to a temporary file and copying wanted files from it.
+
+Uses the given rpm and extracts its libraries and debug files or generates a
+synthetic payload similar to that of a large library rpm with debug info (a
+library, its debug file, documentation and data files) which is passed through
+cat in place of rpm2cpio.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import subprocess
+import tempfile
+from time import perf_counter
+
+from osc.util.cpio import CpioRead
+
+from osclib.cpio import Cpio
+
+so_re = re.compile(r'^(?:/usr)?/lib(?:64)?/lib([^/]+)\.so(?:\.[^/]+)?')
+debug_re = re.compile(r'^/usr/lib/debug/.*\.debug$')
+
+MiB = 1024 * 1024
+
+
+def archive_member(f, ino, name, mode, size, rng):
+    name = name.encode('utf-8') + b'\0'
+    fields = [ino, mode, 0, 0, 1, 0, size, 0, 0, 0, 0, len(name), 0]
+    header = b'070701' + ''.join('{:08x}'.format(field) for field in fields).encode('ascii') + name
+    f.write(header + b'\0' * (-len(header) % 4))
+
+    block = rng.randbytes(MiB)
+    written = 0
+    while written < size:
+        chunk = block[:min(MiB, size - written)]
+        f.write(chunk)
+        written += len(chunk)
+    f.write(b'\0' * (-size % 4))
+
+
+def archive_synthetic(path, size, seed):
+    rng = random.Random(seed)
+    members = [
+        ('./usr/lib64/libbenchmark.so.1.0.0', 0o100755, size // 5),
+        ('./usr/lib/debug/usr/lib64/libbenchmark.so.1.0.0.debug', 0o100644, size // 2),
+        ('./usr/share/benchmark/data.bin', 0o100644, size // 5),
+    ]
+    for i in range(size // 10 // (16 * 1024)):
+        members.append(('./usr/share/doc/packages/benchmark/doc{}.html'.format(i), 0o100644, 16 * 1024))
+    members.append(('TRAILER!!!', 0, 0))
+
+    with open(path, 'wb') as f:
+        for ino, (name, mode, member_size) in enumerate(members, start=1):
+            archive_member(f, ino, name, mode, member_size, rng)
+        # cpio pads the archive to blocks of 512 bytes
+        f.write(b'\0' * (-f.tell() % 512))
+
+    return len(members) - 1
+
+
+def wanted_file(name):
+    return bool(so_re.match(name) or debug_re.match(name))
+
+
+def extract_tmpfile(command, base, tmpdir):
+    # Previous approach of abichecker.extract().
+    tmpfile = os.path.join(tmpdir, 'cpio')
+    with open(tmpfile, 'wb') as tmpfd:
+        r = subprocess.call(command, stdout=tmpfd, close_fds=True)
+        if r != 0:
+            raise Exception('failed to extract')
+    cpio = CpioRead(tmpfile)
+    cpio.read()
+    for ch in cpio:
+        fn = ch.filename.decode('utf-8')
+        if fn.startswith('./'):
+            fn = fn[1:]
+        if not wanted_file(fn):
+            continue
+        dst = base + fn
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # The previous loop copied until the end of the archive rather than
+        # the size of the member which is fixed here for a fair comparison.
+        with open(tmpfile, 'rb') as cpiofh:
+            cpiofh.seek(ch.dataoff, os.SEEK_SET)
+            remaining = ch.filesize
+            with open(dst, 'wb') as fh:
+                while remaining:
+                    buf = cpiofh.read(min(4096, remaining))
+                    if buf is None or buf == b'':
+                        break
+                    fh.write(buf)
+                    remaining -= len(buf)
+    written = os.path.getsize(tmpfile)
+    os.unlink(tmpfile)
+    return written
+
+
+def extract_stream(command, base, tmpdir):
+    p = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=0, close_fds=True)
+    try:
+        for ch in Cpio(p.stdout):
+            fn = ch.name
+            if fn.startswith('./'):
+                fn = fn[1:]
+            if not wanted_file(fn):
+                continue
+            dst = base + fn
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, 'wb') as fh:
+                ch.copy(fh)
+        p.stdout.read()
+    finally:
+        p.stdout.close()
+    if p.wait() != 0:
+        raise Exception('failed to extract')
+    return 0
+
+
+def digest(base):
+    digests = {}
+    for directory, _, files in os.walk(base):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as f:
+                digests[os.path.relpath(path, base)] = hashlib.md5(f.read()).hexdigest()
+    return digests
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.rpm:
+            command = ['rpm2cpio', args.rpm]
+            size = os.path.getsize(args.rpm)
+            print('{}: {:.1f} MiB'.format(args.rpm, size / MiB))
+        else:
+            path = os.path.join(tmpdir, 'payload.cpio')
+            members = archive_synthetic(path, args.size * MiB, args.seed)
+            command = ['cat', path]
+            size = os.path.getsize(path)
+            print('synthetic payload: {:.1f} MiB, {:,} files'.format(size / MiB, members))
+
+        results = []
+        for name, extract in (('tmpfile', extract_tmpfile), ('stream', extract_stream)):
+            base = os.path.join(tmpdir, name)
+            os.makedirs(base)
+            start = perf_counter()
+            written = extract(command, base, tmpdir)
+            duration = perf_counter() - start
+            results.append(digest(base))
+            print('{:>8}: {:.2f}s, {:.0f} MiB/s of payload, {:.1f} MiB temporary file'.format(
+                name, duration, size / MiB / duration, written / MiB))
+
+    print('extracted {} files'.format(len(results[0])))
+    if results[0] != results[1]:
+        print('MISMATCH between extracted files')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rpm', help='rpm to extract instead of a synthetic payload (requires rpm2cpio)')
+    parser.add_argument('--size', type=int, default=512, help='size of synthetic payload in MiB')
+    parser.add_argument('--seed', type=int, default=0)
+    raise SystemExit(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+"""
+Measure osclib.fetch.fetch() throughput against a local fake OBS.
+
+Starts a threaded HTTP server on localhost which answers every GET with a small
+XML document after a configurable delay, simulating API latency, and fetches a
+batch of urls at different concurrency levels.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import os
+import tempfile
+import threading
+from time import perf_counter
+from time import sleep
+
+from osc import conf
+
+from osclib.fetch import fetch
+
+OSCRC = """[general]
+apiurl = {apiurl}
+
+[{apiurl}]
+user = benchmark
+pass = benchmark
+allow_http = 1
+"""
+
+
+def handler_factory(latency, body):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(args):
+    body = ('<directory>' + '<entry name="package-{}"/>' * args.entries + '</directory>').encode('utf-8')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_factory(args.latency / 1000, body))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    apiurl = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    with tempfile.NamedTemporaryFile('w', suffix='.oscrc') as oscrc:
+        oscrc.write(OSCRC.format(apiurl=apiurl))
+        oscrc.flush()
+        os.chmod(oscrc.name, 0o600)
+        conf.get_config(override_conffile=oscrc.name, override_apiurl=apiurl)
+
+        urls = ['{}/source/project/package-{}'.format(apiurl, i) for i in range(args.count)]
+        print('{} urls with {}ms latency'.format(args.count, args.latency))
+        baseline = None
+        for concurrency in args.concurrency:
+            start = perf_counter()
+            roots = fetch(urls, concurrency=concurrency)
+            duration = perf_counter() - start
+            assert len(roots) == len(urls)
+            baseline = baseline or duration
+            print('concurrency {:>3}: {:>8.3f}s {:>8.1f} urls/s {:>6.1f}x'.format(
+                concurrency, duration, len(urls) / duration, baseline / duration))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='concurrency levels to measure')
+    parser.add_argument('--count', type=int, default=200, help='number of urls to fetch')
+    parser.add_argument('--entries', type=int, default=50, help='entries in each response')
+    parser.add_argument('--latency', type=int, default=50, help='simulated latency in milliseconds')
+    args = parser.parse_args()
+
+    main(args)
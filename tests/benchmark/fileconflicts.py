@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+"""
+Compare osclib.fileconflicts with the findfileconflicts perl script.
+
+Runs both on a susetags packages file, as written by
+write_repo_susetags_file.pl for the repo checker, verifying that the same
+conflicts are found. Without a packages file a synthetic one is generated
+with the given number of packages containing shared directories, identical
+and mismatched files, ghosts, symlinks, multiple versions of a package, and
+files that are also implicit directories.
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+from time import perf_counter
+
+import yaml
+
+from osclib.fileconflicts import fileconflicts
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def package_write(f, name, version, files, provides=(), obsoletes=(), arch='x86_64'):
+    f.write('=Pkg: {} {} 1.1 {}\n'.format(name, version, arch))
+    f.write('+Prv:\n')
+    f.write('{} = {}-1.1\n'.format(name, version))
+    for provide in provides:
+        f.write(provide + '\n')
+    f.write('-Prv:\n')
+    if obsoletes:
+        f.write('+Obs:\n')
+        for obsolete in obsoletes:
+            f.write(obsolete + '\n')
+        f.write('-Obs:\n')
+    f.write('+Flx:\n')
+    for file in files:
+        f.write(file + '\n')
+    f.write('-Flx:\n')
+
+
+def packages_synthetic(path, count):
+    with open(path, 'w') as f:
+        f.write('=Ver: 2.0\n')
+        package_write(f, 'filesystem', 1, [
+            '40755 0 root:root /usr/',
+            '40755 0 root:root /usr/bin/',
+            '40755 0 root:root /usr/lib/',
+            '40755 0 root:root /usr/share/',
+            '120777 0 root:root /bin -> usr/bin',
+        ])
+        for i in range(count):
+            name = 'package-{}'.format(i)
+            group = i // 10
+            files = ['40755 0 root:root /usr/share/{}/'.format(name)]
+            files += ['100644 0 root:root /usr/share/{}/data-{}'.format(name, j) for j in range(20)]
+            files += [
+                '100755 0 root:root /usr/bin/{}'.format(name),
+                # shared directory
+                '40755 0 root:root /usr/share/group-{}/'.format(group),
+                # conflicting file within group
+                '100644 0 root:root /usr/share/group-{}/config'.format(group),
+                # same file through /bin and /usr/bin
+                '100755 0 root:root /bin/tool-{}'.format(group),
+                # ghost and symlink shared without conflict
+                '100000 100 root:root /var/lib/group-{}/state'.format(group),
+                '120777 0 root:root /usr/lib/group-{}.so -> libgroup.so.1'.format(group),
+            ]
+            if i % 10 == 1:
+                # mode mismatch
+                files.append('100600 0 root:root /usr/share/group-{}/secret'.format(group))
+            elif i % 10 == 2:
+                files.append('40700 0 root:root /usr/share/group-{}/secret/'.format(group))
+            elif i % 10 == 3:
+                # file that is a directory in other packages
+                files.append('100644 0 root:root /usr/share/group-{}/secret'.format(group))
+            obsoletes = ['package-{}'.format(i - 1)] if i % 10 == 5 else ()
+            package_write(f, name, 1, files, obsoletes=obsoletes)
+            if i % 50 == 0:
+                # another version of the same package
+                package_write(f, name, 2, files)
+
+
+def perl(path):
+    script = os.path.join(ROOT, 'findfileconflicts')
+    p = subprocess.run(['perl', script, path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    conflicts = []
+    for conflict in yaml.safe_load(p.stdout) or []:
+        sp1, sp2 = [[str(part) for part in sp] for sp in conflict['between']]
+        conflicts.append((sp1, sp2, conflict['conflicts'].split('\n')))
+    return conflicts
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.packages
+        if not path:
+            path = os.path.join(directory, 'packages')
+            packages_synthetic(path, args.count)
+        print('{}: {:.1f} MiB'.format(path, os.path.getsize(path) / 1024 / 1024))
+
+        start = perf_counter()
+        expected = perl(path)
+        perl_duration = perf_counter() - start
+        print('findfileconflicts: {:.3f}s, {} conflicts'.format(perl_duration, len(expected)))
+
+        start = perf_counter()
+        conflicts = list(fileconflicts(path))
+        duration = perf_counter() - start
+        print('osclib.fileconflicts: {:.3f}s, {} conflicts ({:.1f}x)'.format(
+            duration, len(conflicts), perl_duration / duration))
+
+    # Versions like 1.10 are parsed as floats from the perl YAML output.
+    if args.packages:
+        expected = [(sp1[:1] + sp1[2:], sp2[:1] + sp2[2:], files) for sp1, sp2, files in expected]
+        conflicts = [(sp1[:1] + sp1[2:], sp2[:1] + sp2[2:], files) for sp1, sp2, files in conflicts]
+    if conflicts != expected:
+        print('MISMATCH between findfileconflicts and osclib.fileconflicts')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packages', help='susetags packages file instead of a synthetic one')
+    parser.add_argument('--count', type=int, default=20000, help='packages in synthetic packages file')
+    raise SystemExit(main(parser.parse_args()))
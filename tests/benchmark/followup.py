@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+"""
+Compare osclib.repochecks.followup_replace() with the previous N*N replacement.
+
+Generates synthetic installcheck problem output as parsed by
+project-installcheck.py after a library bump: a number of packages are
+missing a library and chains of packages depend on them, so that the output
+of each package contains the outputs of the packages it requires.
+"""
+
+import argparse
+import random
+from time import perf_counter
+
+from osclib.repochecks import followup_replace
+
+REQUIRES = 'package {}-1.0.x86_64 requires {}, but none of the providers can be installed'
+MISSING = 'nothing provides lib{}.so.{}()(64bit) needed by {}-1.0.x86_64'
+
+
+def outputs_synthetic(count, seed):
+    rng = random.Random(seed)
+    outputs = dict()
+    names = []
+    for i in range(count):
+        name = 'package-{}'.format(i)
+        if not names or i % 5 == 0:
+            output = MISSING.format(rng.choice(['ssl', 'icu', 'boost', 'python3']), rng.randint(1, 80), name)
+        else:
+            required = rng.choice(names[-50:])
+            output = REQUIRES.format(name, required) + '\n' + outputs[required]
+        names.append(name)
+        outputs[name] = output
+
+    # installcheck reports in alphabetical order
+    return {name: outputs[name] for name in sorted(outputs)}
+
+
+def followup_replace_legacy(outputs):
+    """Previous implementation for comparison."""
+    outputs = dict(outputs)
+    for package1 in outputs:
+        output = outputs[package1]
+        for package2 in outputs:
+            if package1 == package2:
+                continue
+            output = output.replace(outputs[package2], 'FOLLOWUP(' + package2 + ')')
+        outputs[package1] = output
+    return outputs
+
+
+def main(args):
+    outputs = outputs_synthetic(args.count, args.seed)
+    size = sum(len(output) for output in outputs.values())
+    print('{} failures, {:.1f} MiB output'.format(len(outputs), size / 1024 / 1024))
+
+    start = perf_counter()
+    expected = followup_replace_legacy(outputs)
+    legacy_duration = perf_counter() - start
+    print('legacy: {:.3f}s'.format(legacy_duration))
+
+    start = perf_counter()
+    replaced = followup_replace(outputs)
+    duration = perf_counter() - start
+    print('followup_replace: {:.3f}s ({:.1f}x)'.format(duration, legacy_duration / duration))
+
+    if replaced != expected:
+        print('MISMATCH between legacy and followup_replace()')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=5000, help='number of failing packages')
+    parser.add_argument('--seed', type=int, default=0)
+    raise SystemExit(main(parser.parse_args()))
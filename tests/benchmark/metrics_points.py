@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+"""
+Measure peak memory of walking metrics request points.
+
+Generates points for a synthetic request history similar to those created by
+metrics.ingest_request() and walks them both by keeping all points in memory
+and sorting them as previously done and through metrics.PointRuns which writes
+sorted runs to disk and merges them. Each runs in a fresh process so the peak
+RSS reported is that of the approach alone. The points written to InfluxDB,
+replaced by a stub, are compared.
+
+Requires the dependencies of metrics.py (ie. influxdb).
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import random
+import resource
+from time import perf_counter
+
+import metrics_release  # noqa: F401 metrics can only be imported after metrics_release
+import metrics
+from metrics import Point
+
+START = 1500000000
+
+
+class Client(object):
+    def __init__(self):
+        self.count = 0
+        self.digest = hashlib.sha1()
+
+    def drop_measurement(self, measurement):
+        pass
+
+    def write_points(self, points, precision):
+        self.count += len(points)
+        for point in points:
+            self.digest.update(repr((point['measurement'], sorted(point['tags'].items()),
+                                     sorted(point['fields'].items()), point['time'])).encode('utf-8'))
+
+
+def request_points(rng, request_id):
+    created = START + request_id * 60 + rng.randint(0, 3600)
+    final = created + rng.randint(3600, 10 * 86400)
+
+    yield Point('total', {'event': 'create'}, {'backlog': 1, 'open': 1}, created, True)
+    yield Point('total', {'event': 'close'}, {'backlog': -1, 'open': -1}, final, True)
+
+    tags = {}
+    fields = {'total': final - created, 'staged_count': 0}
+    if rng.random() < 0.7:
+        staging = rng.choice('ABCDEFGHIJ')
+        staged = created + rng.randint(60, final - created - 60)
+        unstaged = rng.randint(staged, final)
+        tags = {'type': 'letter', 'whitelisted': True}
+        fields['staged_count'] = 1
+        fields['staged_first'] = staged - created
+
+        yield Point('request_staged_first', tags, {'value': fields['staged_first']}, staged, False)
+        yield Point('staging', {'id': staging, 'type': 'letter', 'event': 'select'}, {'count': 1}, staged, True)
+        yield Point('total', {'event': 'select'}, {'backlog': -1, 'staged': 1}, staged, True)
+        yield Point('user', dict(tags, event='select', user='user{}'.format(rng.randint(0, 20)), number=1),
+                    {'count': 1}, staged, False)
+        yield Point('staging', {'id': staging, 'type': 'letter', 'event': 'unselect'}, {'count': -1}, unstaged, True)
+        yield Point('total', {'event': 'unselect'}, {'backlog': 1, 'staged': -1}, unstaged, True)
+
+    yield Point('request', tags, fields, final, False)
+
+    for group in rng.sample(['legal-auto', 'opensuse-review-team', 'factory-auto', 'repo-checker'], 2):
+        completed = rng.randint(created, final)
+        review_tags = {'state': 'accepted', 'who_completed': group, 'key': [group], 'type': 'group', 'by_group': group}
+        yield Point('review', review_tags, {'open_for': completed - created}, completed, False)
+        yield Point('review_count', review_tags, {'count': 1}, created, True)
+        yield Point('review_count', review_tags, {'count': -1}, completed, True)
+
+    if rng.random() < 0.05:
+        yield Point('priority', {'level': 'important'}, {'count': 1}, created, True)
+        yield Point('priority', {'level': 'important'}, {'count': -1}, final, True)
+
+
+def history(count, seed):
+    rng = random.Random(seed)
+    for request_id in range(1, count + 1):
+        yield request_id, list(request_points(rng, request_id))
+
+
+def walk_memory(count, seed):
+    # Previous approach of ingest_requests() and walk_points().
+    points = []
+    for _, request_points in history(count, seed):
+        points.extend(request_points)
+    return metrics.walk_points(sorted(points, key=lambda p: p.time), 'benchmark'), len(points)
+
+
+def walk_runs(count, seed):
+    runs = metrics.PointRuns()
+    for request_id, request_points in history(count, seed):
+        runs.extend(request_id, request_points)
+    try:
+        return metrics.walk_points((point for _, point in runs.merged()), 'benchmark'), runs.count
+    finally:
+        runs.close()
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(walk, count, seed, queue):
+    metrics.client = Client()
+    before = peak_rss()
+    start = perf_counter()
+    wrote, points = walk(count, seed)
+    queue.put((perf_counter() - start, before, peak_rss(), points, wrote, metrics.client.digest.hexdigest()))
+
+
+def main(args):
+    print('{:,} requests'.format(args.count))
+    context = multiprocessing.get_context('fork')
+    digests = set()
+    for name, walk in (('memory', walk_memory), ('PointRuns', walk_runs)):
+        queue = context.Queue()
+        process = context.Process(target=measure, args=(walk, args.count, args.seed, queue))
+        process.start()
+        duration, before, after, points, wrote, digest = queue.get()
+        process.join()
+        digests.add(digest)
+        print('{:>10}: {:.2f}s, {:,} points, wrote {:,}, peak RSS {:.1f} MiB before, {:.1f} MiB after'.format(
+            name, duration, points, wrote, before, after))
+
+    if len(digests) != 1:
+        print('MISMATCH between points written')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='number of requests')
+    parser.add_argument('--seed', type=int, default=0)
+    raise SystemExit(main(parser.parse_args()))
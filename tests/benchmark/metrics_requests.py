@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+
+"""
+Compare request extraction of metrics.ingest_requests() with the previous
+approach of querying the request elements.
+
+Generates a synthetic /search/request result of requests with full history (or
+uses the given recorded one) and ingests it both by parsing the whole result
+and evaluating the XPath queries of the previous ingest_request() on each
+request and by search_requests() and ingest_request(). Each runs in a fresh
+process so the peak RSS reported is that of the approach alone and the points
+created are compared.
+
+Requires the dependencies of metrics.py (ie. influxdb).
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+from time import perf_counter
+from time import process_time
+from xml.sax.saxutils import escape
+
+from dateutil.parser import parse as date_parse
+from lxml import etree as ET
+
+import metrics_release  # noqa: F401 metrics can only be imported after metrics_release
+import metrics
+from metrics import point
+
+PROJECT = 'openSUSE:Factory'
+START = datetime(2019, 1, 1)
+
+
+class API(object):
+    cstaging = PROJECT + ':Staging'
+
+    def is_adi_project(self, p):
+        return ':adi:' in p
+
+    def extract_staging_short(self, p):
+        return p[len(self.cstaging) + 1:] if p.startswith(self.cstaging) else p
+
+
+def when(time):
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def history(time, who, description, comment=None):
+    xml = '<history who="{}" when="{}"><description>{}</description>'.format(who, when(time), escape(description))
+    if comment:
+        xml += '<comment>{}</comment>'.format(escape(comment))
+    return xml + '</history>'
+
+
+def request_synthetic(rng, request_id):
+    created = START + timedelta(minutes=request_id * 7)
+    time = created
+    reviews = []
+    histories = [history(created, 'packager', 'Request created')]
+
+    def later(minutes):
+        nonlocal time
+        time += timedelta(minutes=rng.randint(1, minutes))
+        return time
+
+    for group in ('factory-auto', 'legal-auto', 'opensuse-review-team'):
+        reviews.append('<review state="accepted" when="{}" who="bot" by_group="{}">{}</review>'.format(
+            when(created), group, history(later(600), group + '-bot', 'Review got accepted', 'ok')))
+
+    staged = []
+    for _ in range(rng.choice([0, 1, 1, 1, 2])):
+        staging = rng.choice(['A', 'B', 'C', 'adi:{}'.format(rng.randint(1, 90))])
+        by_project = '{}:Staging:{}'.format(PROJECT, staging)
+        select = later(2000)
+        histories.append(history(select, 'staging-master', 'Review got added',
+                                 'Being evaluated by staging project "{}"'.format(by_project)))
+        done = later(3000)
+        comment = 'ready to accept' if 'adi' in staging else 'Staging accepted'
+        staged.append(history(done, 'staging-bot', 'Review got accepted', comment))
+        reviews.append('<review state="accepted" when="{}" who="staging-bot" by_project="{}">{}</review>'.format(
+            when(select), by_project, history(done, 'staging-bot', 'Review got accepted', comment)))
+    reviews.insert(0, '<review state="accepted" when="{}" who="factory-staging" by_group="factory-staging">{}</review>'.format(
+        when(created), ''.join(staged)))
+
+    priority = ''
+    if rng.random() < 0.1:
+        histories.append(history(later(100), 'maintainer', 'Request got a new priority: moderate => important'))
+        priority = '<priority>important</priority>'
+
+    final = later(1000)
+    histories.append(history(final, 'maintainer', 'Request got accepted', 'accepted'))
+    return ('<request id="{id}" creator="packager">'
+            '<action type="submit"><source project="devel:{id}" package="package-{id}" rev="1"/>'
+            '<target project="{project}" package="package-{id}"/></action>'
+            '<state name="accepted" who="maintainer" when="{final}" created="{created}"><comment>accepted</comment></state>'
+            '{reviews}{histories}{priority}<description>Update package-{id} to version 1.{id}</description>'
+            '</request>\n').format(id=request_id, project=PROJECT, final=when(final), created=when(created),
+                                   reviews=''.join(reviews), histories=''.join(histories), priority=priority)
+
+
+def search_synthetic(path, count, seed):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('<collection matches="{}">\n'.format(count))
+        for request_id in range(1, count + 1):
+            f.write(request_synthetic(rng, request_id))
+        f.write('</collection>\n')
+
+
+def ingest_request_legacy(api, project, request):
+    """Previous implementation for comparison."""
+    if request.find('action').get('type') not in ('submit', 'delete'):
+        # TODO Handle non-stageable requests via different flow.
+        return
+
+    created_at = date_parse(request.find('history').get('when'))
+    final_at = date_parse(request.find('state').get('when'))
+    final_at_history = date_parse(request.find('history[last()]').get('when'))
+    if final_at_history > final_at:
+        # Workaround for invalid dates: openSUSE/open-build-service#3858.
+        final_at = final_at_history
+
+    # TODO Track requests in psuedo-ignore state.
+    point('total', {'backlog': 1, 'open': 1}, created_at, {'event': 'create'}, True)
+    point('total', {'backlog': -1, 'open': -1}, final_at, {'event': 'close'}, True)
+
+    request_tags = {}
+    request_fields = {
+        'total': (final_at - created_at).total_seconds(),
+        'staged_count': len(request.findall('review[@by_group="factory-staging"]/history')),
+    }
+    # TODO Total time spent in backlog (ie factory-staging, but excluding when staged).
+
+    staged_first_review = request.xpath('review[contains(@by_project, "{}:Staging:")]'.format(project))
+    if len(staged_first_review):
+        by_project = staged_first_review[0].get('by_project')
+        request_tags['type'] = 'adi' if api.is_adi_project(by_project) else 'letter'
+
+        # TODO Determine current whitelists state based on dashboard revisions.
+        if project.startswith('openSUSE:Factory'):
+            splitter_whitelist = 'B C D E F G H I J'.split()
+            if splitter_whitelist:
+                short = api.extract_staging_short(by_project)
+                request_tags['whitelisted'] = short in splitter_whitelist
+        else:
+            # All letter where whitelisted since no restriction.
+            request_tags['whitelisted'] = request_tags['type'] == 'letter'
+
+    xpath = 'review[contains(@by_project, "{}:Staging:adi:") and @state="accepted"]/'.format(project)
+    xpath += 'history[comment[text() = "ready to accept"]]/@when'
+    ready_to_accept = request.xpath(xpath)
+    if len(ready_to_accept):
+        ready_to_accept = date_parse(ready_to_accept[0])
+        request_fields['ready'] = (final_at - ready_to_accept).total_seconds()
+
+        # TODO Points with indentical timestamps are merged so this can be placed in total
+        # measurement, but may make sense to keep this separate and make the others follow.
+        point('ready', {'count': 1}, ready_to_accept, delta=True)
+        point('ready', {'count': -1}, final_at, delta=True)
+
+    staged_first = request.xpath('review[@by_group="factory-staging"]/history/@when')
+    if len(staged_first):
+        staged_first = date_parse(staged_first[0])
+        request_fields['staged_first'] = (staged_first - created_at).total_seconds()
+
+        # TODO Decide if better to break out all measurements by time most relevant to event,
+        # time request was created, or time request was finalized. It may also make sense to
+        # keep separate measurement by different times like this one.
+        point('request_staged_first', {'value': request_fields['staged_first']}, staged_first, request_tags)
+
+    point('request', request_fields, final_at, request_tags)
+
+    # Staging related reviews.
+    for number, review in enumerate(
+            request.xpath('review[contains(@by_project, "{}:Staging:")]'.format(project)), start=1):
+        staged_at = date_parse(review.get('when'))
+
+        project_type = 'adi' if api.is_adi_project(review.get('by_project')) else 'letter'
+        short = api.extract_staging_short(review.get('by_project'))
+        point('staging', {'count': 1}, staged_at,
+              {'id': short, 'type': project_type, 'event': 'select'}, True)
+        point('total', {'backlog': -1, 'staged': 1}, staged_at, {'event': 'select'}, True)
+
+        who = who_workaround_legacy(request, review)
+        review_tags = {'event': 'select', 'user': who, 'number': number}
+        review_tags.update(request_tags)
+        point('user', {'count': 1}, staged_at, review_tags)
+
+        history = review.find('history')
+        if history is not None:
+            unselected_at = date_parse(history.get('when'))
+        else:
+            unselected_at = final_at
+
+        # If a request is declined and re-opened it must be repaired before being re-staged. At
+        # which point the only possible open review should be the final one.
+        point('staging', {'count': -1}, unselected_at,
+              {'id': short, 'type': project_type, 'event': 'unselect'}, True)
+        point('total', {'backlog': 1, 'staged': -1}, unselected_at, {'event': 'unselect'}, True)
+
+    # No-staging related reviews.
+    for review in request.xpath('review[not(contains(@by_project, "{}:Staging:"))]'.format(project)):
+        tags = {
+            # who_added is non-trivial due to openSUSE/open-build-service#3898.
+            'state': review.get('state'),
+        }
+
+        opened_at = date_parse(review.get('when'))
+        history = review.find('history')
+        if history is not None:
+            completed_at = date_parse(history.get('when'))
+            tags['who_completed'] = history.get('who')
+        else:
+            completed_at = final_at
+            # Does not seem to make sense to mirror user responsible for making final state
+            # change as the user who completed the review.
+
+        tags['key'] = []
+        tags['type'] = []
+        for name, value in sorted(review.items(), reverse=True):
+            if name.startswith('by_'):
+                tags[name] = value
+                tags['key'].append(value)
+                tags['type'].append(name[3:])
+        tags['type'] = '_'.join(tags['type'])
+
+        point('review', {'open_for': (completed_at - opened_at).total_seconds()}, completed_at, tags)
+        point('review_count', {'count': 1}, opened_at, tags, True)
+        point('review_count', {'count': -1}, completed_at, tags, True)
+
+    found = []
+    for set_priority in request.xpath('history[description[contains(text(), "Request got a new priority:")]]'):
+        parts = set_priority.find('description').text.rsplit(' ', 3)
+        priority_previous = parts[1]
+        priority = parts[3]
+        if priority == priority_previous:
+            continue
+
+        changed_at = date_parse(set_priority.get('when'))
+        if priority_previous != 'moderate':
+            point('priority', {'count': -1}, changed_at, {'level': priority_previous}, True)
+        if priority != 'moderate':
+            point('priority', {'count': 1}, changed_at, {'level': priority}, True)
+            found.append(priority)
+
+    # Ensure a final removal entry is created when request is finalized.
+    priority = request.find('priority')
+    if priority is not None and priority.text != 'moderate':
+        if priority.text in found:
+            point('priority', {'count': -1}, final_at, {'level': priority.text}, True)
+        else:
+            print('unable to find priority history entry for {} to {}'.format(request.get('id'), priority.text))
+
+
+def who_workaround_legacy(request, review, relax=False):
+    # Super ugly workaround for incorrect and missing data:
+    # - openSUSE/open-build-service#3857
+    # - openSUSE/open-build-service#3898
+    global who_workaround_swap, who_workaround_miss
+
+    who = review.get('who')  # All that should be required (used as fallback).
+    when = review.get('when')
+    if relax:
+        # Super hack, chop off seconds to relax in hopes of finding potential.
+        when = when[:-2]
+
+    who_real = request.xpath(
+        'history[contains(@when, "{}") and comment[contains(text(), "{}")]]/@who'.format(
+            when, review.get('by_project')))
+    if len(who_real):
+        who = who_real[0]
+        who_workaround_swap += 1
+    elif not relax:
+        return who_workaround_legacy(request, review, True)
+    else:
+        who_workaround_miss += 1
+
+    return who
+
+
+def ingest_elements(path):
+    # Previous approach of search_paginated_generator() and ingest_request().
+    collection = ET.parse(path).getroot()
+    for request in collection.findall('request'):
+        ingest_request_legacy(API(), PROJECT, request)
+        yield
+
+
+def ingest_records(path):
+    with open(path, 'rb') as f:
+        for request in metrics.search_requests(f):
+            if isinstance(request, int):
+                continue
+            metrics.ingest_request(API(), PROJECT, request)
+            yield
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(ingest, path, queue):
+    global who_workaround_swap, who_workaround_miss
+    metrics.who_workaround_swap = metrics.who_workaround_miss = 0
+    who_workaround_swap = who_workaround_miss = 0
+
+    digest = hashlib.sha1()
+    count = 0
+    before = peak_rss()
+    start = perf_counter()
+    cpu = process_time()
+    for _ in ingest(path):
+        for p in metrics.points:
+            digest.update(repr(p).encode('utf-8'))
+            count += 1
+        del metrics.points[:]
+    queue.put((perf_counter() - start, process_time() - cpu, before, peak_rss(), count, digest.hexdigest()))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.search
+        if not path:
+            path = os.path.join(directory, 'search.xml')
+            search_synthetic(path, args.count, args.seed)
+        print('{}: {:.1f} MiB'.format(path, os.path.getsize(path) / 1024 / 1024))
+
+        context = multiprocessing.get_context('fork')
+        digests = set()
+        for name, ingest in (('elements', ingest_elements), ('records', ingest_records)):
+            queue = context.Queue()
+            process = context.Process(target=measure, args=(ingest, path, queue))
+            process.start()
+            duration, cpu, before, after, count, digest = queue.get()
+            process.join()
+            digests.add(digest)
+            print('{:>8}: {:.2f}s ({:.2f}s CPU), {:,} points, peak RSS {:.1f} MiB before, {:.1f} MiB after'.format(
+                name, duration, cpu, count, before, after))
+
+    if len(digests) != 1:
+        print('MISMATCH between points created')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--search', help='recorded /search/request result instead of a synthetic one')
+    parser.add_argument('--count', type=int, default=50000, help='requests in synthetic result')
+    parser.add_argument('--seed', type=int, default=0)
+    raise SystemExit(main(parser.parse_args()))
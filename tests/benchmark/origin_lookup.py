@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+"""
+Measure parallel origin lookup generation in osc-origin.py.
+
+Replays a recorded lookup (ex. ~/.cache/openSUSE-release-tools/origin-manager/
+openSUSE:Leap:15.2.yaml) through osrt_origin_lookup_generate() at different job
+counts. Each package costs the given latency, standing in for the origin_find()
+and origin_revision_state() round-trips, and returns the recorded entry so the
+generated lookup can be compared to the recording. Without a recording a
+synthetic one is generated.
+"""
+
+import argparse
+from importlib.machinery import SourceFileLoader
+import os
+import tempfile
+from time import perf_counter
+from time import sleep
+
+import yaml
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def lookup_synthetic(count):
+    lookup = {}
+    for i in range(count):
+        lookup['package-{}'.format(i)] = {
+            'origin': 'openSUSE:Factory' if i % 3 else 'SUSE:SLE-15:GA',
+            'revisions': [1] * (i % 10),
+        }
+    return lookup
+
+
+def main(args):
+    origin = SourceFileLoader('osc_origin', os.path.join(ROOT, 'osc-origin.py')).load_module()
+
+    if args.lookup:
+        with open(args.lookup) as f:
+            recorded = yaml.safe_load(f)
+    else:
+        recorded = lookup_synthetic(args.count)
+
+    def osrt_origin_lookup_entry(apiurl, project, package):
+        sleep(args.latency / 1000)
+        return recorded[package]
+
+    origin.osrt_origin_lookup_entry = osrt_origin_lookup_entry
+    expected = yaml.dump(recorded, default_flow_style=False)
+
+    print('{} packages with {}ms latency'.format(len(recorded), args.latency))
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        lookup_path = os.path.join(directory, 'lookup.yaml')
+        for jobs in args.jobs:
+            start = perf_counter()
+            lookup = origin.osrt_origin_lookup_generate(None, None, recorded.keys(), lookup_path, jobs, True)
+            duration = perf_counter() - start
+            os.remove(origin.osrt_origin_lookup_partial_file(lookup_path))
+
+            if yaml.dump(lookup, default_flow_style=False) != expected:
+                raise Exception('lookup generated with {} jobs differs from recording'.format(jobs))
+
+            baseline = baseline or duration
+            print('jobs {:>3}: {:>8.3f}s {:>6.1f}x'.format(jobs, duration, baseline / duration))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=500, help='number of synthetic packages')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='job counts to measure')
+    parser.add_argument('--latency', type=int, default=20, help='simulated latency per package in milliseconds')
+    parser.add_argument('--lookup', help='recorded lookup yaml')
+    args = parser.parse_args()
+
+    main(args)
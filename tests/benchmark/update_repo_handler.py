@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+"""
+Measure peak memory of repository metadata ingestion in update_repo_handler.
+
+Serves a synthetic primary.xml.gz (or the given local file) over HTTP and
+ingests it into a temporary file, as done before libsolv parses it, both by
+loading the whole download into memory as previously done and by
+download_gunzip(). Each runs in a fresh process so the peak RSS reported is
+that of the ingestion alone.
+
+Requires the solv python bindings since update_repo_handler imports them.
+"""
+
+import argparse
+import functools
+import gzip
+import hashlib
+import http.server
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+from time import perf_counter
+
+import requests
+
+from pkglistgen.update_repo_handler import download_gunzip
+
+PACKAGE = '''<package type="rpm">
+  <name>package-{i}</name>
+  <arch>x86_64</arch>
+  <version epoch="0" ver="1.{i}" rel="1.1"/>
+  <checksum type="sha256" pkgid="YES">{checksum}</checksum>
+  <summary>Synthetic package {i}</summary>
+  <description>Synthetic package {i} used to measure repository ingestion.</description>
+  <location href="x86_64/package-{i}-1.{i}-1.1.x86_64.rpm"/>
+  <format>
+    <rpm:provides><rpm:entry name="package-{i}" flags="EQ" epoch="0" ver="1.{i}" rel="1.1"/></rpm:provides>
+    <rpm:requires><rpm:entry name="package-{j}"/></rpm:requires>
+  </format>
+</package>
+'''
+
+
+def primary_synthetic(path, count):
+    with gzip.open(path, 'wt') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<metadata xmlns="http://linux.duke.edu/metadata/common" '
+                'xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="{}">\n'.format(count))
+        for i in range(count):
+            checksum = hashlib.sha256(str(i).encode('utf-8')).hexdigest()
+            f.write(PACKAGE.format(i=i, j=(i + 1) % count, checksum=checksum))
+        f.write('</metadata>\n')
+
+
+def ingest_memory(url, f, sha256_expected):
+    # Previous approach of parse_repomd() and parse_susetags().
+    with requests.get(url, stream=True) as primary:
+        sha256 = hashlib.sha256(primary.content).hexdigest()
+        if sha256 != sha256_expected:
+            raise Exception('checksums do not match {} != {}'.format(sha256, sha256_expected))
+
+        content = gzip.GzipFile(fileobj=io.BytesIO(primary.content))
+        f.write(content.read())
+        f.flush()
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(ingest, url, sha256_expected, queue):
+    before = peak_rss()
+    start = perf_counter()
+    with tempfile.TemporaryFile() as f:
+        ingest(url, f, sha256_expected)
+        size = f.tell()
+    queue.put((perf_counter() - start, before, peak_rss(), size))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'primary.xml.gz')
+        if args.primary:
+            os.symlink(os.path.abspath(args.primary), path)
+        else:
+            primary_synthetic(path, args.count)
+
+        with open(path, 'rb') as f:
+            sha256_expected = hashlib.sha256(f.read()).hexdigest()
+
+        handler = functools.partial(QuietHandler, directory=directory)
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/primary.xml.gz'.format(server.server_port)
+
+        print('{}: {:.1f} MiB compressed'.format(url, os.path.getsize(path) / 1024 / 1024))
+        context = multiprocessing.get_context('fork')
+        for name, ingest in (('memory', ingest_memory), ('download_gunzip', download_gunzip)):
+            queue = context.Queue()
+            process = context.Process(target=measure, args=(ingest, url, sha256_expected, queue))
+            process.start()
+            duration, before, after, size = queue.get()
+            process.join()
+            print('{:>16}: {:.2f}s, {:.1f} MiB decompressed, peak RSS {:.1f} MiB before, {:.1f} MiB after'.format(
+                name, duration, size / 1024 / 1024, before, after))
+
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--primary', help='local primary.xml.gz to serve instead of a synthetic one')
+    parser.add_argument('--count', type=int, default=200000, help='packages in synthetic primary.xml.gz')
+    raise SystemExit(main(parser.parse_args()))
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+
+"""
+Measure PkgListGen.create_weakremovers() on synthetic old package lists.
+
+Generates current repositories for each architecture as solv files and a set of
+old susetags package lists (ex. from previous releases) of which a fraction of
+packages has since been dropped or obsoleted. The weakremovers are computed
+both by the previous approach, which loads all current repositories for every
+old package list, and by create_weakremovers() and the outputs are compared.
+repository_arch_state() is replaced by a stub with the given latency.
+
+Requires the solv python bindings as well as xz.
+"""
+
+import argparse
+import glob
+import io
+import logging
+import os
+import subprocess
+import tempfile
+from time import perf_counter
+from time import sleep
+
+import solv
+
+from pkglistgen import file_utils
+from pkglistgen import tool
+from pkglistgen.tool import PkgListGen
+
+PROJECTS = [('openSUSE:Factory', 'standard')]
+STATE = 'benchmark'
+
+
+def package(name, version, arch, obsoletes=None):
+    lines = [
+        '=Pkg: {} {} 1 {}'.format(name, version, arch),
+        '+Prv:',
+        '{} = {}-1'.format(name, version),
+        '-Prv:',
+    ]
+    if obsoletes:
+        lines += ['+Obs:', obsoletes, '-Obs:']
+    return '\n'.join(lines) + '\n'
+
+
+def current_write(archs, count):
+    for arch in archs:
+        pool = solv.Pool()
+        pool.setarch()
+        repo = pool.add_repo('current')
+        packages = ['=Ver: 2.0\n']
+        for i in range(count):
+            obsoletes = 'legacy-{} < 2'.format(i) if i % 10 == 0 else None
+            packages.append(package('package-{}'.format(i), 2, 'noarch' if i % 4 == 0 else arch, obsoletes))
+
+        with tempfile.TemporaryFile('w+') as f:
+            f.write(''.join(packages))
+            f.flush()
+            f.seek(0)
+            repo.add_susetags(solv.xfopen_fd(None, f.fileno()), 0, None)
+
+        for project, repository in PROJECTS:
+            fn = 'repo-{}-{}-{}-{}.solv'.format(project, repository, arch, STATE)
+            f = solv.xfopen(fn, 'w')
+            repo.write(f)
+            f.close()
+
+
+def old_write(directory, archs, count, files):
+    keys = []
+    for n in range(files):
+        key = 'release-{}'.format(n)
+        keys.append({key: None})
+        packages = ['=Ver: 2.0\n']
+        for arch in archs:
+            for i in range(count):
+                if i % 10 == 0:
+                    name = 'legacy-{}'.format(i)
+                elif i % 7 == 0:
+                    name = 'dropped-{}-{}'.format(n, i)
+                else:
+                    name = 'package-{}'.format(i)
+                packages.append(package(name, 1, arch))
+
+        path = os.path.join(directory, '{}.packages'.format(key))
+        with open(path, 'w') as f:
+            f.write(''.join(packages))
+        subprocess.check_call(['xz', '-f', path])
+
+    with open(os.path.join(directory, 'config.yml'), 'w') as f:
+        for key in keys:
+            f.write('- {}:\n'.format(list(key)[0]))
+
+
+def create_weakremovers_legacy(self, directory, output):
+    """Previous implementation for comparison."""
+    drops = dict()
+    dropped_repos = dict()
+
+    for oldrepo in sorted(glob.glob(os.path.join(directory, '*.packages.xz'))):
+        key = os.path.basename(oldrepo).split('.')[0]
+        pool = solv.Pool()
+        pool.setarch()
+        oldsysrepo = file_utils.add_susetags(pool, oldrepo)
+
+        for arch in self.all_architectures:
+            for project, repo in self.repos:
+                state = tool.repository_arch_state(self.apiurl, project, repo, arch)
+                r = pool.add_repo('/'.join([project, repo]))
+                r.add_solv(f'repo-{project}-{repo}-{arch}-{state}.solv')
+
+        pool.createwhatprovides()
+
+        accepted_archs = set(self.all_architectures)
+        accepted_archs.add('noarch')
+
+        for s in oldsysrepo.solvables_iter():
+            oldarch = s.arch
+            if oldarch == 'i686':
+                oldarch = 'i586'
+            if oldarch not in accepted_archs:
+                continue
+
+            haveit = False
+            for s2 in pool.whatprovides(s.nameid):
+                if s2.repo == oldsysrepo or s.nameid != s2.nameid:
+                    continue
+                newarch = s2.arch
+                if newarch == 'i686':
+                    newarch = 'i586'
+                if oldarch != newarch and newarch != 'noarch' and oldarch != 'noarch':
+                    continue
+                haveit = True
+                break
+            if haveit:
+                continue
+
+            nevr = pool.rel2id(s.nameid, s.evrid, solv.REL_EQ)
+            for s2 in pool.whatmatchesdep(solv.SOLVABLE_OBSOLETES, nevr):
+                if s2.repo == oldsysrepo:
+                    continue
+                haveit = True
+                break
+            if haveit:
+                continue
+            if s.name not in drops:
+                drops[s.name] = {'repo': key, 'archs': set()}
+            if oldarch == 'noarch':
+                drops[s.name]['archs'] |= set(self.all_architectures)
+            else:
+                drops[s.name]['archs'].add(oldarch)
+            dropped_repos[key] = 1
+
+    for repo in sorted(dropped_repos):
+        print('#', repo, file=output)
+        for name in sorted(drops):
+            if drops[name]['repo'] == repo:
+                print(name, ' '.join(sorted(drops[name]['archs'])), file=output)
+
+
+def drops_normalize(output):
+    # Reduce create_weakremovers() output to the legacy summary format.
+    lines = []
+    archs = None
+    for line in output.getvalue().splitlines():
+        if line.startswith('#'):
+            lines.append(line)
+        elif line.startswith('%ifarch'):
+            archs = line.split(' ', 1)[1]
+        elif line.startswith('%endif'):
+            archs = None
+        else:
+            name = line[len('Provides: weakremover('):-1]
+            lines.append((name, archs))
+    return lines
+
+
+def main(args):
+    logging.basicConfig(level=logging.WARNING)
+
+    def repository_arch_state(apiurl, project, repository, arch):
+        sleep(args.latency / 1000)
+        return STATE
+
+    tool.repository_arch_state = repository_arch_state
+
+    pkglist = PkgListGen.__new__(PkgListGen)
+    pkglist.reset()
+    pkglist.logger = logging.getLogger()
+    pkglist.apiurl = None
+    pkglist.all_architectures = args.archs
+    pkglist.repos = PROJECTS
+
+    print('{} old files of {} packages for {} architectures'.format(args.files, args.packages, len(args.archs)))
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            current_write(args.archs, args.packages)
+            old_write(directory, args.archs, args.packages, args.files)
+
+            start = perf_counter()
+            legacy = io.StringIO()
+            create_weakremovers_legacy(pkglist, directory, legacy)
+            legacy_duration = perf_counter() - start
+            print('legacy: {:.3f}s'.format(legacy_duration))
+
+            start = perf_counter()
+            output = io.StringIO()
+            pkglist.create_weakremovers(None, None, directory, output)
+            duration = perf_counter() - start
+            print('create_weakremovers: {:.3f}s ({:.1f}x)'.format(duration, legacy_duration / duration))
+        finally:
+            os.chdir(cwd)
+
+    drops = drops_normalize(output)
+    count = len([line for line in drops if not isinstance(line, str)])
+    print('{} weakremovers'.format(count))
+
+    expected = []
+    for line in legacy.getvalue().splitlines():
+        if line.startswith('#'):
+            expected.append(line)
+            continue
+        name, archs = line.split(' ', 1)
+        expected.append((name, None if archs == ' '.join(sorted(args.archs)) else archs))
+
+    if sorted(map(str, drops)) != sorted(map(str, expected)):
+        print('MISMATCH between legacy and create_weakremovers()')
+        return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--archs', nargs='+', default=['x86_64', 'aarch64', 'ppc64le', 's390x'])
+    parser.add_argument('--packages', type=int, default=5000, help='packages per architecture')
+    parser.add_argument('--files', type=int, default=10, help='number of old package lists')
+    parser.add_argument('--latency', type=int, default=50, help='repository_arch_state() latency in ms')
+    raise SystemExit(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+import unittest
+
+from osclib.cache_stats import CacheStats
+
+
+class TestCacheStats(unittest.TestCase):
+    def setUp(self):
+        CacheStats.stats = {}
+
+    def tearDown(self):
+        CacheStats.stats = {}
+
+    def test_record(self):
+        CacheStats.record('http', '/source$', hits=1, hit_seconds=0.5)
+        CacheStats.record('http', '/source$', hits=1, hit_seconds=0.5)
+        CacheStats.record('http', '/source$', misses=2, expired=1, miss_seconds=6, bytes=100)
+        CacheStats.record('memoize', 'module.function', misses=1)
+
+        report = CacheStats.report()
+        self.assertEqual(len(report), 2)
+
+        summary = report[0]
+        self.assertEqual(summary['cache'], 'http')
+        self.assertEqual(summary['hits'], 2)
+        self.assertEqual(summary['misses'], 2)
+        self.assertEqual(summary['expired'], 1)
+        self.assertEqual(summary['bytes'], 100)
+        # Two hits each saving an average miss of 3 seconds less 1 second hit time.
+        self.assertEqual(summary['saved_seconds'], 5)
+
+        self.assertEqual(report[1]['saved_seconds'], 0)
+
+    def test_dump(self):
+        CacheStats.record('package-lookup', 'openSUSE:Factory', hits=3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            CacheStats.dump(os.path.join(directory, '{tool}-{pid}.json'))
+            paths = os.listdir(directory)
+            self.assertEqual(len(paths), 1)
+
+            with open(os.path.join(directory, paths[0])) as f:
+                data = json.load(f)
+
+        self.assertEqual(data['pid'], os.getpid())
+        self.assertEqual(data['stats'][0]['key'], 'openSUSE:Factory')
+        self.assertEqual(data['stats'][0]['hits'], 3)
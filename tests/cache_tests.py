@@ -0,0 +1,225 @@
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from osclib.cache import Cache
+from osclib.cache import CacheBackendDirectory
+from osclib.cache import CacheBackendSqlite
+
+APIURL = 'https://api.example.com'
+
+PATHS = [
+    '/about',
+    '/build/openSUSE:Factory/_result',
+    '/build/openSUSE:Factory/standard/x86_64/_builddepinfo',
+    '/build/openSUSE:Factory:Staging:A/standard/x86_64/_builddepinfo',
+    '/group/factory-staging',
+    '/group/factory-staging?view=xml',
+    '/request/123?cmd=changestate&newstate=accepted',
+    '/request/123?cmd=changestate&newstate=declined',
+    "/search/package?match=[@project='openSUSE:Factory']",
+    "/search/project/id?match=starts-with(@name,'openSUSE:Factory:Staging:')",
+    '/source',
+    '/source/openSUSE:Factory',
+    '/source/openSUSE:Factory?view=info',
+    '/source/openSUSE:Factory/_meta',
+    '/source/openSUSE:Factory/_attribute/OSRT:Config',
+    '/source/openSUSE:Factory/dashboard/config',
+    '/source/openSUSE:Factory/bash/_history',
+    '/source/openSUSE:Factory/bash/_meta',
+    '/source/openSUSE:Factory/bash/_link',
+    '/source/openSUSE:Factory/bash',
+    '/source/openSUSE:Factory/bash?expand=1',
+    '/source/openSUSE:Factory/bash/bash.spec',
+    '/statistics/latest_updated?limit=5000',
+]
+
+
+class TestCacheClassify(unittest.TestCase):
+    def setUp(self):
+        self.patterns = Cache.patterns
+        Cache.patterns = [re.compile(pattern) for pattern in Cache.PATTERNS]
+        Cache.dispatcher_compile()
+
+    def tearDown(self):
+        Cache.patterns = self.patterns
+        Cache.dispatcher_compile()
+
+    def match_sequential(self, url):
+        _, path = Cache.spliturl(url)
+        for pattern in Cache.patterns:
+            match = pattern.match(path)
+            if match:
+                return (pattern.pattern, match.group(1) if len(match.groups()) > 0 else None)
+        return (False, None)
+
+    def test_match(self):
+        for path in PATHS:
+            url = APIURL + path
+            self.assertEqual(Cache.match(url), self.match_sequential(url), path)
+
+        self.assertEqual(Cache.match(APIURL + '/source/openSUSE:Factory/bash/_meta'),
+                         (r'/source/([^/]+)/(?:[^/]+)/(?:_meta|_link)$', 'openSUSE:Factory'))
+        self.assertEqual(Cache.match(APIURL + '/about'), (False, None))
+
+    def test_classify(self):
+        url = APIURL + '/source/openSUSE%3AFactory/_meta'
+        classification = Cache.classify(url)
+        self.assertEqual(classification, (APIURL + '/source/openSUSE:Factory/_meta', APIURL,
+                                          r'/source/([^/]+)/_meta$', 'openSUSE:Factory'))
+        self.assertIs(Cache.classify(url), classification)
+
+        Cache.classified = {'{}/{}'.format(APIURL, i): None for i in range(Cache.CLASSIFIED_MAX)}
+        Cache.classify(url)
+        self.assertEqual(list(Cache.classified), [url])
+
+
+class TestCacheLastUpdated(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = Cache.CACHE_DIR
+        Cache.CACHE_DIR = self.tmpdir.name
+        Cache.last_updated = {}
+        self.entries = []
+        self.limits = []
+        self.updated = 0
+        self.fetch = mock.patch.object(Cache, 'last_updated_fetch', self.last_updated_fetch)
+        self.fetch.start()
+
+    def tearDown(self):
+        self.fetch.stop()
+        Cache.last_updated = {}
+        Cache.CACHE_DIR = self.cache_dir
+        self.tmpdir.cleanup()
+
+    def last_updated_fetch(self, apiurl, limit):
+        self.limits.append(limit)
+        return self.entries[:limit]
+
+    def update(self, count):
+        # Newest first as returned by the latest_updated route.
+        for _ in range(count):
+            self.updated += 1
+            self.entries.insert(0, ('project{}'.format(self.updated % 1000), '{:08}'.format(self.updated)))
+
+    def load(self):
+        # Start from the persisted index as a new process would.
+        Cache.last_updated = {}
+        self.limits = []
+        Cache.last_updated_load(APIURL)
+        return Cache.last_updated[APIURL]
+
+    def test_load(self):
+        self.update(10)
+        last_updated = self.load()
+        self.assertEqual(self.limits, [Cache.LAST_UPDATED_LIMIT])
+        self.assertEqual(last_updated['project10'], '00000010')
+        self.assertEqual(last_updated['__newest'], '00000010')
+        self.assertEqual(last_updated['__oldest'], '00000001')
+
+        self.assertEqual(self.load(), last_updated)
+        self.assertEqual(self.limits, [Cache.LAST_UPDATED_INCREMENTAL])
+
+    def test_refresh(self):
+        self.update(Cache.LAST_UPDATED_LIMIT * 2)
+        self.load()
+
+        # Windows grow until one overlaps the newest known entry.
+        self.update(Cache.LAST_UPDATED_INCREMENTAL)
+        last_updated = self.load()
+        self.assertEqual(self.limits, [Cache.LAST_UPDATED_INCREMENTAL, Cache.LAST_UPDATED_INCREMENTAL * 10])
+        self.assertEqual(last_updated['__newest'], '{:08}'.format(self.updated))
+        self.assertEqual(last_updated['project{}'.format(self.updated % 1000)], '{:08}'.format(self.updated))
+        self.assertEqual(last_updated['__oldest'], '{:08}'.format(Cache.LAST_UPDATED_LIMIT + 1))
+
+        # Without any overlap within the limit the index is reloaded.
+        self.update(Cache.LAST_UPDATED_LIMIT)
+        last_updated = self.load()
+        self.assertEqual(self.limits[-1], Cache.LAST_UPDATED_LIMIT)
+        self.assertEqual(last_updated['__oldest'], '{:08}'.format(self.updated - Cache.LAST_UPDATED_LIMIT + 1))
+
+
+class CacheBackendTests(object):
+    BACKEND = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = Cache.CACHE_DIR
+        Cache.CACHE_DIR = self.tmpdir.name
+        self.backend = self.BACKEND(self.tmpdir.name)
+
+    def tearDown(self):
+        self.backend.delete_all()
+        Cache.CACHE_DIR = self.cache_dir
+        self.tmpdir.cleanup()
+
+    def url(self, path):
+        return APIURL + path
+
+    def get(self, url, project, ttl=60):
+        data, reason = self.backend.get(url, project, ttl)
+        return data.read() if data else reason
+
+    def test_round_trip(self):
+        meta = self.url('/source/openSUSE:Factory/_meta')
+        about = self.url('/about')
+        self.assertEqual(self.get(meta, 'openSUSE:Factory'), 'does not exist')
+        self.assertEqual(self.backend.project_age(APIURL, 'openSUSE:Factory'), 0)
+
+        self.backend.put(meta, 'openSUSE:Factory', b'<project/>')
+        self.backend.put(about, None, b'<about/>')
+        self.assertEqual(self.get(meta, 'openSUSE:Factory'), b'<project/>')
+        self.assertEqual(self.get(about, None), b'<about/>')
+        self.assertEqual(self.get(meta, 'openSUSE:Factory', ttl=-1), 'expired')
+        self.assertLess(self.backend.project_age(APIURL, 'openSUSE:Factory'), 60)
+
+        self.backend.put(meta, 'openSUSE:Factory', b'<project name="openSUSE:Factory"/>')
+        self.assertEqual(self.get(meta, 'openSUSE:Factory'), b'<project name="openSUSE:Factory"/>')
+
+        self.assertTrue(self.backend.delete(meta, 'openSUSE:Factory'))
+        self.assertFalse(self.backend.delete(meta, 'openSUSE:Factory'))
+        self.assertEqual(self.get(meta, 'openSUSE:Factory'), 'does not exist')
+        self.assertEqual(self.get(about, None), b'<about/>')
+
+    def test_delete_project(self):
+        factory = self.url('/source/openSUSE:Factory/_meta')
+        leap = self.url('/source/openSUSE:Leap:15.2/_meta')
+        self.backend.put(factory, 'openSUSE:Factory', b'factory')
+        self.backend.put(leap, 'openSUSE:Leap:15.2', b'leap')
+
+        self.assertTrue(self.backend.delete_project(APIURL, 'openSUSE:Factory'))
+        self.assertFalse(self.backend.delete_project(APIURL, 'openSUSE:Factory'))
+        self.assertEqual(self.backend.project_age(APIURL, 'openSUSE:Factory'), 0)
+        self.assertEqual(self.get(factory, 'openSUSE:Factory'), 'does not exist')
+        self.assertEqual(self.get(leap, 'openSUSE:Leap:15.2'), b'leap')
+
+        self.backend.delete_all()
+        self.assertEqual(self.get(leap, 'openSUSE:Leap:15.2'), 'does not exist')
+
+
+class TestCacheBackendDirectory(CacheBackendTests, unittest.TestCase):
+    BACKEND = CacheBackendDirectory
+
+
+class TestCacheBackendSqlite(CacheBackendTests, unittest.TestCase):
+    BACKEND = CacheBackendSqlite
+
+    def test_threads(self):
+        def worker(i):
+            url = self.url('/source/openSUSE:Factory/package{}'.format(i))
+            self.backend.put(url, 'openSUSE:Factory', str(i).encode('utf-8'))
+            results[i] = self.get(url, 'openSUSE:Factory')
+
+        results = {}
+        for _ in range(2):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, {i: str(i).encode('utf-8') for i in range(8)})
+        # Short lived threads share the connection of the host.
+        self.assertEqual(len(self.backend.connections), 1)
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from osclib.cpio import Cpio
+
+MEMBERS = [
+    ('./usr/lib64/libfoo.so.1.2.3', 0o100755, b'\x7fELF' + bytes(range(256)) * 41),
+    ('./usr/lib64/libfoo.so.1', 0o120777, b'libfoo.so.1.2.3'),
+    ('./usr/share/doc/packages/foo/README', 0o100644, b'readme\n'),
+    ('./usr/share/foo/empty', 0o100644, b''),
+    ('./usr/lib/debug/usr/lib64/libfoo.so.1.2.3.debug', 0o100644, b'debug' * 1001),
+]
+
+
+def archive(members):
+    data = b''
+    for ino, (name, mode, contents) in enumerate(members + [('TRAILER!!!', 0, b'')], start=1):
+        name = name.encode('utf-8') + b'\0'
+        fields = [ino, mode, 0, 0, 1, 0, len(contents), 0, 0, 0, 0, len(name), 0]
+        data += b'070701' + ''.join('{:08x}'.format(f) for f in fields).encode('ascii') + name
+        data += b'\0' * (-len(data) % 4) + contents
+        data += b'\0' * (-len(data) % 4)
+    return data
+
+
+class TestCpio(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = archive(MEMBERS)
+        self.path = os.path.join(self.tmpdir.name, 'archive.cpio')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def extract(self, cpio, wanted):
+        names = []
+        extracted = {}
+        for member in cpio:
+            names.append(member.name)
+            if member.name in wanted:
+                path = os.path.join(self.tmpdir.name, 'extracted')
+                with open(path, 'wb') as f:
+                    member.copy(f)
+                with open(path, 'rb') as f:
+                    extracted[member.name] = f.read()
+        return names, extracted
+
+    def assertExtracted(self, cpio):
+        wanted = (MEMBERS[0][0], MEMBERS[3][0], MEMBERS[4][0])
+        names, extracted = self.extract(cpio, wanted)
+        self.assertEqual(names, [member[0] for member in MEMBERS])
+        self.assertEqual(extracted, {name: contents for name, _, contents in MEMBERS if name in wanted})
+
+    def test_buffer(self):
+        cpio = Cpio(self.data)
+        member = next(cpio)
+        self.assertEqual(member.c_mode, MEMBERS[0][1])
+        self.assertEqual(member.read(4), b'\x7fELF')
+        self.assertEqual(next(cpio).header(), MEMBERS[1][2])
+        self.assertEqual([member.name for member in cpio], [member[0] for member in MEMBERS[2:]])
+
+        self.assertExtracted(Cpio(self.data))
+
+    def test_file(self):
+        with open(self.path, 'rb') as f:
+            self.assertExtracted(Cpio(f))
+        with open(self.path, 'rb', buffering=0) as f:
+            self.assertExtracted(Cpio(f))
+
+    def test_pipe(self):
+        process = subprocess.Popen(['cat', self.path], stdout=subprocess.PIPE, bufsize=0)
+        self.assertExtracted(Cpio(process.stdout))
+        process.stdout.close()
+        self.assertEqual(process.wait(), 0)
+
+    def test_truncated(self):
+        with self.assertRaises(EOFError):
+            list(Cpio(self.data[:200]))
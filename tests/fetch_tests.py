@@ -0,0 +1,67 @@
+from io import BytesIO
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+
+from osclib import fetch as fetch_module
+from osclib.fetch import fetch
+from osclib.fetch import retried_GET
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.requested = []
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.sleep = mock.patch.object(fetch_module.time, 'sleep')
+        self.sleep.start()
+
+    def tearDown(self):
+        self.sleep.stop()
+
+    def http_GET(self, url):
+        with self.lock:
+            self.requested.append(url)
+            errors = self.errors.get(url)
+            if errors:
+                code = errors.pop(0)
+                raise HTTPError(url, code, 'error', {}, None)
+        return BytesIO('<entry name="{}"/>'.format(url).encode('utf-8'))
+
+    def fetch(self, urls, **kwargs):
+        with mock.patch.object(fetch_module.osc.core, 'http_GET', self.http_GET):
+            return fetch(urls, **kwargs)
+
+    def test_order(self):
+        urls = ['/source/openSUSE:Factory/package{}'.format(i) for i in range(20)]
+        roots = self.fetch(urls, concurrency=4)
+        self.assertEqual([root.get('name') for root in roots], urls)
+        self.assertEqual(sorted(self.requested), sorted(urls))
+
+        self.requested = []
+        self.assertEqual(self.fetch(urls[:1], parse=False), [b'<entry name="' + urls[0].encode('utf-8') + b'"/>'])
+
+    def test_retry(self):
+        self.errors = {'/a': [503, 502], '/b': [404], '/c': [500]}
+        roots = self.fetch(['/a', '/b', '/c'], concurrency=1, ignore=(404,))
+        self.assertEqual(roots[0].get('name'), '/a')
+        self.assertIsNone(roots[1])
+        self.assertEqual(roots[2].get('name'), '/c')
+        self.assertEqual(self.requested, ['/a', '/a', '/a', '/b', '/c', '/c'])
+
+        self.errors = {'/b': [404]}
+        with self.assertRaises(HTTPError):
+            self.fetch(['/b'])
+
+    def test_retries_limit(self):
+        self.errors = {'/a': [503] * 100}
+        with mock.patch.object(fetch_module.osc.core, 'http_GET', self.http_GET):
+            with self.assertRaises(HTTPError):
+                retried_GET('/a')
+        self.assertEqual(len(self.requested), fetch_module.FETCH_RETRIES + 1)
+
+        self.requested = []
+        with self.assertRaises(HTTPError):
+            self.fetch(['/a'], retries=2)
+        self.assertEqual(len(self.requested), 3)
@@ -0,0 +1,47 @@
+import os
+import unittest
+
+from osclib.fileconflicts import fileconflicts
+from osclib.repochecks import _fileconflicts
+
+PACKAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'fileconflicts', 'packages')
+
+
+class TestFileConflicts(unittest.TestCase):
+    def test_fileconflicts(self):
+        conflicts = list(fileconflicts(PACKAGES))
+        self.assertEqual(conflicts, [
+            (['goodbye', '1.0', '1.1', 'noarch'], ['hello', '2.10', '1.1', 'x86_64'], ['/usr/bin/hello']),
+            (['goodbye', '1.0', '1.1', 'noarch'], ['hello', '2.12', '1.1', 'x86_64'], ['/usr/bin/hello']),
+            # /bin is merged into /usr/bin by filesystem
+            (['hello', '2.10', '1.1', 'x86_64'], ['hello-legacy', '1.0', '1.1', 'x86_64'], ['/usr/bin/hello']),
+            (['hello', '2.12', '1.1', 'x86_64'], ['hello-legacy', '1.0', '1.1', 'x86_64'], ['/usr/bin/hello']),
+            (['goodbye', '1.0', '1.1', 'noarch'], ['hello', '2.10', '1.1', 'x86_64'],
+             ['/usr/share/doc/hello [mode mismatch: -644 root:root, d755 root:root]']),
+            (['goodbye', '1.0', '1.1', 'noarch'], ['hello-doc', '2.10', '1.1', 'noarch'],
+             ['/usr/share/doc/hello [mode mismatch: -644 root:root, d755 root:root]']),
+            (['hello', '2.10', '1.1', 'x86_64'], ['hello-doc', '2.10', '1.1', 'noarch'], ['/usr/share/doc/hello/README']),
+            (['hello', '2.10', '1.1', 'x86_64'], ['hello-legacy', '1.0', '1.1', 'x86_64'], ['/usr/share/doc/hello/README']),
+            (['hello-doc', '2.10', '1.1', 'noarch'], ['hello-legacy', '1.0', '1.1', 'x86_64'], ['/usr/share/doc/hello/README']),
+        ])
+
+    def test_skip(self):
+        conflicts = list(fileconflicts(PACKAGES, lambda sp1, sp2: 'hello' in (sp1[0], sp2[0])))
+        self.assertEqual([(sp1[0], sp2[0]) for sp1, sp2, _ in conflicts], [
+            ('goodbye', 'hello-doc'),
+            ('hello-doc', 'hello-legacy'),
+        ])
+
+    def test_repochecks(self):
+        output = _fileconflicts(PACKAGES, ['hello-doc'], ['hello-legacy'])
+        self.assertEqual(output, '\n'.join([
+            'found conflict of goodbye-1.0-1.1.noarch with hello-doc-2.10-1.1.noarch',
+            '  /usr/share/doc/hello [mode mismatch: -644 root:root, d755 root:root]',
+            '',
+            'found conflict of hello-2.10-1.1.x86_64 with hello-doc-2.10-1.1.noarch',
+            '  /usr/share/doc/hello/README',
+            '',
+            '',
+        ]))
+
+        self.assertIsNone(_fileconflicts(PACKAGES, ['filesystem'], []))
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from osclib.memoize import MemoizeStore
+
+
+class TestMemoizeStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = MemoizeStore('tests.function', os.path.join(self.tmpdir.name, 'function.sqlite'), 8, 2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def put(self, key, timestamp):
+        with mock.patch('osclib.memoize.time', lambda: timestamp):
+            return self.store.put(key, key.decode('utf-8'))
+
+    def found(self, keys):
+        return [key for key in keys if self.store.get(key, 10 ** 10)[0]]
+
+    def test_get(self):
+        self.assertEqual(self.store.get(b'a', 60), (False, None))
+        self.store.put(b'a', {'value': [1, 2]})
+        self.assertEqual(self.store.get(b'a', 60), (True, {'value': [1, 2]}))
+        self.assertEqual(self.store.get(b'a', -1), (False, None))
+
+        self.store.delete(b'a')
+        self.assertEqual(self.store.get(b'a', 60), (False, None))
+
+    def test_eviction(self):
+        keys = [str(i).encode('utf-8') for i in range(10)]
+        self.assertEqual([self.put(key, 1000 + i) for i, key in enumerate(keys[:7])], [0] * 7)
+        self.assertEqual(len(self.store), 7)
+
+        # Filling the last slot evicts nclean of the oldest slots.
+        self.assertEqual(self.put(keys[7], 2000), 2)
+        self.assertEqual(len(self.store), 6)
+        self.assertEqual(self.found(keys), keys[2:8])
+
+        # Replacing an existing slot refreshes it rather than adding one.
+        self.assertEqual(self.put(keys[2], 3000), 0)
+        self.assertEqual(self.put(keys[8], 3001), 0)
+        self.assertEqual(self.put(keys[9], 3002), 2)
+        self.assertEqual(self.found(keys), [keys[2]] + keys[5:10])
+
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+
+    def test_count(self):
+        store = MemoizeStore('tests.count', os.path.join(self.tmpdir.name, 'count.sqlite'), 100, 10)
+        counts = []
+        with store.connection() as connection:
+            connection.set_trace_callback(lambda statement: counts.append(statement) if 'COUNT' in statement else None)
+
+        for i in range(90):
+            store.put(str(i).encode('utf-8'), i)
+        # Rows are only counted every nclean puts.
+        self.assertEqual(len(counts), 9)
+
+        # Rows written by another process are picked up within nclean puts.
+        other = MemoizeStore('tests.count', store.path, 100, 10)
+        for i in range(90, 98):
+            other.put(str(i).encode('utf-8'), i)
+        self.assertEqual([store.put(str(i).encode('utf-8'), i) for i in range(200, 202)], [0, 10])
+        self.assertEqual(len(store), 90)
+
+        store.delete(b'201')
+        self.assertEqual(store.count, 89)
+        store.clear()
+        self.assertEqual(store.count, 0)
+        self.assertEqual(store.put(b'a', 'a'), 0)
+        self.assertEqual(len(store), 1)
+
+    def test_threads(self):
+        def worker(i):
+            key = str(i).encode('utf-8')
+            self.store.put(key, i)
+            results[i] = self.store.get(key, 60)
+
+        results = {}
+        with mock.patch.object(sqlite3, 'connect', wraps=sqlite3.connect) as connect:
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, {i: (True, i) for i in range(4)})
+        # Short lived threads share the connection of the process.
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(len(self.store), 4)
@@ -0,0 +1,115 @@
+from datetime import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from osc.core import HTTPError
+
+import metrics_release  # noqa: F401 imported by metrics main
+import metrics
+
+PROJECT = 'openSUSE:Factory'
+
+COMMITLOG = """<logentries>
+<logentry revision="3"><date>2020-01-03 10:00:00</date></logentry>
+<logentry revision="2"><date>2020-01-02 10:00:00</date></logentry>
+<logentry revision="1"><date>2020-01-01 10:00:00</date></logentry>
+</logentries>"""
+
+DIRECTORY = """<directory name="dashboard" rev="{revision}">
+<entry name="config" md5="{revision}1"/>
+<entry name="version_snapshot" md5="{revision}2"/>
+</directory>"""
+
+
+class Api(object):
+    apiurl = 'http://localhost'
+    project = PROJECT
+
+
+class DashboardTests(object):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.requested = []
+        self.patches = [
+            mock.patch.object(metrics, 'project_pseudometa_package', lambda apiurl, project: (project, 'dashboard')),
+            mock.patch.object(metrics.CacheManager, 'directory', self.directory),
+            mock.patch.object(metrics, 'http_GET', self.http_GET),
+            mock.patch.object(metrics, 'get_commitlog', lambda *args, **kwargs: COMMITLOG.splitlines()),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.reset()
+
+    def tearDown(self):
+        self.reset()
+        for patch in self.patches:
+            patch.stop()
+        self.tmpdir.cleanup()
+
+    def reset(self):
+        # state is kept on the functions for the lifetime of the process
+        for function, attribute in ((metrics.revision_index, 'index'), (metrics.dashboard_store, 'revisions')):
+            if hasattr(function, attribute):
+                delattr(function, attribute)
+
+    def directory(self, *args):
+        path = os.path.join(self.tmpdir.name, *args)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def http_GET(self, url):
+        self.requested.append(url)
+        revision = url.split('rev=')[1].split('&')[0]
+        if revision == 'missing':
+            raise HTTPError(url, 404, 'not found', None, None)
+        return io.StringIO(DIRECTORY.format(revision=revision))
+
+
+class TestRevisionAt(DashboardTests, unittest.TestCase):
+    def test_revision_at(self):
+        self.assertIsNone(metrics.revision_at(Api(), datetime(2019, 12, 31)))
+        self.assertIsNone(metrics.revision_at(Api(), datetime(2020, 1, 1, 9, 59, 59)))
+        self.assertEqual(metrics.revision_at(Api(), datetime(2020, 1, 1, 10)), '1')
+        self.assertEqual(metrics.revision_at(Api(), datetime(2020, 1, 2, 9)), '1')
+        self.assertEqual(metrics.revision_at(Api(), datetime(2020, 1, 2, 10)), '2')
+        self.assertEqual(metrics.revision_at(Api(), datetime(2021, 1, 1)), '3')
+
+    def test_commitlog_missing(self):
+        with mock.patch.object(metrics, 'get_commitlog', side_effect=HTTPError(None, 404, 'not found', None, None)):
+            self.assertIsNone(metrics.revision_at(Api(), datetime(2021, 1, 1)))
+
+
+class TestDashboardFiles(DashboardTests, unittest.TestCase):
+    def index(self):
+        path = os.path.join(self.tmpdir.name, 'metrics-dashboard', PROJECT, 'dashboard', 'revisions.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_files(self):
+        files = {'config': '11', 'version_snapshot': '12'}
+        self.assertEqual(metrics.dashboard_files(Api(), '1'), files)
+        self.assertEqual(metrics.dashboard_files(Api(), '1'), files)
+        self.assertEqual(len(self.requested), 1)
+        self.assertEqual(self.index(), [['1', files]])
+
+        # A new process loads the revisions listed by previous ones.
+        self.reset()
+        self.assertEqual(metrics.dashboard_files(Api(), '1'), files)
+        self.assertEqual(metrics.dashboard_files(Api(), '2'), {'config': '21', 'version_snapshot': '22'})
+        self.assertEqual(len(self.requested), 2)
+        self.assertEqual([revision for revision, _ in self.index()], ['1', '2'])
+
+        self.reset()
+        metrics.dashboard_store(Api())
+        self.assertEqual(sorted(metrics.dashboard_store.revisions), ['1', '2'])
+
+    def test_missing(self):
+        self.assertEqual(metrics.dashboard_files(Api(), 'missing'), {})
+        self.assertEqual(self.index(), [])
+        self.assertNotIn('missing', metrics.dashboard_store.revisions)
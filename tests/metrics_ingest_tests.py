@@ -0,0 +1,274 @@
+from datetime import datetime
+from datetime import timedelta
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from lxml import etree as ET
+
+import metrics_release  # noqa: F401 imported by metrics main
+import metrics
+from metrics import Review
+
+PROJECT = 'openSUSE:Factory'
+START = datetime(2020, 1, 1)
+
+
+def timestamp(minutes):
+    return (START + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def request_xml(request_id, created, final, rng):
+    reviews = []
+    if rng.random() < 0.7:
+        staged = created + rng.randint(1, 50)
+        reviews.append('<review state="accepted" by_project="{}:Staging:{}" when="{}" who="bot">'
+                       '<history who="bot" when="{}"/></review>'.format(
+                           PROJECT, rng.choice('ABC'), timestamp(staged), timestamp(staged + 5)))
+    reviews.append('<review state="accepted" by_group="legal" when="{}">'
+                   '<history who="lawyer" when="{}"/></review>'.format(timestamp(created), timestamp(created + 3)))
+    return ('<request id="{}"><action type="submit"/><state name="accepted" when="{}"/>{}'
+            '<history who="user" when="{}"/><history who="bot" when="{}"/></request>').format(
+                request_id, timestamp(final), ''.join(reviews), timestamp(created), timestamp(final))
+
+
+SEARCH = """<collection matches="3">
+<request id="1001" creator="user">
+  <action type="submit"><source project="home:user" package="foo"/><target project="{project}" package="foo"/></action>
+  <action type="delete"><target project="{project}" package="bar"/></action>
+  <state name="accepted" who="bot" when="2020-01-05T10:00:00"><comment>ok</comment></state>
+  <review state="accepted" by_group="factory-staging" when="2020-01-01T10:00:03" who="user">
+    <history who="staging-bot" when="2020-01-02T10:00:00"><description>Review got accepted</description></history>
+  </review>
+  <review state="accepted" by_project="{project}:Staging:A" when="2020-01-02T10:00:05" who="staging-bot">
+    <history who="staging-bot" when="2020-01-04T10:00:00"><description>Review got accepted</description></history>
+  </review>
+  <review state="accepted" by_project="{project}:Staging:adi:12" when="2020-01-04T10:00:00" who="staging-bot">
+    <history who="staging-bot" when="2020-01-04T12:00:00">
+      <description>Review got accepted</description><comment>ready to accept</comment>
+    </history>
+  </review>
+  <review state="accepted" by_user="legal" when="2020-01-01T10:00:03" who="user"/>
+  <priority>important</priority>
+  <history who="user" when="2020-01-01T10:00:00"><description>Request created</description></history>
+  <history who="maintainer" when="2020-01-02T10:00:07">
+    <description>Request got a new priority: moderate => important</description>
+    <comment>Being evaluated by staging project "{project}:Staging:A"</comment>
+  </history>
+  <history who="staging-manager" when="2020-01-04T10:00:00">
+    <comment>Being evaluated by staging project "{project}:Staging:adi:12"</comment>
+  </history>
+  <history who="bot" when="2020-01-05T10:00:00"><description>Request got accepted</description></history>
+</request>
+<request id="1002" creator="user">
+  <action type="maintenance_incident"/>
+  <state name="declined" who="user" when="2020-01-03T09:00:00"/>
+  <review state="new" by_project="{project}:Staging:B" when="2020-01-02T09:00:00" who="staging-bot"/>
+  <history who="user" when="2020-01-02T08:00:00"/>
+  <history who="user" when="2020-01-03T09:00:00"><description>Request got declined</description></history>
+</request>
+<request id="1003" creator="user">
+  <action type="delete"/>
+  <state name="revoked" who="user" when="2020-01-06T09:00:00"/>
+  <priority/>
+  <history who="user" when="2020-01-06T08:00:00"/>
+</request>
+</collection>""".format(project=PROJECT)
+
+
+class Client(object):
+    """In memory stand-in for InfluxDBClient keyed by measurement, tags, and time."""
+
+    def __init__(self):
+        self.points = {}
+
+    def drop_measurement(self, measurement):
+        for key in [key for key in self.points if key[0] == measurement]:
+            del self.points[key]
+
+    def query(self, query):
+        match = re.match(r'DELETE FROM "(\w+)" WHERE time >= (\d+)s$', query)
+        measurement, since = match.group(1), int(match.group(2))
+        for key in [key for key in self.points if key[0] == measurement and key[2] >= since]:
+            del self.points[key]
+
+    def write_points(self, points, precision):
+        for point in points:
+            key = (point['measurement'], json.dumps(point['tags'], sort_keys=True), point['time'])
+            self.points[key] = dict(point['fields'])
+
+
+class Api(object):
+    apiurl = None
+
+    def is_adi_project(self, project):
+        return ':adi:' in project
+
+    def extract_staging_short(self, project):
+        return project.split(':')[-1]
+
+
+class TestIngestRequests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = random.Random(1)
+        requests = []
+        for i in range(1, 201):
+            created = rng.randint(0, 5000)
+            final = created + rng.randint(60, 2000)
+            requests.append((final, request_xml(i, created, final, rng)))
+        # ordered as finalized
+        self.requests = [request for _, request in sorted(requests)]
+
+        metrics.who_workaround_swap = metrics.who_workaround_miss = 0
+        self.patches = [
+            mock.patch.object(metrics, 'requests_state_path', self.requests_state_path),
+            mock.patch.object(metrics, 'get_request_list', self.get_request_list),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmpdir.cleanup()
+
+    def requests_state_path(self, project, extension):
+        # Each client is kept in sync by its own state.
+        directory = os.path.join(self.tmpdir.name, str(id(metrics.client)))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, '{}.requests.{}'.format(project, extension))
+
+    def get_request_list(self, apiurl, project, req_state, withfullhistory, xpath=None):
+        since = xpath.split("'")[1] if xpath else None
+        for request in self.available:
+            request = metrics.request_record(ET.fromstring(request))
+            if since is None or request.state_when >= since:
+                yield request
+
+    def ingest(self, client, requests, rebuild=False):
+        metrics.client = client
+        self.available = requests
+        del metrics.points[:]
+        return metrics.ingest_requests(Api(), PROJECT, rebuild)
+
+    def test_incremental(self):
+        rebuilt = Client()
+        self.ingest(rebuilt, self.requests, rebuild=True)
+        self.assertTrue(rebuilt.points)
+
+        incremental = Client()
+        for count in (50, 120, 200):
+            self.ingest(incremental, self.requests[:count])
+        self.assertEqual(incremental.points, rebuilt.points)
+
+        # Nothing finalized since the last run.
+        self.assertEqual(self.ingest(incremental, self.requests), 0)
+        self.assertEqual(incremental.points, rebuilt.points)
+
+    def test_incremental_changed(self):
+        incremental = Client()
+        self.ingest(incremental, self.requests)
+
+        # A request re-opened and finalized again later with another review
+        # rewrites its points and the counters from its earliest point.
+        self.requests.append(request_xml(5, 100, 9000, random.Random(2)))
+        self.requests = [request for request in self.requests if '<request id="5">' not in request] + self.requests[-1:]
+        self.ingest(incremental, self.requests)
+
+        rebuilt = Client()
+        self.ingest(rebuilt, self.requests, rebuild=True)
+        self.assertEqual({key: incremental.points.get(key) for key in rebuilt.points}, rebuilt.points)
+
+        # Only non-delta points at times no longer present are left behind
+        # until the next rebuild.
+        stale = [key for key in incremental.points if key not in rebuilt.points]
+        self.assertEqual(sorted(key[0] for key in stale), ['request', 'review', 'user'])
+
+    def test_spill(self):
+        merged = Client()
+        self.ingest(merged, self.requests, rebuild=True)
+
+        # Points beyond the run limit are spilled to disk and merged back.
+        spilled = Client()
+        with mock.patch.object(metrics, 'POINTS_RUN', 5), \
+                mock.patch.object(metrics.PointRuns, 'spill', autospec=True, side_effect=metrics.PointRuns.spill) as spill:
+            self.ingest(spilled, self.requests, rebuild=True)
+        self.assertGreater(spill.call_count, 100)
+        self.assertEqual(spilled.points, merged.points)
+
+        with mock.patch.object(metrics, 'POINTS_RUN', 5):
+            self.ingest(spilled, self.requests[:-20] + [request_xml(201, 7000, 8000, random.Random(3))])
+        self.ingest(merged, self.requests[:-20] + [request_xml(201, 7000, 8000, random.Random(3))])
+        self.assertEqual(spilled.points, merged.points)
+
+
+class TestRequestRecord(unittest.TestCase):
+    """Compare records against the xpath based extraction from request elements they replace."""
+
+    def setUp(self):
+        metrics.who_workaround_swap = metrics.who_workaround_miss = 0
+
+    def who_xpath(self, request, review, relax=False):
+        when = review.get('when')
+        if relax:
+            when = when[:-2]
+        who_real = request.xpath('history[contains(@when, "{}") and comment[contains(text(), "{}")]]/@who'.format(
+            when, review.get('by_project')))
+        if len(who_real):
+            return who_real[0]
+        if not relax:
+            return self.who_xpath(request, review, True)
+        return review.get('who')
+
+    def test_search_requests(self):
+        records = list(metrics.search_requests(io.BytesIO(SEARCH.encode('utf-8'))))
+        self.assertEqual(records[0], 3)
+        records = records[1:]
+
+        requests = ET.fromstring(SEARCH).findall('request')
+        self.assertEqual([record.id for record in records], [int(request.get('id')) for request in requests])
+        staging = '{}:Staging:'.format(PROJECT)
+        for request, record in zip(requests, records):
+            self.assertEqual(record.type, request.find('action').get('type'))
+            self.assertEqual(record.state_when, request.find('state').get('when'))
+            self.assertEqual(record.history[0].when, request.find('history').get('when'))
+            self.assertEqual(record.history[-1].when, request.find('history[last()]').get('when'))
+            self.assertEqual([history.who for history in record.history], request.xpath('history/@who'))
+
+            priority = request.find('priority')
+            self.assertEqual(record.priority, None if priority is None else priority.text or '')
+            self.assertEqual(
+                [history.when for history in record.history
+                 if history.description and 'Request got a new priority:' in history.description],
+                request.xpath('history[description[contains(text(), "Request got a new priority:")]]/@when'))
+
+            self.assertEqual([review.attributes for review in record.reviews],
+                             [dict(review.items()) for review in request.findall('review')])
+            self.assertEqual(
+                sum(len(review.history) for review in record.reviews if review.attributes.get('by_group') == 'factory-staging'),
+                len(request.findall('review[@by_group="factory-staging"]/history')))
+            self.assertEqual(
+                [history.when for review in record.reviews if review.attributes.get('by_group') == 'factory-staging'
+                 for history in review.history],
+                request.xpath('review[@by_group="factory-staging"]/history/@when'))
+            self.assertEqual(
+                [history.when for review in record.reviews
+                 if staging + 'adi:' in review.attributes.get('by_project', '') and review.attributes.get('state') == 'accepted'
+                 for history in review.history if history.comment == 'ready to accept'],
+                request.xpath('review[contains(@by_project, "{}adi:") and @state="accepted"]/'
+                              'history[comment[text() = "ready to accept"]]/@when'.format(staging)))
+
+            staging_reviews = request.xpath('review[contains(@by_project, "{}")]'.format(staging))
+            self.assertEqual([metrics.who_workaround(record, Review(dict(review.items()), [])) for review in staging_reviews],
+                             [self.who_xpath(request, review) for review in staging_reviews])
+
+        # swapped by exact and relaxed time and falling back to the review
+        self.assertEqual([metrics.who_workaround(records[0], review) for review in records[0].reviews[1:3]],
+                         ['maintainer', 'staging-manager'])
+        self.assertEqual(metrics.who_workaround(records[1], records[1].reviews[0]), 'staging-bot')
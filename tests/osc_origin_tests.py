@@ -0,0 +1,139 @@
+from importlib.machinery import SourceFileLoader
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import yaml
+
+osc_origin = SourceFileLoader('osc_origin', os.path.join(os.path.dirname(__file__), '..', 'osc-origin.py')).load_module()
+
+PROJECT = 'openSUSE:Leap:15.2'
+
+
+class TestOriginLookupGenerate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lookup_path = os.path.join(self.tmpdir.name, PROJECT + '.yaml')
+        self.looked_up = []
+        self.failed = False
+        self.released = threading.Event()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def lookup_entry(self, apiurl, project, package):
+        self.looked_up.append(package)
+        if package == 'broken':
+            self.failed = True
+            raise Exception('lookup failed')
+        if self.failed:
+            # Hold lookups after the failure until pending ones are cancelled.
+            self.released.wait(10)
+        return {'origin': 'openSUSE:Factory', 'revisions': []}
+
+    def wait(self, futures):
+        self.released.set()
+        return self.wait_original(futures)
+
+    def generate(self, packages, jobs=1):
+        self.wait_original = osc_origin.wait
+        with mock.patch.object(osc_origin, 'osrt_origin_lookup_entry', self.lookup_entry), \
+                mock.patch.object(osc_origin, 'wait', self.wait):
+            return osc_origin.osrt_origin_lookup_generate(None, PROJECT, packages, self.lookup_path, jobs, quiet=True)
+
+    def partial(self):
+        with open(osc_origin.osrt_origin_lookup_partial_file(self.lookup_path)) as partial_stream:
+            return [json.loads(line)['package'] for line in partial_stream]
+
+    def test_error(self):
+        packages = ['a', 'b', 'broken', 'c', 'd']
+        with self.assertRaises(Exception):
+            self.generate(packages)
+
+        # Queued packages are cancelled rather than looked up and discarded
+        # while the one in progress, if any, is kept.
+        self.assertEqual(self.looked_up[:3], ['a', 'b', 'broken'])
+        self.assertNotIn('d', self.looked_up)
+        self.assertEqual(self.partial(), [package for package in self.looked_up if package != 'broken'])
+
+        resumed = self.partial()
+        self.looked_up = []
+        self.failed = False
+        lookup = self.generate(['a', 'b', 'c', 'd'])
+
+        self.assertEqual(sorted(self.looked_up), sorted(set(['a', 'b', 'c', 'd']) - set(resumed)))
+        self.assertEqual(sorted(lookup), ['a', 'b', 'c', 'd'])
+
+    def test_error_parallel(self):
+        packages = ['broken'] + ['package{}'.format(i) for i in range(20)]
+        with self.assertRaises(Exception):
+            self.generate(packages, jobs=4)
+
+        # Packages in progress when the error surfaced are kept.
+        self.assertLess(len(self.looked_up), len(packages))
+        self.assertEqual(sorted(self.partial()), sorted(set(self.looked_up) - {'broken'}))
+
+
+class TestOriginLookupIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lookup_path = os.path.join(self.tmpdir.name, PROJECT + '.yaml')
+        self.generated = []
+
+        entry = {'origin': 'openSUSE:Factory', 'revisions': []}
+        with open(self.lookup_path, 'w') as lookup_stream:
+            yaml.dump({'a': entry, 'b': entry}, lookup_stream)
+        expired = time.time() - osc_origin.OSRT_ORIGIN_LOOKUP_TTL - 60
+        os.utime(self.lookup_path, (expired, expired))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def state(self, b_srcmd5, full=None):
+        state = {
+            'origins': ['openSUSE:Factory'],
+            'projects': {project: {'a': '1', 'b': b_srcmd5} for project in (PROJECT, 'openSUSE:Factory')},
+        }
+        if full:
+            state['full'] = full
+        return state
+
+    def lookup_generate(self, apiurl, project, packages, lookup_path, jobs=1, quiet=False):
+        self.generated.append(list(packages))
+        return {package: {'origin': 'openSUSE:Factory', 'revisions': []} for package in packages}
+
+    def lookup(self, full):
+        osc_origin.osrt_origin_lookup_state_save(self.lookup_path, self.state('1', full))
+
+        def lookup_file(project, previous=False):
+            return self.lookup_path + ('.previous' if previous else '')
+
+        with mock.patch.object(osc_origin, 'osrt_origin_lookup_file', lookup_file), \
+                mock.patch.object(osc_origin, 'project_locked', lambda apiurl, project: False), \
+                mock.patch.object(osc_origin, 'package_list_kind_filtered', lambda apiurl, project: ['a', 'b']), \
+                mock.patch.object(osc_origin, 'osrt_origin_lookup_state', lambda *args: self.state('2')), \
+                mock.patch.object(osc_origin, 'osrt_origin_lookup_generate', self.lookup_generate):
+            lookup = osc_origin.osrt_origin_lookup(None, PROJECT, quiet=True)
+
+        self.assertEqual(sorted(lookup), ['a', 'b'])
+        # Lookup is no longer expired.
+        self.assertLess(time.time() - os.stat(self.lookup_path).st_mtime, osc_origin.OSRT_ORIGIN_LOOKUP_TTL)
+        return osc_origin.osrt_origin_lookup_state_load(self.lookup_path)
+
+    def test_expired(self):
+        full = time.time() - osc_origin.OSRT_ORIGIN_LOOKUP_TTL - 60
+        state = self.lookup(full)
+
+        # Only the package with source changes is refreshed.
+        self.assertEqual(self.generated, [['b']])
+        self.assertEqual(state['full'], full)
+
+    def test_expired_full(self):
+        state = self.lookup(time.time() - osc_origin.OSRT_ORIGIN_LOOKUP_FULL_TTL - 60)
+
+        self.assertEqual(self.generated, [['a', 'b']])
+        self.assertGreater(state['full'], time.time() - 60)
@@ -0,0 +1,268 @@
+import io
+import logging
+import lzma
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from lxml import etree as ET
+import osc.conf
+import solv
+
+from pkglistgen import tool
+from pkglistgen.group import Group
+from pkglistgen.tool import PkgListGen
+
+ARCHITECTURES = ['aarch64', 'x86_64']
+
+# name: (requires, recommends)
+PACKAGES = {
+    'bash': (['libreadline'], ['bash-doc']),
+    'bash-doc': ([], []),
+    'libreadline': ([], []),
+    'coreutils': (['libacl'], []),
+    'libacl': ([], []),
+    'kernel-default': ([], []),
+    'firmware': ([], []),
+    'vim': (['libacl', 'vim-data'], []),
+    'vim-data': ([], []),
+}
+# packages only built for some architectures
+EXCLUSIVE = {'firmware': 'x86_64'}
+OBSOLETES = {'vim': 'vi'}
+
+GROUPS = {
+    'sle-minimal': ['bash', 'coreutils'],
+    'sle-base': ['kernel-default', 'firmware', 'missing'],
+    'sle-editors': ['vim'],
+}
+MODULES = [
+    ('sle_minimal', [], [], True),
+    ('sle_base', ['sle_minimal'], [], False),
+    ('sle_editors', [{'sle_minimal': 'support'}], ['sle_base'], False),
+]
+
+
+def repo_write(path, arch, foreign=None):
+    """Write a repo of PACKAGES for arch and packages of other architectures
+    given by foreign as name: (arch, obsoletes)."""
+    pool = solv.Pool()
+    pool.setarch(arch)
+    repo = pool.add_repo('standard')
+    packages = [(name, arch, OBSOLETES.get(name)) for name in PACKAGES if EXCLUSIVE.get(name, arch) == arch]
+    packages += [(name, foreign_arch, obsoletes) for name, (foreign_arch, obsoletes) in (foreign or {}).items()]
+    for name, solvable_arch, obsoletes in sorted(packages):
+        requires, recommends = PACKAGES.get(name, ([], []))
+        s = repo.add_solvable()
+        s.name = name
+        s.evr = '1.0-1.1'
+        s.arch = solvable_arch
+        s.add_deparray(solv.SOLVABLE_PROVIDES, pool.Dep(name).Rel(solv.REL_EQ, pool.Dep(s.evr)))
+        for dep in requires:
+            s.add_deparray(solv.SOLVABLE_REQUIRES, pool.Dep(dep))
+        for dep in recommends:
+            s.add_deparray(solv.SOLVABLE_RECOMMENDS, pool.Dep(dep))
+        if obsoletes:
+            s.add_deparray(solv.SOLVABLE_OBSOLETES, pool.Dep(obsoletes).Rel(solv.REL_LT, pool.Dep('2')))
+    repo.internalize()
+    f = solv.xfopen(path, 'w')
+    repo.write(f)
+    f.close()
+
+
+# stand-in for bs_mirrorfull --nodebug url directory failing for aarch64
+MIRROR = """#!/bin/sh
+echo "fetching $2"
+echo "done"
+case "$2" in */aarch64) exit 1;; esac
+"""
+
+
+def packages_write(path, packages):
+    with lzma.open(path, 'wt') as f:
+        f.write('=Ver: 2.0\n')
+        for name, arch in packages:
+            f.write('=Pkg: {name} 1.0 1.1 {arch}\n+Prv:\n{name} = 1.0-1.1\n-Prv:\n'.format(name=name, arch=arch))
+
+
+class TestPkgListGen(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        for arch in ARCHITECTURES:
+            repo_write('repo-openSUSE:Factory-standard-{}-state.solv'.format(arch), arch)
+
+        self.patches = [
+            mock.patch.object(tool, 'PkglistComments'),
+            mock.patch.object(tool, 'repository_arch_state', lambda apiurl, project, repo, arch: 'state'),
+            mock.patch.object(osc.conf, 'config', {'apiurl': 'http://localhost', 'debug': False}),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def pkglist(self):
+        pkglist = PkgListGen()
+        pkglist.repos = [('openSUSE:Factory', 'standard')]
+        pkglist.use_newest_version = False
+        pkglist.all_architectures = ARCHITECTURES
+        pkglist.filter_architectures(ARCHITECTURES)
+        for name, packages in GROUPS.items():
+            Group(name, pkglist).parse_yml(packages)
+        return pkglist
+
+    def groups(self, pkglist):
+        return {name: [ET.tostring(group.toxml(arch)) for arch in ['*'] + ARCHITECTURES]
+                for name, group in pkglist.groups.items()}
+
+    def test_prepare_pool(self):
+        pkglist = self.pkglist()
+        with mock.patch.object(pkglist, '_prepare_pool', wraps=pkglist._prepare_pool) as prepare_pool:
+            pool = pkglist.prepare_pool('x86_64', False)
+            self.assertIs(pkglist.prepare_pool('x86_64', False), pool)
+            self.assertIsNot(pkglist.prepare_pool('x86_64', True), pool)
+            self.assertIsNot(pkglist.prepare_pool('aarch64', False), pool)
+            self.assertEqual(prepare_pool.call_count, 3)
+
+            pkglist.reset_pools()
+            self.assertIsNot(pkglist.prepare_pool('x86_64', False), pool)
+            self.assertEqual(prepare_pool.call_count, 4)
+
+        self.assertEqual(sorted(s.name for s in pool.solvables_iter()), sorted(PACKAGES))
+
+    def test_solve_modules(self):
+        sequential = self.pkglist()
+        sequential.solve_modules(MODULES)
+        groups = self.groups(sequential)
+
+        minimal = sequential.groups['sle_minimal']
+        self.assertEqual(sorted(minimal.solved_packages['*']), ['bash', 'bash-doc', 'coreutils', 'libacl', 'libreadline'])
+        base = sequential.groups['sle_base']
+        self.assertEqual(sorted(base.solved_packages['*']), ['bash', 'coreutils', 'kernel-default', 'libacl', 'libreadline'])
+        self.assertEqual(sorted(base.solved_packages['x86_64']), ['firmware'])
+        self.assertEqual(base.not_found, {'firmware': {'aarch64'}, 'missing': set(ARCHITECTURES)})
+        editors = sequential.groups['sle_editors']
+        self.assertEqual(sorted(editors.solved_packages['*']), ['vim', 'vim-data'])
+
+        parallel = self.pkglist()
+        parallel.solve_modules(MODULES, jobs=2)
+        self.assertEqual(self.groups(parallel), groups)
+
+    def test_create_weakremovers(self):
+        # Current packages are only considered if installable on the host,
+        # which holds for these on x86_64.
+        architectures = ['i586', 'x86_64']
+        # Obsoletes of packages not installable on the host do not count.
+        repo_write('repo-openSUSE:Factory-standard-i586-state.solv', 'i586', {'oldlib-ng': ('s390x', 'oldlib')})
+        with open('config.yml', 'w') as f:
+            f.write('- release-15.1:\n- release-15.2:\n')
+        packages_write('release-15.1.packages.xz', [
+            ('bash', 'i686'), ('bash', 'x86_64'), ('bash-doc', 'noarch'),
+            ('firmware', 'i686'), ('firmware', 'x86_64'),
+            ('vi', 'i686'), ('vi', 'x86_64'),
+            ('oldlib', 'x86_64'), ('oldlib', 'ppc64le'),
+            ('gone', 'noarch'),
+        ])
+        packages_write('release-15.2_sp.packages.xz', [('gone', 'noarch'), ('legacy', 'noarch')])
+
+        pkglist = self.pkglist()
+        pkglist.all_architectures = architectures
+        output = io.StringIO()
+        pkglist.create_weakremovers(None, None, '.', output)
+        self.assertEqual(output.getvalue().splitlines(), [
+            '# release-15.1',
+            'Provides: weakremover(gone)',
+            '%ifarch i586',
+            'Provides: weakremover(firmware)',
+            '%endif',
+            '%ifarch x86_64',
+            'Provides: weakremover(oldlib)',
+            '%endif',
+            '# release-15.2',
+            'Provides: weakremover(legacy)',
+        ])
+
+    def test_rpms2solv(self):
+        headers = os.path.join(self.tmpdir.name, 'headers')
+        fragments = os.path.join(self.tmpdir.name, 'fragments')
+        solv_file = os.path.join(self.tmpdir.name, 'repo.solv')
+        os.makedirs(headers)
+        converted = []
+
+        def add_rpm(repo, path, flags):
+            # stand-in for reading the header named hdrmd5-name.rpm
+            converted.append(os.path.basename(path))
+            s = repo.add_solvable()
+            s.name = os.path.basename(path)[:-4].split('-', 1)[1]
+            s.evr = '1.0-1.1'
+            s.arch = 'x86_64'
+            return True
+
+        def header(name):
+            return name[0] * 32 + '-' + name + '.rpm'
+
+        def rpms2solv():
+            del converted[:]
+            with mock.patch.object(solv.Repo, 'add_rpm', add_rpm, create=True):
+                self.pkglist().rpms2solv(headers, fragments, solv_file)
+
+            pool = solv.Pool()
+            repo = pool.add_repo('repo')
+            self.assertTrue(repo.add_solv(solv_file))
+            return sorted(s.name for s in repo.solvables_iter())
+
+        for name in ('bash', 'vim'):
+            open(os.path.join(headers, header(name)), 'w').close()
+        self.assertEqual(rpms2solv(), ['bash', 'vim'])
+        self.assertEqual(sorted(converted), [header('bash'), header('vim')])
+
+        # Only new headers are converted and fragments of removed ones dropped.
+        os.unlink(os.path.join(headers, header('vim')))
+        open(os.path.join(headers, header('coreutils')), 'w').close()
+        self.assertEqual(rpms2solv(), ['bash', 'coreutils'])
+        self.assertEqual(converted, [header('coreutils')])
+        self.assertEqual(sorted(os.listdir(fragments)), [header('bash') + '.solv', header('coreutils') + '.solv'])
+
+        self.assertEqual(rpms2solv(), ['bash', 'coreutils'])
+        self.assertEqual(converted, [])
+
+    def test_update_repos(self):
+        script_path = os.path.join(self.tmpdir.name, 'pkglistgen')
+        os.makedirs(script_path)
+        with open(os.path.join(self.tmpdir.name, 'bs_mirrorfull'), 'w') as f:
+            f.write(MIRROR)
+        os.chmod(f.name, 0o755)
+        for patch in (mock.patch.object(tool, 'CACHEDIR', os.path.join(self.tmpdir.name, 'cache')),
+                      mock.patch.object(tool, 'FRAGMENTDIR', os.path.join(self.tmpdir.name, 'fragments')),
+                      mock.patch.object(tool, 'SCRIPT_PATH', script_path)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        def update_repos(architectures, jobs):
+            with self.assertLogs(tool.__name__, logging.INFO) as logs:
+                self.pkglist().update_repos(architectures, jobs)
+            return [record.getMessage() for record in logs.records]
+
+        # The output of concurrent updates is streamed with the repository prefixed.
+        messages = update_repos(['i586', 'x86_64'], 2)
+        for arch in ('i586', 'x86_64'):
+            target = 'openSUSE:Factory/standard/' + arch
+            self.assertIn('{}: fetching http://localhost/public/build/{}'.format(target, target), messages)
+            self.assertIn('{}: done'.format(target), messages)
+            self.assertTrue([message for message in messages if message.startswith(target + ' updated in ')])
+            self.assertTrue(os.path.exists('repo-openSUSE:Factory-standard-{}-state.solv'.format(arch)))
+
+        messages = update_repos(['i586', 'x86_64'], 2)
+        self.assertEqual(len([message for message in messages if ' unchanged in ' in message]), 2)
+
+        with self.assertLogs(tool.__name__, logging.INFO) as logs, \
+                self.assertRaisesRegex(Exception, 'Mirroring repository failed'):
+            self.pkglist().update_repos(ARCHITECTURES, 2)
+        self.assertIn('INFO:{}:openSUSE:Factory/standard/aarch64: done'.format(tool.__name__), logs.output)
@@ -0,0 +1,138 @@
+import os
+import random
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from osclib import repochecks
+from osclib.repochecks import followup_replace
+from osclib.repochecks import susetags_write
+
+SNIPPET = '=Pkg: {name} 1.0 1.1 x86_64\n=Src: {source} 1.0 1.1 src\n+Flx:\n-Flx:\n'
+
+
+class TestSusetags(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.created = []
+        self._snippets_create = repochecks._snippets_create
+
+        def snippets_create(packages):
+            # stand-in for CreatePackageDescr
+            for package in packages:
+                self.created.append(os.path.basename(package))
+                name = repochecks._package_name(os.path.basename(package))
+                cachedir = os.path.join(os.path.dirname(package), '.cache')
+                os.makedirs(cachedir, exist_ok=True)
+                with open(os.path.join(cachedir, '2-' + os.path.basename(package)), 'w') as f:
+                    f.write(SNIPPET.format(name=name, source=name.split('-')[0]))
+
+        repochecks._snippets_create = snippets_create
+
+    def tearDown(self):
+        repochecks._snippets_create = self._snippets_create
+        self.tmpdir.cleanup()
+
+    def directory(self, name, packages):
+        directory = os.path.join(self.tmpdir.name, name)
+        os.makedirs(directory, exist_ok=True)
+        for package in packages:
+            open(os.path.join(directory, '{}-{}.rpm'.format(package[0] * 32, package)), 'w').close()
+        return directory
+
+    def susetags_write(self, directories):
+        path = os.path.join(self.tmpdir.name, 'packages')
+        catalog = susetags_write(path, directories)
+        with open(path) as f:
+            return f.read(), catalog
+
+    def test_write(self):
+        staging = self.directory('staging', ['apache', 'bash-devel'])
+        target = self.directory('target', ['apache', 'bash', 'curl'])
+
+        packages, catalog = self.susetags_write([staging, target])
+        snippets = [SNIPPET.format(name=name, source=name.split('-')[0])
+                    for name in ['apache', 'bash-devel', 'bash', 'curl']]
+        self.assertEqual(packages, '=Ver: 2.0\n' + ''.join(snippets))
+        self.assertEqual(catalog, {
+            staging: {'apache': 'apache', 'bash-devel': 'bash'},
+            target: {'bash': 'bash', 'curl': 'curl'},
+        })
+        self.assertEqual(len(self.created), 5)
+
+        # only new headers are described
+        self.created = []
+        os.unlink(os.path.join(staging, 'a' * 32 + '-apache.rpm'))
+        self.directory('staging', ['dash'])
+        packages, catalog = self.susetags_write([staging, target])
+        self.assertEqual(self.created, ['d' * 32 + '-dash.rpm'])
+        self.assertEqual(catalog[staging], {'bash-devel': 'bash', 'dash': 'dash'})
+        self.assertEqual(catalog[target], {'apache': 'apache', 'bash': 'bash', 'curl': 'curl'})
+
+        # the index is used as is when unchanged
+        self.created = []
+        self.assertEqual(self.susetags_write([staging, target]), (packages, catalog))
+        self.assertEqual(self.created, [])
+
+    def test_write_concurrent(self):
+        names = ['package{:03}'.format(i) for i in range(200)]
+        directory = self.directory('target', names[:1])
+
+        def write(i):
+            path = os.path.join(self.tmpdir.name, 'packages{}'.format(i))
+            catalog = susetags_write(path, [directory])
+            with open(path) as f:
+                return f.read(), catalog
+
+        # Other stagings extend the index while packages files are written.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = []
+            for i, name in enumerate(names[1:]):
+                self.directory('target', [name])
+                futures.append(executor.submit(write, i))
+
+        for future in futures:
+            packages, catalog = future.result()
+            snippets = [SNIPPET.format(name=name, source=name) for name in sorted(catalog[directory])]
+            self.assertEqual(packages, '=Ver: 2.0\n' + ''.join(snippets))
+
+
+def followup_replace_legacy(outputs):
+    outputs = dict(outputs)
+    for package1 in outputs:
+        output = outputs[package1]
+        for package2 in outputs:
+            if package1 == package2:
+                continue
+            output = output.replace(outputs[package2], 'FOLLOWUP(' + package2 + ')')
+        outputs[package1] = output
+    return outputs
+
+
+class TestFollowup(unittest.TestCase):
+    def test_chain(self):
+        libfoo = 'nothing provides libfoo.so.1()(64bit) needed by libfoo-tools-1.0.x86_64'
+        outputs = {
+            'bar': 'package bar-1.0.x86_64 requires libfoo-tools, but none of the providers can be installed\n' + libfoo,
+            'libfoo-tools': libfoo,
+            'baz': 'nothing provides baz-data needed by baz-2.0.x86_64',
+        }
+        self.assertEqual(followup_replace(outputs), {
+            'bar': 'package bar-1.0.x86_64 requires libfoo-tools, but none of the providers can be installed\n'
+                   'FOLLOWUP(libfoo-tools)',
+            'libfoo-tools': libfoo,
+            'baz': outputs['baz'],
+        })
+
+    def test_legacy(self):
+        # outputs built from few short lines to provoke overlapping and nested matches
+        rng = random.Random(42)
+        lines = ['nothing provides libfoo needed by foo', 'nothing provides libfoo', 'foo requires bar',
+                 'FOLLOWUP(a)', 'x', '']
+        for _ in range(200):
+            outputs = dict()
+            for name in 'abcdefgh':
+                outputs[name] = '\n'.join(rng.choice(lines) for _ in range(rng.randint(0, 4)))
+            for name in rng.sample(list(outputs), 3):
+                outputs[name] += '\n' + outputs[rng.choice(list(outputs))]
+            self.assertEqual(followup_replace(outputs), followup_replace_legacy(outputs))
@@ -0,0 +1,79 @@
+from importlib.machinery import SourceFileLoader
+import os
+import time
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+
+from lxml import etree as ET
+
+staging_installcheck = SourceFileLoader('staging_installcheck', os.path.join(
+    os.path.dirname(__file__), '..', 'staging-installcheck.py')).load_module()
+CheckResult = staging_installcheck.CheckResult
+
+PROJECT = 'openSUSE:Factory:Staging:A'
+ARCHITECTURES = ['aarch64', 'i586', 'ppc64le', 'x86_64']
+
+
+def check_arch(project, repository, repository_pairs, arch, to_ignore):
+    if arch == 'broken':
+        raise Exception('mirroring failed')
+    # finish in reverse order of architectures when run in parallel
+    time.sleep(0.05 * (len(ARCHITECTURES) - ARCHITECTURES.index(arch)))
+    failed = []
+    if arch == 'ppc64le':
+        failed.append(CheckResult(False, 'cycle check failed on ' + arch))
+    if arch in ('aarch64', 'ppc64le'):
+        failed.append(CheckResult(False, 'install check failed on ' + arch))
+    return failed, 1.0
+
+
+class TestInstallCheckerStaging(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(staging_installcheck.osc.core, 'http_GET', side_effect=HTTPError(None, 404, None, None, None)),
+            mock.patch.object(staging_installcheck, 'repository_path_expand', return_value=[(PROJECT, 'standard')]),
+            mock.patch.object(staging_installcheck, 'duplicated_binaries_in_repo', return_value={}),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def checker(self, architectures):
+        api = mock.Mock(apiurl='http://localhost', cmain_repo='standard')
+        api.project_status.return_value = ET.fromstring('<status><staged_requests/></status>')
+        checker = staging_installcheck.InstallChecker(api, {})
+        checker.target_archs = lambda project, repository: architectures
+        checker.buildid = lambda project, repository, arch: '1'
+        checker.report_url = lambda project, repository, arch, buildid: 'http://localhost/report'
+        checker.packages_to_ignore = lambda project: set()
+        checker.gocd_url = lambda: 'http://gocd'
+        checker.check_arch = check_arch
+        checker.reported = []
+        checker.report_state = lambda state, report_url, *args: checker.reported.append((state, report_url))
+        checker.upload_failure = lambda project, comment: '\n'.join(comment)
+        return checker
+
+    def staging(self, architectures, jobs):
+        checker = self.checker(architectures)
+        return checker.staging(PROJECT, jobs=jobs), checker.reported
+
+    def test_jobs(self):
+        result, reported = self.staging(ARCHITECTURES, 1)
+        self.assertFalse(result)
+        # failures are reported in order of architectures
+        self.assertEqual(reported, [('failure', 'Generated from http://gocd\n\ninstall check failed on aarch64\n'
+                                                'cycle check failed on ppc64le\ninstall check failed on ppc64le')])
+        self.assertEqual(self.staging(ARCHITECTURES, 4), (result, reported))
+
+        passed = ['i586', 'x86_64']
+        self.assertEqual(self.staging(passed, 1), (True, [('success', 'http://gocd')]))
+        self.assertEqual(self.staging(passed, 4), (True, [('success', 'http://gocd')]))
+
+    def test_error(self):
+        for jobs in (1, 4):
+            with self.assertRaisesRegex(Exception, 'mirroring failed'):
+                self.staging(ARCHITECTURES + ['broken'], jobs)
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import io
+import unittest
+from unittest import mock
+
+import requests
+
+from pkglistgen import update_repo_handler
+from pkglistgen.update_repo_handler import download_gunzip
+
+URL = 'http://download.example.com/repodata/primary.xml.gz'
+
+MEMBERS = [b'<metadata>\n' + b'<package/>\n' * 50, b'<package name="second"/>\n' * 30 + b'</metadata>\n']
+
+
+class Response(object):
+    def __init__(self, content, chunks, status_code=requests.codes.ok):
+        self.content = content
+        self.chunks = chunks
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        offset = 0
+        for size in self.chunks:
+            yield self.content[offset:offset + size]
+            offset += size
+        if offset < len(self.content):
+            yield self.content[offset:]
+
+
+class TestDownloadGunzip(unittest.TestCase):
+    def setUp(self):
+        self.members = [gzip.compress(member) for member in MEMBERS]
+        self.content = b''.join(self.members)
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def download(self, chunks, content=None, sha256=None):
+        response = Response(self.content if content is None else content, chunks)
+        f = io.BytesIO()
+        with mock.patch.object(update_repo_handler.requests, 'get', return_value=response) as get:
+            download_gunzip(URL, f, sha256)
+        get.assert_called_once_with(URL, stream=True)
+        return f.getvalue()
+
+    def test_members(self):
+        first = len(self.members[0])
+        for chunks in (
+                [len(self.content)],
+                # boundary exactly at the end of the first member
+                [first],
+                [first - 1, 1],
+                # boundaries within the header and trailer of members
+                [5, first - 10, 10, 3],
+                [1] * len(self.content)):
+            self.assertEqual(self.download(chunks, sha256=self.sha256), b''.join(MEMBERS), chunks)
+
+    def test_truncated(self):
+        for content in (self.content[:-4], self.content[:len(self.members[0]) + 10]):
+            with self.assertRaisesRegex(Exception, 'is truncated'):
+                self.download([7], content)
+
+    def test_checksum(self):
+        with self.assertRaisesRegex(Exception, 'checksums do not match'):
+            self.download([100], sha256='0' * 64)
+
+    def test_missing(self):
+        response = Response(b'', [], requests.codes.not_found)
+        with mock.patch.object(update_repo_handler.requests, 'get', return_value=response):
+            with self.assertRaisesRegex(Exception, 'does not exist'):
+                download_gunzip(URL, io.BytesIO())